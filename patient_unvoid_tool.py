@@ -25,14 +25,77 @@ Python: 3.6+
 """
 
 import tkinter as tk
-from tkinter import messagebox, scrolledtext, ttk
-import pymysql as mysql_connector
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 from pymysql.err import Error
-import configparser
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from datetime import datetime
 from pathlib import Path
+import queue
+import threading
 import traceback
 
+from unvoid_engine import (
+    REQUIRED_VOID_REASON,
+    STATUS_ELIGIBLE,
+    STATUS_MISSING_TIMESTAMP,
+    STATUS_NOT_VOIDED,
+    STATUS_WRONG_REASON,
+    ConfigError,
+    OperationCancelled,
+    UnvoidEngine,
+    load_config,
+    open_session_log,
+    read_identifiers,
+    window_label,
+)
+from unvoid_discovery import PlanDiscovery
+
+
+class BufferedLog:
+    """Activity Log buffer flushed to a Text widget on a timer
+
+    write() may be called from any thread; it only appends to a bounded
+    deque. flush() runs on the Tk thread and inserts everything pending in
+    a single call. The widget keeps at most ``max_lines`` lines, dropping the
+    oldest like a ring buffer. Every message also goes to the on-disk
+    session logger.
+    """
+
+    def __init__(self, max_lines=2000, file_logger=None):
+        self.max_lines = max_lines
+        self.file_logger = file_logger
+        self.pending = deque(maxlen=max_lines)
+        self.widget = None
+
+    def attach(self, widget):
+        self.widget = widget
+
+    def write(self, message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.pending.append(f"[{timestamp}] {message}\n")
+        if self.file_logger:
+            self.file_logger.info(message)
+
+    def flush(self):
+        if self.widget is None or not self.pending:
+            return
+
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+
+        self.widget.insert(tk.END, "".join(lines))
+
+        # Trim the oldest lines once the widget holds more than max_lines
+        # (the text always ends with a newline, so the last line is empty)
+        line_count = int(self.widget.index("end-1c").split(".")[0]) - 1
+        if line_count > self.max_lines:
+            self.widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+
+        self.widget.see(tk.END)
+
 
 class UnvoidPatientApp:
     """Patient Unvoid Application with Security"""
@@ -48,8 +111,16 @@ class UnvoidPatientApp:
         self.admin_password = "pibtib"
 
         # Database
-        self.connection = None
         self.config = None
+        self.engine = None
+
+        # Background database worker. A single thread, so the connection is
+        # never shared; results and log lines come back through ui_queue.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.ui_queue = queue.Queue()
+        self.log_buffer = BufferedLog()
+        self.busy = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Patient data
         self.current_patient = None
@@ -158,24 +229,21 @@ class UnvoidPatientApp:
     def load_config(self):
         """Load database configuration"""
 
-        config_file = Path("unvoid_config.ini")
-
-        if not config_file.exists():
-            messagebox.showerror(
-                "Configuration Error",
-                f"Configuration file not found: {config_file}\n\n"
-                "Please create unvoid_config.ini with database settings."
-            )
-            self.root.quit()
-            return
-
         try:
-            self.config = configparser.ConfigParser()
-            self.config.read(config_file)
+            self.config = load_config()
+            self.log_buffer = BufferedLog(
+                max_lines=self.config.getint('logging', 'widget_max_lines', fallback=2000),
+                file_logger=open_session_log(self.config)
+            )
+            self.engine = UnvoidEngine(self.config, log=self.log, progress=self.report_progress)
 
             # Test database connection
             self.test_connection()
 
+        except ConfigError as e:
+            messagebox.showerror("Configuration Error", str(e))
+            self.root.quit()
+
         except Exception as e:
             messagebox.showerror(
                 "Configuration Error",
@@ -187,18 +255,16 @@ class UnvoidPatientApp:
         """Test database connection"""
 
         try:
-            conn = mysql_connector.connect(
-                host=self.config['database']['host'],
-                user=self.config['database']['user'],
-                password=self.config['database']['password'],
-                database=self.config['database']['database'],
-                port=int(self.config['database'].get('port', 3306))
-            )
+            self.engine.test_connection()
+
+            # Create or upgrade the audit tables once, before any unvoid
+            self.engine.ensure_schema()
+
+            if self.config['settings'].getboolean('discover_plan', fallback=False):
+                PlanDiscovery(self.engine).apply()
 
-            if conn.open:
-                conn.close()
-                # Connection successful, show main screen
-                self.show_main_screen()
+            # Connection successful, show main screen
+            self.show_main_screen()
 
         except Error as e:
             messagebox.showerror(
@@ -269,7 +335,7 @@ class UnvoidPatientApp:
         self.identifier_entry.pack(side="left", padx=(0, 10))
         self.identifier_entry.focus()
 
-        tk.Button(
+        self.search_button = tk.Button(
             entry_frame,
             text="SEARCH PATIENT",
             command=self.search_patient,
@@ -279,7 +345,34 @@ class UnvoidPatientApp:
             padx=20,
             pady=8,
             cursor="hand2"
-        ).pack(side="left")
+        )
+        self.search_button.pack(side="left")
+
+        self.bulk_button = tk.Button(
+            entry_frame,
+            text="BULK FROM FILE...",
+            command=self.bulk_unvoid_from_file,
+            bg="#FF9800",
+            fg="white",
+            font=("Arial", 11, "bold"),
+            padx=15,
+            pady=8,
+            cursor="hand2"
+        )
+        self.bulk_button.pack(side="left", padx=(10, 0))
+
+        self.events_button = tk.Button(
+            entry_frame,
+            text="VOID EVENTS...",
+            command=self.discover_void_events,
+            bg="#607D8B",
+            fg="white",
+            font=("Arial", 11, "bold"),
+            padx=15,
+            pady=8,
+            cursor="hand2"
+        )
+        self.events_button.pack(side="left", padx=(10, 0))
 
         # Bind Enter key
         self.identifier_entry.bind("<Return>", lambda e: self.search_patient())
@@ -337,6 +430,38 @@ class UnvoidPatientApp:
         )
         self.unvoid_button.pack()
 
+        # Progress of the running database operation
+        progress_frame = tk.Frame(action_frame)
+        progress_frame.pack(fill="x", pady=(10, 0))
+
+        self.progress_bar = ttk.Progressbar(
+            progress_frame,
+            mode="determinate",
+            length=520
+        )
+        self.progress_bar.pack(side="left", padx=(0, 10))
+
+        self.cancel_button = tk.Button(
+            progress_frame,
+            text="CANCEL",
+            command=self.cancel_operation,
+            bg="#cccccc",
+            fg="#666666",
+            font=("Arial", 9, "bold"),
+            padx=10,
+            state="disabled",
+            disabledforeground="#666666"
+        )
+        self.cancel_button.pack(side="left")
+
+        self.progress_label = tk.Label(
+            action_frame,
+            text="",
+            font=("Arial", 9),
+            fg="#666"
+        )
+        self.progress_label.pack(anchor="w")
+
         # Log section
         log_frame = tk.LabelFrame(
             content_frame,
@@ -356,162 +481,220 @@ class UnvoidPatientApp:
             insertbackground="white"
         )
         self.log_text.pack(fill="both", expand=True)
+        self.log_buffer.attach(self.log_text)
 
         # Initial log
         self.log("System ready. Administrator authenticated.")
         self.log(f"Database: {self.config['database']['database']} @ {self.config['database']['host']}")
         self.log("-" * 70)
 
+        # Start applying worker output to the widgets
+        self.root.after(100, self.poll_queue)
+
     def log(self, message):
-        """Add message to log"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """Add message to log (safe to call from the worker thread)"""
+        self.log_buffer.write(message)
+
+    def report_progress(self, done, total, label):
+        """Engine progress callback (runs on the worker thread)"""
+        self.ui_queue.put(("progress", done, total, label))
+
+    def poll_queue(self):
+        """Flush buffered log lines and apply progress and results from the worker"""
 
-    def get_connection(self):
-        """Get database connection"""
         try:
-            if self.connection and self.connection.open:
-                return self.connection
-
-            self.connection = mysql_connector.connect(
-                host=self.config['database']['host'],
-                user=self.config['database']['user'],
-                password=self.config['database']['password'],
-                database=self.config['database']['database'],
-                port=int(self.config['database'].get('port', 3306))
+            while True:
+                item = self.ui_queue.get_nowait()
+                kind = item[0]
+
+                if kind == "progress":
+                    done, total, label = item[1:]
+                    self.progress_bar.config(maximum=max(total, 1), value=done)
+                    self.progress_label.config(text=f"Step {done}/{total}: {label}")
+
+                elif kind == "done":
+                    # Show the full log before any result dialog appears
+                    self.log_buffer.flush()
+                    self.finish_background(*item[1:])
+
+        except queue.Empty:
+            pass
+
+        finally:
+            self.log_buffer.flush()
+            self.root.after(100, self.poll_queue)
+
+    def run_in_background(self, work, on_success, on_error):
+        """Run database work on the worker thread
+
+        ``on_success(result)`` or ``on_error(error)`` is called back on the
+        Tk thread once the work has finished.
+        """
+
+        self.set_busy(True)
+        future = self.executor.submit(work)
+        future.add_done_callback(
+            lambda f: self.ui_queue.put(("done", f, on_success, on_error))
+        )
+
+    def finish_background(self, future, on_success, on_error):
+        """Dispatch the outcome of background work (Tk thread)"""
+
+        self.set_busy(False)
+
+        try:
+            result = future.result()
+
+        except OperationCancelled:
+            self.progress_label.config(text="Cancelled")
+            messagebox.showinfo(
+                "Operation Cancelled",
+                "The operation was cancelled and its open transaction\n"
+                "was rolled back.\n\n"
+                "See the Activity Log for details."
             )
-            return self.connection
+            return
 
         except Error as e:
-            messagebox.showerror("Database Error", f"Connection failed:\n\n{str(e)}")
-            return None
+            self.progress_label.config(text="Failed")
+            on_error(e)
+            return
+
+        except Exception as e:
+            self.progress_label.config(text="Failed")
+            self.log(f"ERROR: {str(e)}")
+            self.log("".join(traceback.format_exception(type(e), e, e.__traceback__)).rstrip())
+            messagebox.showerror("Unexpected Error", f"Operation failed:\n\n{str(e)}")
+            return
+
+        self.progress_label.config(text="Done")
+        on_success(result)
+
+    def set_busy(self, busy):
+        """Lock the form while the worker runs; enable CANCEL"""
+
+        self.busy = busy
+        state = "disabled" if busy else "normal"
+
+        self.search_button.config(state=state)
+        self.bulk_button.config(state=state)
+        self.events_button.config(state=state)
+        self.identifier_entry.config(state=state)
+
+        if busy:
+            self.unvoid_button.config(state="disabled", bg="#cccccc", fg="#666666")
+            self.cancel_button.config(state="normal", bg="#f44336", fg="white")
+            self.progress_bar.config(value=0)
+            self.progress_label.config(text="Working...")
+        else:
+            self.cancel_button.config(state="disabled", bg="#cccccc", fg="#666666")
+            if self.current_patient:
+                self.unvoid_button.config(state="normal", bg="#f44336", fg="white")
+
+    def cancel_operation(self):
+        """Cancel the running operation; its transaction is rolled back"""
+
+        if not self.busy:
+            return
+
+        self.cancel_button.config(state="disabled")
+        self.progress_label.config(text="Cancelling...")
+
+        def interrupt():
+            try:
+                self.engine.cancel()
+            except Error as e:
+                self.log(f"WARNING: Could not interrupt running statement - {str(e)}")
+
+        # KILL QUERY opens its own connection; keep that off the Tk thread
+        threading.Thread(target=interrupt, daemon=True).start()
+
+    def on_close(self):
+        """Refuse to close mid-transaction"""
+
+        if self.busy:
+            messagebox.showwarning(
+                "Operation In Progress",
+                "A database operation is still running.\n\n"
+                "Press CANCEL and wait for the rollback to finish\n"
+                "before closing the tool."
+            )
+            return
+
+        self.executor.shutdown(wait=False)
+        if self.engine:
+            self.engine.close()
+        self.root.destroy()
 
     def search_patient(self):
         """Search for patient by identifier"""
 
+        if self.busy:
+            return
+
         identifier = self.identifier_entry.get().strip()
 
         if not identifier:
             messagebox.showwarning("Input Required", "Please enter an ART identifier.")
             return
 
-        self.log(f"Searching for patient: {identifier}")
+        self.current_patient = None
+        self.unvoid_button.config(state="disabled", bg="#cccccc", fg="#666666")
 
-        conn = self.get_connection()
-        if not conn:
-            return
+        def work():
+            status, result = self.engine.lookup_patient(identifier)
 
-        cursor = None
-        try:
-            cursor = conn.cursor(mysql_connector.cursors.DictCursor)
-
-            # Find patient by identifier (voided records only)
-            # CRITICAL: Get void_reason and date_voided from patient table for safety check
-            # NOTE: person_name may be voided too, so we don't filter by voided = 0
-            query = """
-                SELECT 
-                    pi.patient_id,
-                    pi.identifier,
-                    CONCAT(pn.given_name, ' ', IFNULL(pn.family_name, '')) AS patient_name,
-                    p.gender,
-                    p.birthdate,
-                    pi.voided AS identifier_voided,
-                    pi.date_voided AS identifier_date_voided,
-                    pat.voided AS patient_voided,
-                    pat.date_voided AS patient_date_voided,
-                    pat.void_reason AS patient_void_reason
-                FROM patient_identifier pi
-                JOIN person p ON pi.patient_id = p.person_id
-                JOIN patient pat ON pi.patient_id = pat.patient_id
-                LEFT JOIN person_name pn ON p.person_id = pn.person_id
-                WHERE pi.identifier = %s AND pi.voided = 1
-                ORDER BY pn.preferred DESC, pn.date_created DESC
-                LIMIT 1
-            """
-
-            cursor.execute(query, (identifier,))
-            result = cursor.fetchone()
-            cursor.fetchall()  # Consume any remaining results
-
-            if not result:
-                # Close current cursor and create new one for second query
-                cursor.close()
-                cursor = conn.cursor(mysql_connector.cursors.DictCursor)
-
-                # Check if exists but not voided
-                cursor.execute(
-                    "SELECT patient_id FROM patient_identifier WHERE identifier = %s AND voided = 0",
-                    (identifier,)
-                )
-                exists = cursor.fetchone()
-                cursor.fetchall()  # Consume any remaining results
-
-                if exists:
-                    self.log(f"ERROR: Patient {identifier} is NOT voided. No action needed.")
-                    messagebox.showinfo(
-                        "Patient Not Voided",
-                        f"Patient {identifier} is already active (not voided).\n\n"
-                        "No unvoid action is required."
-                    )
-                else:
-                    self.log(f"ERROR: Patient {identifier} not found in database.")
-                    messagebox.showerror(
-                        "Patient Not Found",
-                        f"No patient found with identifier: {identifier}\n\n"
-                        "Please check the identifier and try again."
-                    )
-
-                self.current_patient = None
-                self.unvoid_button.config(state="disabled", bg="#cccccc", fg="#666666")
-                return
+            # Dry-run row counts so monster footprints show up before any locks
+            if status == STATUS_ELIGIBLE:
+                self.engine.preview_counts(result)
 
-            # CRITICAL SAFETY CHECK: Verify void_reason
-            void_reason = result.get('patient_void_reason', '')
-            required_reason = 'Bulk void via ART/DATIM mapping'
-
-            if void_reason != required_reason:
-                self.log(f"ERROR: Invalid void reason: '{void_reason}'")
-                self.log(f"       Required: '{required_reason}'")
-                self.log(f"       Operation BLOCKED for safety")
-                messagebox.showerror(
-                    "Cannot Unvoid - Wrong Void Reason",
-                    f"SAFETY BLOCK: This tool can ONLY unvoid patients with:\n\n"
-                    f"Void Reason: '{required_reason}'\n\n"
-                    f"This patient has:\n"
-                    f"Void Reason: '{void_reason or 'NULL'}'\n\n"
-                    f"Operation BLOCKED for safety.\n\n"
-                    f"If you need to unvoid this patient, please contact\n"
-                    f"your database administrator."
-                )
-                self.current_patient = None
-                self.unvoid_button.config(state="disabled", bg="#cccccc", fg="#666666")
-                return
+            return status, result
 
-            # Verify we have a date_voided timestamp
-            if not result.get('patient_date_voided'):
-                self.log(f"ERROR: No date_voided timestamp found")
-                self.log(f"       Operation BLOCKED for safety")
-                messagebox.showerror(
-                    "Cannot Unvoid - Missing Timestamp",
-                    "Patient record does not have a date_voided timestamp.\n\n"
-                    "Operation BLOCKED for safety.\n\n"
-                    "Contact your database administrator."
-                )
-                self.current_patient = None
-                self.unvoid_button.config(state="disabled", bg="#cccccc", fg="#666666")
-                return
+        self.run_in_background(
+            work,
+            lambda outcome: self.show_search_result(identifier, *outcome),
+            lambda e: messagebox.showerror("Database Error", f"Query failed:\n\n{str(e)}")
+        )
 
-            # Calculate time range (±120 seconds)
-            void_timestamp = result['patient_date_voided']
-            time_start = void_timestamp - timedelta(seconds=120)
-            time_end = void_timestamp + timedelta(seconds=120)
+    def show_search_result(self, identifier, status, result):
+        """Show the lookup outcome (Tk thread)"""
 
-            # Store calculated values
-            result['time_start'] = time_start
-            result['time_end'] = time_end
+        if status == STATUS_NOT_VOIDED:
+            messagebox.showinfo(
+                "Patient Not Voided",
+                f"Patient {identifier} is already active (not voided).\n\n"
+                "No unvoid action is required."
+            )
 
+        elif status == STATUS_WRONG_REASON:
+            void_reason = result.get('patient_void_reason')
+            messagebox.showerror(
+                "Cannot Unvoid - Wrong Void Reason",
+                f"SAFETY BLOCK: This tool can ONLY unvoid patients with:\n\n"
+                f"Void Reason: '{REQUIRED_VOID_REASON}'\n\n"
+                f"This patient has:\n"
+                f"Void Reason: '{void_reason or 'NULL'}'\n\n"
+                f"Operation BLOCKED for safety.\n\n"
+                f"If you need to unvoid this patient, please contact\n"
+                f"your database administrator."
+            )
+
+        elif status == STATUS_MISSING_TIMESTAMP:
+            messagebox.showerror(
+                "Cannot Unvoid - Missing Timestamp",
+                "Patient record does not have a date_voided timestamp.\n\n"
+                "Operation BLOCKED for safety.\n\n"
+                "Contact your database administrator."
+            )
+
+        elif result is None:
+            messagebox.showerror(
+                "Patient Not Found",
+                f"No patient found with identifier: {identifier}\n\n"
+                "Please check the identifier and try again."
+            )
+
+        else:
             # Store patient data
             self.current_patient = result
 
@@ -521,19 +704,6 @@ class UnvoidPatientApp:
             # Enable unvoid button with proper color
             self.unvoid_button.config(state="normal", bg="#f44336", fg="white")
 
-            self.log(f"SUCCESS: Found patient - {result['patient_name']} (ID: {result['patient_id']})")
-            self.log(f"         Void reason: '{void_reason}' - VALID")
-            self.log(f"         Void timestamp: {void_timestamp}")
-            self.log(f"         Time range: {time_start} to {time_end} (±120 sec)")
-
-        except Error as e:
-            self.log(f"ERROR: Database query failed - {str(e)}")
-            messagebox.showerror("Database Error", f"Query failed:\n\n{str(e)}")
-
-        finally:
-            if cursor:
-                cursor.close()
-
     def display_patient_details(self, patient):
         """Display patient information with timestamp and time range"""
 
@@ -557,29 +727,43 @@ Void Reason:   {patient['patient_void_reason']}
 Void Time:     {void_timestamp}
 
 TIMESTAMP-BASED UNVOID RANGE:
-From:          {time_start}  (-2 min)
-To:            {time_end}  (+2 min)
-Window:        4 minutes total
+From:          {time_start}
+To:            {time_end}
+Window:        {window_label(patient)} around the void time
 
 SAFETY NOTE:
-Only records voided within this 4-minute time window 
-will be unvoided. Records voided at other times will 
-remain voided for safety.
+Only records voided within this time window will be
+unvoided. Records voided at other times will remain
+voided for safety.
 """
 
+        excluded = patient.get('excluded_counts')
+        if excluded:
+            details += "\nSTAYING VOIDED (OUTSIDE ADAPTIVE WINDOW):\n"
+            for table, row_count in excluded.items():
+                details += f"{table + ':':<20}{row_count:>10}\n"
+
+        counts = patient.get('preview_counts')
+        if counts:
+            details += "\nRECORDS TO UNVOID (PREVIEW):\n"
+            for table, row_count in counts.items():
+                details += f"{table + ':':<20}{row_count:>10}\n"
+            details += f"{'TOTAL:':<20}{sum(counts.values()):>10}\n"
+
         self.details_text.insert(1.0, details.strip())
         self.details_text.config(state="disabled")
 
     def confirm_unvoid(self):
         """Confirm before unvoiding with timestamp details"""
 
-        if not self.current_patient:
+        if not self.current_patient or self.busy:
             return
 
         patient = self.current_patient
         void_timestamp = patient['patient_date_voided']
         time_start = patient['time_start']
         time_end = patient['time_end']
+        excluded = sum(patient.get('excluded_counts', {}).values())
 
         response = messagebox.askyesno(
             "Confirm Unvoid Action",
@@ -587,11 +771,13 @@ remain voided for safety.
             f"Patient: {patient['patient_name']} ({patient['identifier']})\n"
             f"Patient ID: {patient['patient_id']}\n\n"
             f"Bulk Void Timestamp: {void_timestamp}\n\n"
-            f"Time Range to Unvoid:\n"
-            f"  From: {time_start}  (-2 minutes)\n"
-            f"  To:   {time_end}  (+2 minutes)\n\n"
-            f"IMPORTANT: This will ONLY unvoid records voided within\n"
-            f"this 4-minute window. Records voided at other times will\n"
+            f"Time Range to Unvoid ({window_label(patient)}):\n"
+            f"  From: {time_start}\n"
+            f"  To:   {time_end}\n\n"
+            f"Records to unvoid (preview): {sum(patient.get('preview_counts', {}).values())}\n"
+            + (f"Voided records in the ±120 second range left voided: {excluded}\n" if excluded else "")
+            + f"\nIMPORTANT: This will ONLY unvoid records voided within\n"
+            f"this time window. Records voided at other times will\n"
             f"remain voided for safety.\n\n"
             f"Do you want to proceed?",
             icon="warning"
@@ -618,308 +804,248 @@ remain voided for safety.
             return
 
         patient = self.current_patient
-        patient_id = patient['patient_id']
-        identifier = patient['identifier']
-        admin_name = self.config['settings'].get('admin_name', 'Administrator')
+        chunked = self.engine.chunked
+
+        def work():
+            if chunked:
+                operation_id, total_updated = self.engine.unvoid_patient_chunked(patient)
+                patient['operation_id'] = operation_id
+                return total_updated
+            return self.engine.unvoid_patient(patient)
+
+        self.run_in_background(
+            work,
+            lambda total_updated: self.show_unvoid_result(patient, total_updated),
+            lambda e: self.show_unvoid_error(e, chunked)
+        )
 
-        # Get timestamp range
-        void_timestamp = patient['patient_date_voided']
-        time_start = patient['time_start']
-        time_end = patient['time_end']
+    def show_unvoid_result(self, patient, total_updated):
+        """Report a completed unvoid (Tk thread)"""
+
+        # Show success message
+        messagebox.showinfo(
+            "Unvoid Complete",
+            f"SUCCESS: Patient records successfully unvoided!\n\n"
+            f"Patient: {patient['patient_name']}\n"
+            f"Identifier: {patient['identifier']}\n"
+            f"Total Records Unvoided: {total_updated}\n\n"
+            f"Timestamp Range: {patient['time_start']} to {patient['time_end']}\n"
+            f"({window_label(patient)} from bulk void)\n\n"
+            f"SAFETY: Only records voided within this time window\n"
+            f"were unvoided. Other records remain voided.\n\n"
+            f"Audit entry has been logged.\n"
+            f"Undo: operation #{patient['operation_id']} (unvoid_cli.py revert)"
+        )
 
-        self.log("-" * 70)
-        self.log(f"STARTING TIMESTAMP-BASED UNVOID OPERATION")
-        self.log(f"Patient: {patient['patient_name']} ({identifier})")
-        self.log(f"Patient ID: {patient_id}")
-        self.log(f"Void Timestamp: {void_timestamp}")
-        self.log(f"Time Range: {time_start} to {time_end} (±120 seconds)")
-        self.log("-" * 70)
+        # Reset form
+        self.clear_form()
+
+    def show_unvoid_error(self, error, chunked):
+        """Report a failed unvoid (Tk thread)"""
+
+        if chunked:
+            messagebox.showerror(
+                "Unvoid Failed",
+                f"Operation failed:\n\n{str(error)}\n\n"
+                "Chunks committed before the failure are journaled.\n"
+                "Finish or undo them from the command line:\n\n"
+                "  python unvoid_cli.py resume <operation id>\n"
+                "  python unvoid_cli.py rollback <operation id>\n\n"
+                "The operation id is shown in the Activity Log."
+            )
+        else:
+            messagebox.showerror(
+                "Unvoid Failed",
+                f"Operation failed:\n\n{str(error)}\n\n"
+                "No changes have been made to the database."
+            )
+
+    def bulk_unvoid_from_file(self):
+        """Unvoid every eligible patient listed in a CSV/text file"""
+
+        if self.busy:
+            return
 
-        conn = self.get_connection()
-        if not conn:
+        path = filedialog.askopenfilename(
+            title="Select identifier list",
+            filetypes=[("CSV / Text files", "*.csv *.txt"), ("All files", "*.*")]
+        )
+        if not path:
             return
 
         try:
-            cursor = conn.cursor()
-
-            # Ensure audit table exists
-            self.create_audit_table(cursor)
-
-            total_updated = 0
-
-            # IMPORTANT: Only the patient table has void_reason set during bulk void.
-            # Other tables only have date_voided timestamp.
-            # Strategy:
-            #   - Patient table: Check BOTH void_reason AND timestamp
-            #   - All other tables: Check timestamp ONLY
-
-            # 1. Unvoid patient table (with void_reason check for safety)
-            self.log(f"Unvoiding patient...")
-            query = """
-                UPDATE patient
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE patient_id = %s 
-                  AND voided = 1
-                  AND void_reason = 'Bulk void via ART/DATIM mapping'
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in patient")
-            else:
-                self.log(f"  [WARNING] No records matched in patient table")
-
-            # 2. Unvoid patient_identifier (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding patient_identifier...")
-            query = """
-                UPDATE patient_identifier
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE patient_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in patient_identifier")
-
-            # 3. Unvoid patient_program (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding patient_program...")
-            query = """
-                UPDATE patient_program
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE patient_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in patient_program")
-
-            # 4. Unvoid person (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding person...")
-            query = """
-                UPDATE person
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE person_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in person")
-
-            # 5. Unvoid person_name (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding person_name...")
-            query = """
-                UPDATE person_name
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE person_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in person_name")
-
-            # 6. Unvoid person_address (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding person_address...")
-            query = """
-                UPDATE person_address
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE person_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in person_address")
-
-            # 7. Unvoid person_attribute (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding person_attribute...")
-            query = """
-                UPDATE person_attribute
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE person_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in person_attribute")
-
-            # 8. Unvoid visit (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding visit...")
-            query = """
-                UPDATE visit
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE patient_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in visit")
-
-            # 9. Unvoid encounter (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding encounter...")
-            query = """
-                UPDATE encounter
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE patient_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in encounter")
-
-            # 10. Unvoid obs (timestamp-based ONLY - no void_reason!)
-            self.log(f"Unvoiding obs...")
-            query = """
-                UPDATE obs
-                SET voided = 0, 
-                    voided_by = NULL, 
-                    date_voided = NULL, 
-                    void_reason = NULL
-                WHERE person_id = %s 
-                  AND voided = 1
-                  AND date_voided BETWEEN %s AND %s
-            """
-            cursor.execute(query, (patient_id, time_start, time_end))
-            rows = cursor.rowcount
-            total_updated += rows
-            if rows > 0:
-                self.log(f"  [OK] {rows} record(s) unvoided in obs")
-
-            # Log to audit table with timestamp info
-            audit_query = """
-                INSERT INTO nmrs_unvoid_audit
-                (identifier, patient_id, patient_name, executed_by, action_status, remarks)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-
-            remarks = (
-                f'Timestamp-based unvoid: {void_timestamp} (±120sec). '
-                f'Range: {time_start} to {time_end}. '
-                f'Total: {total_updated} records. '
-                f'void_reason: Bulk void via ART/DATIM mapping'
-            )
+            identifiers = read_identifiers(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            messagebox.showerror("File Error", f"Cannot read identifier file:\n\n{str(e)}")
+            return
+
+        if not identifiers:
+            messagebox.showwarning("Empty File", "No identifiers found in the selected file.")
+            return
 
-            cursor.execute(audit_query, (
-                identifier,
-                patient_id,
-                patient['patient_name'],
-                admin_name,
-                'SUCCESS',
-                remarks
-            ))
-
-            # Commit transaction
-            conn.commit()
-
-            self.log("-" * 70)
-            self.log(f"SUCCESS: Unvoided {total_updated} total records")
-            self.log(f"         within timestamp range (±120 seconds)")
-            self.log(f"         Records outside this range remain voided (SAFE)")
-            self.log("-" * 70)
-            self.log(f"Audit entry created in nmrs_unvoid_audit")
-            self.log("-" * 70)
-
-            # Show success message
+        self.log("-" * 70)
+        self.log(f"BULK UNVOID: {len(identifiers)} identifier(s) loaded from {Path(path).name}")
+
+        self.run_in_background(
+            lambda: self.engine.prepare_bulk(identifiers),
+            lambda outcome: self.confirm_bulk_unvoid(
+                Path(path).name,
+                outcome[0],
+                f"File: {Path(path).name}\n"
+                f"Identifiers in file: {len(identifiers)}\n"
+                f"Eligible: {outcome[0]}\n"
+                f"Blocked: {len(outcome[1])} (see Activity Log)"
+            ),
+            lambda e: messagebox.showerror("Database Error", f"Query failed:\n\n{str(e)}")
+        )
+
+    def confirm_bulk_unvoid(self, source_name, eligible, summary):
+        """Double-confirm a prepared bulk unvoid, then run it (Tk thread)"""
+
+        if not eligible:
             messagebox.showinfo(
-                "Unvoid Complete",
-                f"SUCCESS: Patient records successfully unvoided!\n\n"
-                f"Patient: {patient['patient_name']}\n"
-                f"Identifier: {identifier}\n"
-                f"Total Records Unvoided: {total_updated}\n\n"
-                f"Timestamp Range: {time_start} to {time_end}\n"
-                f"(±120 seconds from bulk void)\n\n"
-                f"SAFETY: Only records voided within this time window\n"
-                f"were unvoided. Other records remain voided.\n\n"
-                f"Audit entry has been logged."
+                "Nothing To Unvoid",
+                "No eligible patient found voided with:\n\n"
+                f"Void Reason: '{REQUIRED_VOID_REASON}'"
             )
+            return
 
-            # Reset form
-            self.clear_form()
+        response = messagebox.askyesno(
+            "Confirm Bulk Unvoid",
+            f"Are you sure you want to UNVOID {eligible} patient(s)?\n\n"
+            f"{summary}\n\n"
+            f"IMPORTANT: For each patient, ONLY records voided within\n"
+            f"±120 seconds of that patient's bulk void timestamp will\n"
+            f"be unvoided.\n\n"
+            f"Do you want to proceed?",
+            icon="warning"
+        )
 
-        except Error as e:
-            conn.rollback()
-            self.log(f"ERROR: Unvoid operation failed - {str(e)}")
-            messagebox.showerror(
-                "Unvoid Failed",
+        if not response:
+            return
+
+        response2 = messagebox.askyesno(
+            "FINAL CONFIRMATION",
+            f"LAST CHANCE!\n\n"
+            f"This action will unvoid records for {eligible} patient(s).\n\n"
+            f"Are you ABSOLUTELY SURE?",
+            icon="warning"
+        )
+
+        if not response2:
+            return
+
+        self.run_in_background(
+            lambda: self.engine.bulk_unvoid(source_name),
+            lambda outcome: self.show_bulk_result(source_name, *outcome),
+            lambda e: messagebox.showerror(
+                "Bulk Unvoid Failed",
                 f"Operation failed:\n\n{str(e)}\n\n"
                 "No changes have been made to the database."
             )
+        )
 
-        finally:
-            cursor.close()
-
-    def create_audit_table(self, cursor):
-        """Ensure audit table exists"""
-
-        create_table_sql = """
-            CREATE TABLE IF NOT EXISTS nmrs_unvoid_audit (
-                audit_id        INT AUTO_INCREMENT PRIMARY KEY,
-                action_time     DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                identifier      VARCHAR(50) NOT NULL,
-                patient_id      INT NOT NULL,
-                patient_name    VARCHAR(255),
-                executed_by     VARCHAR(100),
-                action_status   VARCHAR(20) NOT NULL,
-                remarks         TEXT,
-
-                INDEX idx_audit_patient_id (patient_id),
-                INDEX idx_audit_identifier (identifier),
-                INDEX idx_audit_action_time (action_time)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8
-        """
+    def show_bulk_result(self, source_name, total_updated, audited):
+        """Report a completed bulk unvoid (Tk thread)"""
+
+        messagebox.showinfo(
+            "Bulk Unvoid Complete",
+            f"SUCCESS: Bulk unvoid completed!\n\n"
+            f"Source: {source_name}\n"
+            f"Patients: {audited}\n"
+            f"Total Records Unvoided: {total_updated}\n\n"
+            f"SAFETY: Only records voided within ±120 seconds of each\n"
+            f"patient's bulk void were unvoided.\n\n"
+            f"Audit entries have been logged."
+        )
+
+    def discover_void_events(self):
+        """List bulk void events (time clusters) with per-table counts"""
 
-        cursor.execute(create_table_sql)
+        if self.busy:
+            return
+
+        self.log("-" * 70)
+        self.run_in_background(
+            self.engine.discover_void_events,
+            self.show_void_events,
+            lambda e: messagebox.showerror("Database Error", f"Query failed:\n\n{str(e)}")
+        )
+
+    def show_void_events(self, events):
+        """Show discovered void events in their own window (Tk thread)"""
+
+        if not events:
+            messagebox.showinfo(
+                "No Void Events",
+                "No voided patients found with:\n\n"
+                f"Void Reason: '{REQUIRED_VOID_REASON}'"
+            )
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Bulk Void Events")
+        window.geometry("900x400")
+        window.transient(self.root)
+
+        tables = list(events[0]['counts'])
+        columns = ["event", "start", "end", "patients", "total"] + tables
+
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=140 if column in ("start", "end") else 80, anchor="e")
+
+        for event in events:
+            tree.insert("", "end", values=[
+                event['event_no'], event['start'], event['end'], event['patients'], event['total']
+            ] + [event['counts'][table] for table in tables])
+
+        scrollbar = ttk.Scrollbar(window, orient="horizontal", command=tree.xview)
+        tree.configure(xscrollcommand=scrollbar.set)
+        tree.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+        scrollbar.pack(fill="x", padx=10)
+
+        def unvoid_selected():
+            selection = tree.selection()
+            if not selection:
+                messagebox.showwarning("No Event Selected", "Select a void event first.", parent=window)
+                return
+            event = events[tree.index(selection[0])]
+            window.destroy()
+            self.unvoid_event(event)
+
+        tk.Button(
+            window,
+            text="UNVOID SELECTED EVENT",
+            command=unvoid_selected,
+            bg="#f44336",
+            fg="white",
+            font=("Arial", 11, "bold"),
+            padx=20,
+            pady=8,
+            cursor="hand2"
+        ).pack(pady=10)
+
+    def unvoid_event(self, event):
+        """Load one void event into the batch, then confirm it like a bulk unvoid"""
+
+        if self.busy:
+            return
+
+        source_name = f"void event {event['start']} to {event['end']}"
+        self.log("-" * 70)
+
+        self.run_in_background(
+            lambda: self.engine.prepare_event(event['start'], event['end']),
+            lambda eligible: self.confirm_bulk_unvoid(
+                source_name,
+                eligible,
+                f"Void event: {event['start']} to {event['end']}\n"
+                f"Eligible: {eligible}"
+            ),
+            lambda e: messagebox.showerror("Database Error", f"Query failed:\n\n{str(e)}")
+        )
 
     def clear_form(self):
         """Clear form for next patient"""
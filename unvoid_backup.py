@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Unvoid Row Backup - CCFN OpenMRS
+================================
+Point-in-time copy of exactly the rows an unvoid is about to change, taken
+just before the unvoid transaction. A cheap, targeted restore point instead
+of a mysqldump of obs.
+
+- Same WHERE clauses as the unvoid plan (single patient or bulk batch)
+- Rows streamed with an unbuffered server-side cursor (SSCursor), so memory
+  stays constant however large the footprint
+- One consistent snapshot across all tables
+- One gzip'd CSV or JSONL file per table plus a manifest.json, throughput
+  reported in rows/sec
+
+CSV files write NULL as \\N (as mysqldump and LOAD DATA do).
+
+Settings live in the [backup] section of unvoid_config.ini.
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import csv
+import gzip
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from unvoid_metrics import InstrumentedSSCursor
+
+
+BACKUP_FORMATS = ('csv', 'jsonl')
+DEFAULT_BACKUP_DIRECTORY = 'backups'
+
+CSV_NULL = r'\N'
+
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def json_value(value):
+    """JSON encoder fallback for dates, decimals and binary columns"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+class RowBackup:
+    """Streams the rows matched by an unvoid plan to compressed files"""
+
+    def __init__(self, config, log=None):
+        self.log = log or (lambda message: None)
+        self.enabled = config.getboolean('backup', 'enabled', fallback=False)
+        self.directory = config.get('backup', 'directory', fallback=DEFAULT_BACKUP_DIRECTORY).strip()
+        self.format = config.get('backup', 'format', fallback='csv').strip().lower()
+
+    def backup_patient(self, conn, plan, patient):
+        """Back up one patient's rows inside their window; returns the backup directory"""
+
+        queries = []
+        for step in plan:
+            where, params = step.patient_where(patient['patient_id'], patient['time_start'], patient['time_end'])
+            queries.append((step.table, f"SELECT * FROM {step.table} {where}", params))
+        return self._backup(conn, patient['identifier'], queries)
+
+    def backup_batch(self, conn, plan, label):
+        """Back up the rows of every patient in tmp_unvoid_batch; returns the backup directory"""
+
+        queries = []
+        for step in plan:
+            where, params = step.batch_where()
+            queries.append((step.table, f"SELECT t.* FROM {step.table} t {step.batch_join()} {where}", params))
+        return self._backup(conn, label, queries)
+
+    def _backup(self, conn, label, queries):
+        started_at = datetime.now()
+        folder = Path(self.directory) / (
+            f"{started_at.strftime('%Y%m%d_%H%M%S')}_{UNSAFE_NAME_CHARS.sub('_', label)[:60]}"
+        )
+        folder.mkdir(parents=True, exist_ok=True)
+
+        self.log(f"BACKUP: streaming affected rows to {folder}")
+        manifest = {
+            'label': label,
+            'started_at': started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'format': self.format,
+            'tables': {},
+        }
+
+        total_rows = 0
+        total_started = time.perf_counter()
+
+        # Every table is read from the same snapshot
+        conn.query("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+        try:
+            for table, sql, params in queries:
+                path = folder / f"{table}.{self.format}.gz"
+                started = time.perf_counter()
+                rows = self._stream(conn, sql, params, path)
+                elapsed = time.perf_counter() - started
+
+                total_rows += rows
+                manifest['tables'][table] = {'file': path.name, 'rows': rows, 'seconds': round(elapsed, 3)}
+                self.log(f"  [BACKUP] {table}: {rows} row(s) in {elapsed:.1f}s "
+                         f"({rows / elapsed if elapsed else 0:.0f} rows/sec)")
+            conn.commit()
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        elapsed = time.perf_counter() - total_started
+        manifest['rows'] = total_rows
+        manifest['seconds'] = round(elapsed, 3)
+        with open(folder / 'manifest.json', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        self.log(f"BACKUP: {total_rows} row(s) in {elapsed:.1f}s "
+                 f"({total_rows / elapsed if elapsed else 0:.0f} rows/sec)")
+        return folder
+
+    def _stream(self, conn, sql, params, path):
+        """Write one query's rows to a gzip file as they arrive; returns the row count"""
+
+        rows = 0
+        cursor = conn.cursor(InstrumentedSSCursor)
+        try:
+            cursor.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+
+            with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+                if self.format == 'jsonl':
+                    for row in cursor:
+                        f.write(json.dumps(dict(zip(columns, row)), default=json_value))
+                        f.write("\n")
+                        rows += 1
+                else:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                    for row in cursor:
+                        writer.writerow([CSV_NULL if value is None else value for value in row])
+                        rows += 1
+        finally:
+            # Drains any unread rows so the connection can be reused
+            cursor.close()
+
+        return rows
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Patient Unvoid Tool - Benchmark
+===============================
+Builds a synthetic, OpenMRS-shaped database (only the ten tables the unvoid
+plan touches), simulates a "Bulk void via ART/DATIM mapping" run and times
+the tool's search, preview, single and bulk unvoid paths against it.
+
+NEVER point this at a real OpenMRS database: setup drops and recreates the
+ten tables. It refuses to run in a schema that has a ``concept`` table.
+
+Usage:
+    python unvoid_bench.py setup --patients 10000 --visits 10 --encounters 2 --obs 25
+    python unvoid_bench.py run --samples 50 --bulk-size 500 --json bench.json
+    python unvoid_bench.py all --patients 1000
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pymysql as mysql_connector
+from pymysql.err import Error
+
+from unvoid_cli import log
+from unvoid_engine import REQUIRED_VOID_REASON, STATUS_ELIGIBLE, ConfigError, UnvoidEngine, load_config
+
+
+DEFAULT_DATABASE = 'unvoid_bench'
+BENCH_VOID_TIME = datetime(2026, 1, 12, 9, 0, 0)
+PATIENTS_VOIDED_PER_SECOND = 20
+
+VOID_COLUMNS = """
+    voided          TINYINT(1) NOT NULL DEFAULT 0,
+    voided_by       INT NULL,
+    date_voided     DATETIME NULL,
+    void_reason     VARCHAR(255) NULL
+"""
+
+# Minimal copies of the OpenMRS tables with the stock single-column indexes
+BENCH_TABLES = (
+    ('person', f"""
+        person_id       INT NOT NULL PRIMARY KEY,
+        gender          VARCHAR(50) NULL,
+        birthdate       DATE NULL,
+        {VOID_COLUMNS}
+    """),
+    ('patient', f"""
+        patient_id      INT NOT NULL PRIMARY KEY,
+        {VOID_COLUMNS}
+    """),
+    ('patient_identifier', f"""
+        patient_identifier_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        patient_id      INT NOT NULL,
+        identifier      VARCHAR(50) NOT NULL,
+        preferred       TINYINT(1) NOT NULL DEFAULT 1,
+        {VOID_COLUMNS},
+        INDEX identifier_patient_id (patient_id),
+        INDEX identifier_name (identifier)
+    """),
+    ('patient_program', f"""
+        patient_program_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        patient_id      INT NOT NULL,
+        {VOID_COLUMNS},
+        INDEX patient_in_program (patient_id)
+    """),
+    ('person_name', f"""
+        person_name_id  INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        person_id       INT NOT NULL,
+        given_name      VARCHAR(50) NULL,
+        family_name     VARCHAR(50) NULL,
+        preferred       TINYINT(1) NOT NULL DEFAULT 1,
+        date_created    DATETIME NOT NULL,
+        {VOID_COLUMNS},
+        INDEX name_for_person (person_id)
+    """),
+    ('person_address', f"""
+        person_address_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        person_id       INT NOT NULL,
+        {VOID_COLUMNS},
+        INDEX address_for_person (person_id)
+    """),
+    ('person_attribute', f"""
+        person_attribute_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        person_id       INT NOT NULL,
+        {VOID_COLUMNS},
+        INDEX identifies_person (person_id)
+    """),
+    ('visit', f"""
+        visit_id        INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        patient_id      INT NOT NULL,
+        {VOID_COLUMNS},
+        INDEX visit_patient_index (patient_id)
+    """),
+    ('encounter', f"""
+        encounter_id    INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        patient_id      INT NOT NULL,
+        visit_id        INT NULL,
+        {VOID_COLUMNS},
+        INDEX encounter_patient_index (patient_id),
+        INDEX encounter_visit (visit_id)
+    """),
+    ('obs', f"""
+        obs_id          INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        person_id       INT NOT NULL,
+        encounter_id    INT NULL,
+        value_numeric   DOUBLE NULL,
+        {VOID_COLUMNS},
+        INDEX person_obs (person_id),
+        INDEX encounter_observations (encounter_id)
+    """),
+)
+
+
+def bench_identifier(patient_id):
+    return f"BENCH{patient_id:08d}"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def bench_config(args):
+    """Load unvoid_config.ini and point it at the benchmark database"""
+    config = load_config(args.config)
+    config['database']['database'] = args.database
+    return config
+
+
+def connect(config, database=None):
+    settings = config['database']
+    return mysql_connector.connect(
+        host=settings['host'],
+        user=settings['user'],
+        password=settings['password'],
+        database=database,
+        port=int(settings.get('port', 3306)),
+        autocommit=True
+    )
+
+
+def refuse_real_openmrs(cursor, database):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'concept'
+    """, (database,))
+    if cursor.fetchone()[0]:
+        raise ConfigError(f"Database '{database}' looks like a real OpenMRS database; refusing to benchmark it")
+
+
+def setup(args):
+    """Create the schema, generate patients and simulate the bulk void"""
+
+    config = bench_config(args)
+    conn = connect(config)
+    cursor = conn.cursor()
+
+    try:
+        refuse_real_openmrs(cursor, args.database)
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+        cursor.execute(f"USE `{args.database}`")
+
+        log(f"Creating benchmark tables in {args.database}...")
+        for table, columns in BENCH_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} ({columns}) ENGINE=InnoDB DEFAULT CHARSET=utf8")
+
+        # Small sequence table used for the fan-out joins
+        fan_out = max(args.visits, args.encounters, args.obs)
+        cursor.execute("DROP TABLE IF EXISTS bench_seq")
+        cursor.execute("CREATE TABLE bench_seq (n INT NOT NULL PRIMARY KEY) ENGINE=InnoDB")
+        cursor.executemany("INSERT INTO bench_seq (n) VALUES (%s)", [(n,) for n in range(fan_out)])
+
+        started = time.perf_counter()
+        log(f"Generating {args.patients} patients...")
+        for first in range(1, args.patients + 1, 5000):
+            ids = range(first, min(first + 5000, args.patients + 1))
+            cursor.executemany(
+                "INSERT INTO person (person_id, gender, birthdate) VALUES (%s, %s, %s)",
+                [(i, 'F' if i % 2 else 'M', datetime(1980 + i % 30, 1 + i % 12, 1 + i % 28).date()) for i in ids]
+            )
+
+        created = datetime(2020, 1, 1)
+        cursor.execute("INSERT INTO patient (patient_id) SELECT person_id FROM person")
+        cursor.execute("""
+            INSERT INTO patient_identifier (patient_id, identifier)
+            SELECT person_id, CONCAT('BENCH', LPAD(person_id, 8, '0')) FROM person
+        """)
+        cursor.execute("""
+            INSERT INTO person_name (person_id, given_name, family_name, date_created)
+            SELECT person_id, CONCAT('Given', person_id), CONCAT('Family', person_id), %s FROM person
+        """, (created,))
+        cursor.execute("INSERT INTO patient_program (patient_id) SELECT person_id FROM person")
+        for table in ('person_address', 'person_attribute'):
+            cursor.execute(f"INSERT INTO {table} (person_id) SELECT person_id FROM person")
+
+        log(f"Generating {args.visits} visit(s), {args.encounters} encounter(s) per visit, "
+            f"{args.obs} obs per encounter...")
+        cursor.execute("""
+            INSERT INTO visit (patient_id)
+            SELECT p.person_id FROM person p JOIN bench_seq s ON s.n < %s
+        """, (args.visits,))
+        cursor.execute("""
+            INSERT INTO encounter (patient_id, visit_id)
+            SELECT v.patient_id, v.visit_id FROM visit v JOIN bench_seq s ON s.n < %s
+        """, (args.encounters,))
+        cursor.execute("""
+            INSERT INTO obs (person_id, encounter_id, value_numeric)
+            SELECT e.patient_id, e.encounter_id, s.n FROM encounter e JOIN bench_seq s ON s.n < %s
+        """, (args.obs,))
+        log(f"  Data generated in {time.perf_counter() - started:.1f}s")
+
+        simulate_bulk_void(cursor, args)
+
+        cursor.execute("SELECT COUNT(*) FROM obs")
+        log(f"SUCCESS: {args.patients} patients, {cursor.fetchone()[0]} obs in {args.database}")
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def simulate_bulk_void(cursor, args):
+    """Void a share of the patients the way the DATIM mapping run did
+
+    Patients are voided in sequence, PATIENTS_VOIDED_PER_SECOND per second;
+    their rows within 60 seconds of the patient. One obs in a hundred was
+    already voided a month earlier for another reason and must stay voided.
+    """
+
+    started = time.perf_counter()
+    every = max(1, int(round(1 / args.void_fraction))) if args.void_fraction > 0 else 0
+    if not every:
+        return
+
+    log(f"Simulating bulk void of one patient in {every}...")
+    cursor.execute("""
+        UPDATE obs
+        SET voided = 1, voided_by = 1, date_voided = %s, void_reason = 'Entered in error'
+        WHERE obs_id MOD 100 = 0
+    """, (BENCH_VOID_TIME - timedelta(days=30),))
+
+    cursor.execute("""
+        UPDATE patient
+        SET voided = 1, voided_by = 1, void_reason = %s,
+            date_voided = %s + INTERVAL FLOOR(patient_id / %s) SECOND
+        WHERE patient_id MOD %s = 0
+    """, (REQUIRED_VOID_REASON, BENCH_VOID_TIME, PATIENTS_VOIDED_PER_SECOND, every))
+
+    for table, key_column, pk_column in (
+            ('patient_identifier', 'patient_id', 'patient_identifier_id'),
+            ('patient_program', 'patient_id', 'patient_program_id'),
+            ('person', 'person_id', 'person_id'),
+            ('person_name', 'person_id', 'person_name_id'),
+            ('person_address', 'person_id', 'person_address_id'),
+            ('person_attribute', 'person_id', 'person_attribute_id'),
+            ('visit', 'patient_id', 'visit_id'),
+            ('encounter', 'patient_id', 'encounter_id'),
+            ('obs', 'person_id', 'obs_id')):
+        cursor.execute(f"""
+            UPDATE {table} t
+            JOIN patient p ON p.patient_id = t.{key_column}
+            SET t.voided = 1, t.voided_by = 1, t.void_reason = %s,
+                t.date_voided = p.date_voided + INTERVAL (t.{pk_column} MOD 60) SECOND
+            WHERE p.voided = 1 AND t.voided = 0
+        """, (REQUIRED_VOID_REASON,))
+        log(f"  [OK] {cursor.rowcount} record(s) voided in {table}")
+
+    log(f"  Bulk void simulated in {time.perf_counter() - started:.1f}s")
+
+
+def voided_identifiers(config):
+    conn = connect(config, config['database']['database'])
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT patient_id FROM patient
+            WHERE voided = 1 AND void_reason = %s
+            ORDER BY patient_id
+        """, (REQUIRED_VOID_REASON,))
+        return [bench_identifier(row[0]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def summarize(name, latencies, patients, rows, seconds):
+    return {
+        'path': name,
+        'operations': len(latencies),
+        'patients': patients,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'patients_per_sec': round(patients / seconds, 1) if seconds else 0,
+        'rows_per_sec': round(rows / seconds, 1) if seconds else 0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+    }
+
+
+def run(args):
+    """Time search, preview, single and bulk unvoid; returns the report rows"""
+
+    config = bench_config(args)
+    conn = connect(config)
+    cursor = conn.cursor()
+    try:
+        refuse_real_openmrs(cursor, args.database)
+    finally:
+        cursor.close()
+        conn.close()
+
+    identifiers = voided_identifiers(config)
+    single_count = args.samples * (2 if args.chunked else 1)
+    needed = single_count + args.bulk_size
+    if len(identifiers) < needed:
+        raise ConfigError(
+            f"Only {len(identifiers)} voided patients in {args.database}; "
+            f"{needed} needed - run setup again (unvoided patients cannot be re-timed)"
+        )
+
+    single_ids = identifiers[:args.samples]
+    chunked_ids = identifiers[args.samples:single_count]
+    bulk_ids = identifiers[single_count:needed]
+
+    engine = UnvoidEngine(config)
+    engine.ensure_schema()
+    results = []
+
+    try:
+        # Search and preview (read only)
+        search_ms, preview_ms, patients = [], [], []
+        for identifier in single_ids + chunked_ids:
+            (status, patient), elapsed = timed(engine.lookup_patient, identifier)
+            search_ms.append(elapsed)
+            if status != STATUS_ELIGIBLE:
+                raise ConfigError(f"Benchmark patient {identifier} is not eligible ({status})")
+            counts, elapsed = timed(engine.preview_counts, patient)
+            preview_ms.append(elapsed)
+            patients.append(patient)
+
+        results.append(summarize('search', search_ms, len(search_ms), len(search_ms), sum(search_ms) / 1000))
+        results.append(summarize(
+            'preview', preview_ms, len(preview_ms),
+            sum(sum(p['preview_counts'].values()) for p in patients), sum(preview_ms) / 1000
+        ))
+
+        # Single-patient unvoid
+        unvoid_ms, rows = [], 0
+        for patient in patients[:len(single_ids)]:
+            total, elapsed = timed(engine.unvoid_patient, patient)
+            unvoid_ms.append(elapsed)
+            rows += total
+        results.append(summarize('unvoid', unvoid_ms, len(unvoid_ms), rows, sum(unvoid_ms) / 1000))
+
+        # Chunked single-patient unvoid
+        if chunked_ids:
+            chunked_ms, rows = [], 0
+            for patient in patients[len(single_ids):]:
+                (operation_id, total), elapsed = timed(engine.unvoid_patient_chunked, patient)
+                chunked_ms.append(elapsed)
+                rows += total
+            results.append(summarize('unvoid_chunked', chunked_ms, len(chunked_ms), rows, sum(chunked_ms) / 1000))
+
+        # Bulk unvoid of one identifier list
+        (eligible, blocked), prepare_elapsed = timed(engine.prepare_bulk, bulk_ids)
+        (total, audited), bulk_elapsed = timed(engine.bulk_unvoid, 'benchmark')
+        elapsed = prepare_elapsed + bulk_elapsed
+        results.append(summarize('bulk', [elapsed], audited, total, elapsed / 1000))
+
+    finally:
+        engine.close()
+
+    log("-" * 70)
+    log(f"{'path':<16}{'ops':>6}{'patients/s':>12}{'rows/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for result in results:
+        log(f"{result['path']:<16}{result['operations']:>6}{result['patients_per_sec']:>12}"
+            f"{result['rows_per_sec']:>12}{result['p50_ms']:>10}{result['p95_ms']:>10}")
+    log("-" * 70)
+
+    if args.json:
+        report = {
+            'database': args.database,
+            'finished_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'settings': {
+                'batch_statements': engine.batch_statements,
+                'chunk_size': engine.chunk_size,
+            },
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        log(f"Report written to {args.json}")
+
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Patient Unvoid Tool benchmark (synthetic database) - CCFN OpenMRS"
+    )
+    parser.add_argument("--config", default="unvoid_config.ini",
+                        help="configuration file for host and credentials (default: unvoid_config.ini)")
+    parser.add_argument("--database", default=DEFAULT_DATABASE,
+                        help=f"scratch database to build and benchmark (default: {DEFAULT_DATABASE})")
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    def add_setup_arguments(command):
+        command.add_argument("--patients", type=int, default=1000, help="patients to generate (default: 1000)")
+        command.add_argument("--visits", type=int, default=5, help="visits per patient (default: 5)")
+        command.add_argument("--encounters", type=int, default=2, help="encounters per visit (default: 2)")
+        command.add_argument("--obs", type=int, default=25, help="obs per encounter (default: 25)")
+        command.add_argument("--void-fraction", type=float, default=1.0,
+                             help="share of patients bulk-voided (default: 1.0)")
+
+    def add_run_arguments(command):
+        command.add_argument("--samples", type=int, default=20,
+                             help="patients timed per single-patient path (default: 20)")
+        command.add_argument("--bulk-size", type=int, default=200,
+                             help="patients in the bulk unvoid (default: 200)")
+        command.add_argument("--chunked", action="store_true", help="also time the chunked unvoid")
+        command.add_argument("--json", help="write the report to this JSON file")
+
+    add_setup_arguments(subparsers.add_parser("setup", help="create and fill the synthetic database"))
+    add_run_arguments(subparsers.add_parser("run", help="time the unvoid paths"))
+
+    both = subparsers.add_parser("all", help="setup, then run")
+    add_setup_arguments(both)
+    add_run_arguments(both)
+
+    return parser
+
+
+def main(argv=None):
+    """Benchmark entry point"""
+    args = build_parser().parse_args(argv)
+
+    try:
+        if args.command in ("setup", "all"):
+            setup(args)
+        if args.command in ("run", "all"):
+            run(args)
+        return 0
+
+    except ConfigError as e:
+        log(f"ERROR: {e}")
+        return 1
+
+    except Error as e:
+        log(f"ERROR: Database operation failed - {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Patient Unvoid Tool - Command Line
+==================================
+Headless entry point for the Patient Unvoid Tool. Uses the same engine,
+safety rules and audit trail as the GUI, but never imports tkinter, so it
+runs from cron, ETL boxes or directly on the database host.
+
+Usage:
+    python unvoid_cli.py init
+    python unvoid_cli.py lookup IMO01104166
+    python unvoid_cli.py preview IMO01104166
+    python unvoid_cli.py unvoid IMO01104166
+    python unvoid_cli.py bulk identifiers.csv --yes
+    python unvoid_cli.py unvoid IMO01104166 --chunked --chunk-size 2000
+    python unvoid_cli.py resume 42
+    python unvoid_cli.py rollback 42
+    python unvoid_cli.py revert 42
+    python unvoid_cli.py verify 42 --output verify_42.json
+    python unvoid_cli.py index-check
+    python unvoid_cli.py events
+    python unvoid_cli.py unvoid-event "2026-01-12 09:14:03" "2026-01-12 09:21:47"
+    python unvoid_cli.py bulk identifiers.csv --helper-indexes
+    python unvoid_cli.py bulk identifiers.csv --batch-size 500
+    python unvoid_cli.py bulk --resume
+    python unvoid_cli.py plan --refresh
+    python unvoid_cli.py classify identifiers.csv --output eligibility.csv
+    python unvoid_cli.py sites unvoid identifiers.csv --workers 8
+
+Exit codes:
+    0  success
+    1  database or configuration error
+    2  patient blocked / nothing to unvoid
+    3  cancelled by operator
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import argparse
+import csv
+import logging
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from pymysql.err import Error
+
+from unvoid_engine import (
+    STATUS_ELIGIBLE,
+    VOID_WINDOW_SECONDS,
+    ConfigError,
+    OperationError,
+    UnvoidEngine,
+    load_config,
+    SESSION_LOGGER,
+    open_session_log,
+    read_identifiers,
+    site_sections,
+    write_eligibility_report,
+)
+from unvoid_discovery import PlanDiscovery
+from unvoid_indexes import IndexAdvisor
+from unvoid_journal import DEFAULT_BATCH_SIZE, DEFAULT_JOURNAL_FILE, BatchJournal, run_job
+from unvoid_sites import DEFAULT_SITE_WORKERS, SITE_ACTIONS, SITE_OK, run_sites
+
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_BLOCKED = 2
+EXIT_CANCELLED = 3
+
+
+def log(message):
+    """Print a timestamped log line, same format as the GUI Activity Log"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+    logging.getLogger(SESSION_LOGGER).info(message)
+
+
+def confirm(prompt, assume_yes):
+    """Ask the operator to type YES unless --yes was given"""
+    if assume_yes:
+        return True
+
+    try:
+        answer = input(f"{prompt} Type YES to proceed: ")
+    except EOFError:
+        return False
+
+    return answer.strip() == "YES"
+
+
+def cmd_init(engine, args):
+    version = engine.ensure_schema()
+    log(f"Schema version {version} installed")
+    return EXIT_OK
+
+
+def cmd_plan(engine, args):
+    plan = PlanDiscovery(engine).apply(refresh=args.refresh)
+    for step in plan:
+        log(f"  {step.table:<24} {' OR '.join(step.key_columns):<12} pk {step.pk_column}"
+            f"{' (chunked)' if step.chunked else ''}")
+    return EXIT_OK
+
+
+def cmd_lookup(engine, args):
+    status, patient = engine.lookup_patient(args.identifier)
+    return EXIT_OK if status == STATUS_ELIGIBLE else EXIT_BLOCKED
+
+
+def cmd_preview(engine, args):
+    status, patient = engine.lookup_patient(args.identifier)
+    if status != STATUS_ELIGIBLE:
+        return EXIT_BLOCKED
+
+    engine.preview_counts(patient)
+    return EXIT_OK
+
+
+def cmd_unvoid(engine, args):
+    status, patient = engine.lookup_patient(args.identifier)
+    if status != STATUS_ELIGIBLE:
+        return EXIT_BLOCKED
+
+    engine.preview_counts(patient)
+
+    excluded = sum(patient.get('excluded_counts', {}).values())
+    if not confirm(
+        f"Unvoid {patient['patient_name']} ({patient['identifier']}) "
+        f"within {patient['time_start']} to {patient['time_end']}"
+        + (f", leaving {excluded} voided row(s) of the ±120 sec range voided" if excluded else "")
+        + "?",
+        args.yes
+    ):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    if args.chunked or engine.chunked:
+        engine.unvoid_patient_chunked(patient, chunk_size=args.chunk_size)
+    else:
+        engine.unvoid_patient(patient)
+    return EXIT_OK
+
+
+def cmd_resume(engine, args):
+    engine.resume_operation(args.operation_id)
+    return EXIT_OK
+
+
+def cmd_rollback(engine, args):
+    if not confirm(f"Re-void every row committed by operation #{args.operation_id}?", args.yes):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    engine.rollback_operation(args.operation_id)
+    return EXIT_OK
+
+
+def cmd_revert(engine, args):
+    if not confirm(f"Re-void every row restored by operation #{args.operation_id}?", args.yes):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    engine.revert_operation(args.operation_id)
+    return EXIT_OK
+
+
+def cmd_verify(engine, args):
+    report = engine.verify_operation(args.operation_id, output=args.output)
+    return EXIT_OK if report['ok'] else EXIT_BLOCKED
+
+
+def cmd_bulk(engine, args):
+    if args.resume is not None or args.batch_size:
+        return run_bulk_job(engine, args)
+
+    if not args.file:
+        log("ERROR: An identifier file is required (or --resume)")
+        return EXIT_ERROR
+
+    identifiers = read_identifiers(args.file)
+    if not identifiers:
+        log(f"ERROR: No identifiers found in {args.file}")
+        return EXIT_BLOCKED
+
+    log(f"BULK UNVOID: {len(identifiers)} identifier(s) loaded from {Path(args.file).name}")
+
+    eligible, blocked = engine.prepare_bulk(identifiers)
+    if not eligible:
+        log("Nothing to unvoid")
+        return EXIT_BLOCKED
+
+    if not confirm(f"Unvoid {eligible} patient(s)?", args.yes):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    if not args.helper_indexes:
+        engine.bulk_unvoid(Path(args.file).name)
+        return EXIT_OK
+
+    # ALTER TABLE commits implicitly; the batch is committed by prepare_bulk
+    advisor = IndexAdvisor(engine)
+    created = advisor.create_helper_indexes()
+    try:
+        engine.bulk_unvoid(Path(args.file).name)
+    finally:
+        if created:
+            advisor.drop_helper_indexes(created)
+    return EXIT_OK
+
+
+def run_bulk_job(engine, args):
+    """Bulk unvoid in committed batches, checkpointed in the local journal"""
+
+    journal_file = args.journal or engine.config['settings'].get('journal_file', DEFAULT_JOURNAL_FILE)
+    journal = BatchJournal(journal_file)
+
+    try:
+        if args.resume is not None:
+            job = journal.load_job(args.resume or None)
+            if job is None:
+                log(f"ERROR: No job to resume in {journal_file}")
+                return EXIT_BLOCKED
+            job_id = job['job_id']
+            done = journal.summary(job_id).get('done', 0)
+            log(f"RESUMING JOB #{job_id}: {job['source']}, {done} identifier(s) already done")
+
+        else:
+            if not args.file:
+                log("ERROR: An identifier file is required (or --resume)")
+                return EXIT_ERROR
+
+            identifiers = read_identifiers(args.file)
+            if not identifiers:
+                log(f"ERROR: No identifiers found in {args.file}")
+                return EXIT_BLOCKED
+
+            if not confirm(
+                f"Unvoid the eligible patients among {len(identifiers)} identifier(s) "
+                f"in batches of {args.batch_size}?",
+                args.yes
+            ):
+                log("Operation cancelled by operator")
+                return EXIT_CANCELLED
+
+            job_id = journal.create_job(Path(args.file).name, identifiers, args.batch_size)
+            log(f"JOB #{job_id}: {len(identifiers)} identifier(s) from {Path(args.file).name}, "
+                f"journal {journal_file}")
+
+        if not args.helper_indexes:
+            summary = run_job(engine, journal, job_id)
+        else:
+            advisor = IndexAdvisor(engine)
+            created = advisor.create_helper_indexes()
+            try:
+                summary = run_job(engine, journal, job_id)
+            finally:
+                if created:
+                    advisor.drop_helper_indexes(created)
+
+    finally:
+        journal.close()
+
+    return EXIT_OK if summary.get('done') else EXIT_BLOCKED
+
+
+def cmd_classify(engine, args):
+    identifiers = read_identifiers(args.file)
+    if not identifiers:
+        log(f"ERROR: No identifiers found in {args.file}")
+        return EXIT_BLOCKED
+
+    results = engine.classify_identifiers(identifiers)
+
+    output = args.output or str(Path(args.file).with_name(f"{Path(args.file).stem}_eligibility.csv"))
+    write_eligibility_report(output, results)
+    log(f"Eligibility report written to {output}")
+
+    return EXIT_OK if any(row['status'] == STATUS_ELIGIBLE for row in results) else EXIT_BLOCKED
+
+
+def cmd_sites(config, args):
+    """Run lookup/preview/unvoid on every [database:<site>] section in parallel"""
+
+    sites = site_sections(config)
+    if args.sites:
+        wanted = [site.strip() for site in args.sites.split(',') if site.strip()]
+        unknown = [site for site in wanted if site not in sites]
+        if unknown:
+            log(f"ERROR: No [database:<site>] section for: {', '.join(unknown)}")
+            return EXIT_ERROR
+        sites = {site: sites[site] for site in wanted}
+
+    if not sites:
+        log("ERROR: No [database:<site>] sections in the configuration")
+        return EXIT_ERROR
+
+    identifiers = read_identifiers(args.file)
+    if not identifiers:
+        log(f"ERROR: No identifiers found in {args.file}")
+        return EXIT_BLOCKED
+
+    log(f"MULTI-SITE {args.action.upper()}: {len(identifiers)} identifier(s) from "
+        f"{Path(args.file).name} on {len(sites)} site(s): {', '.join(sites)}")
+
+    if args.action == 'unvoid' and not confirm(
+        f"Unvoid the eligible patients on {len(sites)} site(s)?", args.yes
+    ):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    workers = args.workers or config.getint('sites', 'workers', fallback=DEFAULT_SITE_WORKERS)
+    results = run_sites(config, sites, args.action, identifiers, Path(args.file).name, workers, log)
+
+    return EXIT_OK if all(result['status'] == SITE_OK for result in results) else EXIT_ERROR
+
+
+def cmd_events(engine, args):
+    events = engine.discover_void_events(bucket_seconds=args.bucket)
+    return EXIT_OK if events else EXIT_BLOCKED
+
+
+def cmd_unvoid_event(engine, args):
+    eligible = engine.prepare_event(args.start, args.end)
+    if not eligible:
+        log("Nothing to unvoid")
+        return EXIT_BLOCKED
+
+    if not confirm(f"Unvoid {eligible} patient(s) voided between {args.start} and {args.end}?", args.yes):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    engine.bulk_unvoid(f"void event {args.start} to {args.end}")
+    return EXIT_OK
+
+
+def timestamp(value):
+    """argparse type for 'YYYY-MM-DD HH:MM:SS'"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected 'YYYY-MM-DD HH:MM:SS', got '{value}'")
+
+
+def cmd_index_check(engine, args):
+    advisor = IndexAdvisor(engine)
+
+    if args.drop:
+        advisor.drop_helper_indexes()
+        return EXIT_OK
+
+    needs_helper = advisor.check(args.identifier)
+    if not (args.create and needs_helper):
+        return EXIT_OK
+
+    if not confirm(
+        f"Create helper indexes on {', '.join(step.table for step in needs_helper)}?",
+        args.yes
+    ):
+        log("Operation cancelled by operator")
+        return EXIT_CANCELLED
+
+    advisor.create_helper_indexes(needs_helper)
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Patient Unvoid Tool (command line) - CCFN OpenMRS"
+    )
+    parser.add_argument(
+        "--config",
+        default="unvoid_config.ini",
+        help="path to configuration file (default: unvoid_config.ini)"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    init = subparsers.add_parser("init", help="create or upgrade the tool's audit and journal tables")
+    init.set_defaults(func=cmd_init)
+
+    plan = subparsers.add_parser("plan", help="discover voidable tables from the foreign-key graph and show the plan")
+    plan.add_argument("--refresh", action="store_true", help="ignore the plan cache and introspect again")
+    plan.set_defaults(func=cmd_plan)
+
+    lookup = subparsers.add_parser("lookup", help="look up a patient and check eligibility")
+    lookup.add_argument("identifier", help="ART identifier, e.g. IMO01104166")
+    lookup.add_argument("--adaptive-window", action="store_true",
+                       help="narrow the ±120 second window to the patient's bulk-void timestamps")
+    lookup.set_defaults(func=cmd_lookup)
+
+    preview = subparsers.add_parser("preview", help="dry run: count the rows each table would unvoid")
+    preview.add_argument("identifier", help="ART identifier, e.g. IMO01104166")
+    preview.add_argument("--adaptive-window", action="store_true",
+                       help="narrow the ±120 second window to the patient's bulk-void timestamps")
+    preview.set_defaults(func=cmd_preview)
+
+    unvoid = subparsers.add_parser("unvoid", help="unvoid a single patient")
+    unvoid.add_argument("identifier", help="ART identifier, e.g. IMO01104166")
+    unvoid.add_argument("--adaptive-window", action="store_true",
+                        help="narrow the ±120 second window to the patient's bulk-void timestamps")
+    unvoid.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    unvoid.add_argument("--chunked", action="store_true",
+                        help="unvoid visit/encounter/obs in bounded, journaled chunks")
+    unvoid.add_argument("--chunk-size", type=int, default=None,
+                        help="rows per chunk (default: chunk_size in config, else 5000)")
+    unvoid.set_defaults(func=cmd_unvoid)
+
+    resume = subparsers.add_parser("resume", help="finish an interrupted chunked unvoid")
+    resume.add_argument("operation_id", type=int, help="operation id shown when the unvoid started")
+    resume.set_defaults(func=cmd_resume)
+
+    rollback = subparsers.add_parser("rollback", help="re-void the chunks of an unfinished chunked unvoid")
+    rollback.add_argument("operation_id", type=int, help="operation id shown when the unvoid started")
+    rollback.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    rollback.set_defaults(func=cmd_rollback)
+
+    revert = subparsers.add_parser("revert", help="re-void exactly the rows a completed unvoid restored")
+    revert.add_argument("operation_id", type=int, help="operation id logged when the unvoid finished")
+    revert.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    revert.set_defaults(func=cmd_revert)
+
+    verify = subparsers.add_parser("verify", help="check the patients of an unvoid for orphan states (JSON report)")
+    verify.add_argument("operation_id", type=int, help="operation id logged when the unvoid finished")
+    verify.add_argument("--output", help="report path (default: report_directory in [verify], else log only)")
+    verify.set_defaults(func=cmd_verify)
+
+    bulk = subparsers.add_parser("bulk", help="unvoid every eligible patient listed in a CSV/text file")
+    bulk.add_argument("file", nargs="?", help="CSV/text file with one ART identifier per line")
+    bulk.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    bulk.add_argument("--helper-indexes", action="store_true",
+                      help="add missing idx_unvoid_* helper indexes for the run and drop the ones it created afterwards")
+    bulk.add_argument("--batch-size", type=int, nargs="?", const=DEFAULT_BATCH_SIZE, default=None,
+                      help=f"commit every N identifiers and checkpoint them in the local journal "
+                           f"(default N: {DEFAULT_BATCH_SIZE})")
+    bulk.add_argument("--resume", type=int, nargs="?", const=0, default=None, metavar="JOB_ID",
+                      help="continue a journaled job, skipping finished identifiers (default: latest unfinished job)")
+    bulk.add_argument("--journal", default=None,
+                      help=f"journal file (default: journal_file in config, else {DEFAULT_JOURNAL_FILE})")
+    bulk.set_defaults(func=cmd_bulk)
+
+    classify = subparsers.add_parser("classify", help="pre-flight: classify every identifier in a file and export a CSV report")
+    classify.add_argument("file", help="CSV/text file with one ART identifier per line")
+    classify.add_argument("--output", help="report path (default: <file>_eligibility.csv next to the input)")
+    classify.set_defaults(func=cmd_classify)
+
+    sites = subparsers.add_parser("sites", help="run lookup/preview/unvoid on every [database:<site>] in parallel")
+    sites.add_argument("action", choices=SITE_ACTIONS, help="what to run on each site")
+    sites.add_argument("file", help="CSV/text file with one ART identifier per line")
+    sites.add_argument("--sites", help="comma-separated site names (default: all [database:<site>] sections)")
+    sites.add_argument("--workers", type=int, default=None,
+                       help=f"sites run at the same time (default: workers in [sites], else {DEFAULT_SITE_WORKERS})")
+    sites.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    sites.set_defaults(func=cmd_sites)
+
+    events = subparsers.add_parser("events", help="list bulk void events (time clusters) with per-table counts")
+    events.add_argument("--bucket", type=int, default=VOID_WINDOW_SECONDS,
+                        help=f"cluster bucket width in seconds (default: {VOID_WINDOW_SECONDS})")
+    events.set_defaults(func=cmd_events)
+
+    unvoid_event = subparsers.add_parser("unvoid-event", help="unvoid every patient of one bulk void event")
+    unvoid_event.add_argument("start", type=timestamp, help="first patient date_voided of the event, 'YYYY-MM-DD HH:MM:SS'")
+    unvoid_event.add_argument("end", type=timestamp, help="last patient date_voided of the event, 'YYYY-MM-DD HH:MM:SS'")
+    unvoid_event.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    unvoid_event.set_defaults(func=cmd_unvoid_event)
+
+    index_check = subparsers.add_parser("index-check", help="report index coverage and EXPLAIN plans of the unvoid UPDATEs")
+    index_check.add_argument("--identifier", help="EXPLAIN with this patient's window (default: latest bulk-voided patient)")
+    index_check.add_argument("--create", action="store_true", help="create the suggested idx_unvoid_* helper indexes")
+    index_check.add_argument("--drop", action="store_true", help="drop all idx_unvoid_* helper indexes")
+    index_check.add_argument("--yes", action="store_true", help="skip the confirmation prompt")
+    index_check.set_defaults(func=cmd_index_check)
+
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point"""
+    args = build_parser().parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except ConfigError as e:
+        log(f"ERROR: {e}")
+        return EXIT_ERROR
+
+    open_session_log(config)
+
+    if args.func is cmd_sites:
+        try:
+            return cmd_sites(config, args)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            log(f"ERROR: Cannot read input file - {str(e)}")
+            return EXIT_ERROR
+
+    if not config.has_section('database'):
+        log(f"ERROR: Missing [database] section in {args.config} (only the sites command uses [database:<site>])")
+        return EXIT_ERROR
+
+    if getattr(args, 'adaptive_window', False):
+        config['settings']['adaptive_window'] = 'true'
+    engine = UnvoidEngine(config, log=log)
+    log(f"Database: {config['database']['database']} @ {config['database']['host']}")
+
+    try:
+        if engine.config['settings'].getboolean('discover_plan', fallback=False) and args.func is not cmd_plan:
+            PlanDiscovery(engine).apply()
+
+        return args.func(engine, args)
+
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        log(f"ERROR: Cannot read input file - {str(e)}")
+        return EXIT_ERROR
+
+    except sqlite3.Error as e:
+        log(f"ERROR: Batch journal failed - {str(e)}")
+        return EXIT_ERROR
+
+    except OperationError as e:
+        log(f"ERROR: {e}")
+        return EXIT_BLOCKED
+
+    except Error as e:
+        log(f"ERROR: Database operation failed - {str(e)}")
+        return EXIT_ERROR
+
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Unvoid Database Connections - CCFN OpenMRS
+==========================================
+Small connection pool used by the unvoid engine.
+
+- Ping-based validation of connections that have been idle for a while
+  (a socket closed by the server's wait_timeout still reports .open)
+- Automatic reconnect with exponential backoff
+- Session tuning from the [session] section of unvoid_config.ini
+  (innodb_lock_wait_timeout, isolation level, autocommit)
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import pymysql as mysql_connector
+from pymysql.constants import CLIENT
+from pymysql.err import Error
+
+from unvoid_metrics import InstrumentedCursor
+
+
+ISOLATION_LEVELS = ('READ UNCOMMITTED', 'READ COMMITTED', 'REPEATABLE READ', 'SERIALIZABLE')
+
+
+class ConnectionPool:
+    """Validated, session-tuned pymysql connections for one database"""
+
+    def __init__(self, config, section='database', multi_statements=False, log=None):
+        self.config = config
+        self.section = section
+        self.multi_statements = multi_statements
+        self.log = log or (lambda message: None)
+
+        session = config['session'] if config.has_section('session') else {}
+        self.size = int(session.get('pool_size', 2))
+        self.validate_after = float(session.get('validate_after', 30))
+        self.reconnect_attempts = int(session.get('reconnect_attempts', 3))
+        self.reconnect_backoff = float(session.get('reconnect_backoff', 0.5))
+        self.connect_timeout = int(session.get('connect_timeout', 10))
+        self.lock_wait_timeout = session.get('innodb_lock_wait_timeout', '').strip()
+        self.isolation_level = session.get('isolation_level', '').strip().upper()
+        self.autocommit = str(session.get('autocommit', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+        self._idle = []
+        self._last_used = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Open one new connection and apply the session settings"""
+
+        database = self.config[self.section]
+        conn = mysql_connector.connect(
+            host=database['host'],
+            user=database['user'],
+            password=database['password'],
+            database=database['database'],
+            port=int(database.get('port', 3306)),
+            connect_timeout=self.connect_timeout,
+            autocommit=self.autocommit,
+            cursorclass=InstrumentedCursor,
+            client_flag=CLIENT.MULTI_STATEMENTS if self.multi_statements else 0
+        )
+
+        try:
+            with conn.cursor() as cursor:
+                if self.lock_wait_timeout:
+                    cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (int(self.lock_wait_timeout),))
+                if self.isolation_level:
+                    cursor.execute(f"SET SESSION TRANSACTION ISOLATION LEVEL {self.isolation_level}")
+        except Error:
+            conn.close()
+            raise
+
+        self._last_used[conn] = time.monotonic()
+        return conn
+
+    def open(self):
+        """Open a connection, retrying with exponential backoff"""
+
+        delay = self.reconnect_backoff
+        for attempt in range(1, self.reconnect_attempts + 1):
+            try:
+                return self.connect()
+            except Error as e:
+                if attempt == self.reconnect_attempts:
+                    raise
+                self.log(f"WARNING: Connection attempt {attempt} failed - {str(e)}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+
+    def validate(self, conn):
+        """Return True if conn is usable; pings only after validate_after idle seconds"""
+
+        if not conn.open:
+            return False
+
+        idle = time.monotonic() - self._last_used.get(conn, 0)
+        if idle >= self.validate_after:
+            try:
+                conn.ping(reconnect=False)
+            except Error:
+                return False
+
+        self._last_used[conn] = time.monotonic()
+        return True
+
+    def acquire(self):
+        """Borrow a validated connection, opening a new one if none is idle"""
+
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                return self.open()
+
+            if self.validate(conn):
+                return conn
+
+            self.discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool (closed if the pool is full)"""
+
+        if not conn.open:
+            return
+
+        try:
+            if not self.autocommit:
+                conn.rollback()
+        except Error:
+            self.discard(conn)
+            return
+
+        self._last_used[conn] = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+
+        conn.close()
+
+    def discard(self, conn):
+        """Drop a broken connection"""
+        try:
+            if conn.open:
+                conn.close()
+        except Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """``with pool.connection() as conn:`` borrow and return a connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self.discard(conn)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Unvoid Plan Discovery - CCFN OpenMRS
+====================================
+Builds the unvoid plan from the database's own foreign keys instead of the
+hand-picked table list, so tables such as orders, allergy or cohort_member
+are not left voided after a bulk void.
+
+- Walks the foreign-key graph from person/patient in information_schema
+- Keeps tables carrying voided, voided_by, date_voided and void_reason
+- Tables pointing at person/patient directly become plan steps, matched on
+  every referencing column (relationship.person_a OR person_b); deeper ones
+  (reached only through another table) are reported
+- The hand-picked plan is always kept, first and in its own order
+- The result is cached on disk, keyed by the OpenMRS schema version
+  (liquibasechangelog), so startup does not repeat the introspection
+
+Enabled with ``discover_plan = true`` in [settings] of unvoid_config.ini.
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+from pymysql.err import Error
+
+from unvoid_engine import UNVOID_PLAN, UnvoidStep
+from unvoid_metrics import InstrumentedDictCursor
+
+
+DEFAULT_PLAN_CACHE = 'unvoid_plan_cache.json'
+
+PLAN_ROOTS = ('person', 'patient')
+
+# Columns written by UNVOID_SET and copied to nmrs_unvoid_undo
+VOID_COLUMNS = ('voided', 'voided_by', 'date_voided', 'void_reason')
+
+# Preferred first key column when a table references person/patient more than once
+KEY_COLUMN_PREFERENCE = ('patient_id', 'person_id')
+
+ER_NO_SUCH_TABLE = 1146
+
+# Sites discovered in parallel share one cache file
+_cache_lock = threading.Lock()
+
+
+class PlanDiscovery:
+    """Discovers and caches the unvoid plan of an UnvoidEngine's database"""
+
+    def __init__(self, engine, cache_file=None):
+        self.engine = engine
+        self.log = engine.log
+        settings = engine.config['settings']
+        self.cache_file = cache_file or settings.get('plan_cache', DEFAULT_PLAN_CACHE)
+
+    @property
+    def cache_key(self):
+        database = self.engine.config[self.engine.section]
+        return f"{database['host']}:{database.get('port', 3306)}/{database['database']}"
+
+    def schema_version(self, cursor):
+        """Fingerprint of the OpenMRS schema; changes whenever a changeset is applied"""
+
+        try:
+            cursor.execute("SELECT COUNT(*) AS changesets, MAX(DATEEXECUTED) AS last_run FROM liquibasechangelog")
+            row = cursor.fetchone()
+            return f"liquibase:{row['changesets']}:{row['last_run']}"
+        except Error as e:
+            if e.args[0] != ER_NO_SUCH_TABLE:
+                raise
+
+        # Not a liquibase-managed database: fall back to the table dictionary
+        cursor.execute("""
+            SELECT COUNT(*) AS tables, MAX(CREATE_TIME) AS last_created
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        row = cursor.fetchone()
+        return f"tables:{row['tables']}:{row['last_created']}"
+
+    def foreign_keys(self, cursor):
+        """Return {referenced_table: [(table, column)]} for single-column foreign keys"""
+
+        cursor.execute("""
+            SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name,
+                   REFERENCED_TABLE_NAME AS referenced_table
+            FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND REFERENCED_TABLE_SCHEMA = DATABASE()
+              AND REFERENCED_TABLE_NAME IS NOT NULL
+            ORDER BY TABLE_NAME, COLUMN_NAME
+        """)
+
+        children = {}
+        for row in cursor.fetchall():
+            children.setdefault(row['referenced_table'], []).append((row['table_name'], row['column_name']))
+        return children
+
+    def voidable_tables(self, cursor):
+        """Return {table: primary_key_column} for tables with every void column and a one-column key"""
+
+        placeholders = ", ".join(["%s"] * len(VOID_COLUMNS))
+        cursor.execute(f"""
+            SELECT c.TABLE_NAME AS table_name, MIN(k.COLUMN_NAME) AS pk_column,
+                   COUNT(DISTINCT k.COLUMN_NAME) AS pk_columns
+            FROM information_schema.COLUMNS c
+            JOIN information_schema.KEY_COLUMN_USAGE k
+              ON k.TABLE_SCHEMA = c.TABLE_SCHEMA
+             AND k.TABLE_NAME = c.TABLE_NAME
+             AND k.CONSTRAINT_NAME = 'PRIMARY'
+            WHERE c.TABLE_SCHEMA = DATABASE()
+              AND c.COLUMN_NAME IN ({placeholders})
+            GROUP BY c.TABLE_NAME
+            HAVING COUNT(DISTINCT c.COLUMN_NAME) = %s
+        """, list(VOID_COLUMNS) + [len(VOID_COLUMNS)])
+
+        return {row['table_name']: row['pk_column'] for row in cursor.fetchall() if row['pk_columns'] == 1}
+
+    def walk(self, children, voidable):
+        """Breadth-first walk from PLAN_ROOTS
+
+        Returns ``(direct, indirect)``: direct is {table: [key columns]} for
+        voidable tables referencing a root; indirect is {table: path} for
+        voidable tables only reachable through another table.
+        """
+
+        direct = {}
+        indirect = {}
+        seen = set(PLAN_ROOTS)
+        queue = [(root, [root]) for root in PLAN_ROOTS]
+
+        while queue:
+            parent, path = queue.pop(0)
+            for table, column in children.get(parent, []):
+                if parent in PLAN_ROOTS and table in voidable:
+                    direct.setdefault(table, []).append(column)
+                if table in seen:
+                    continue
+                seen.add(table)
+                if parent not in PLAN_ROOTS and table in voidable and table not in direct:
+                    indirect[table] = path + [table]
+                queue.append((table, path + [table]))
+
+        # A table reached directly later in the walk is not indirect
+        for table in direct:
+            indirect.pop(table, None)
+        return direct, indirect
+
+    def discover(self, cursor):
+        """Introspect the database; returns the plan and the indirect tables
+
+        Plan entries are ``(table, key_column, pk_column, other_key_columns)``.
+        """
+
+        voidable = self.voidable_tables(cursor)
+        direct, indirect = self.walk(self.foreign_keys(cursor), voidable)
+
+        known = {step.table for step in UNVOID_PLAN}
+        steps = [(step.table, step.key_column, step.pk_column, list(step.key_columns[1:])) for step in UNVOID_PLAN]
+
+        for table in sorted(direct):
+            if table in known:
+                continue
+            columns = sorted(set(direct[table]))
+            key_column = next((column for column in KEY_COLUMN_PREFERENCE if column in columns), columns[0])
+            other_key_columns = [column for column in columns if column != key_column]
+            steps.append((table, key_column, voidable[table], other_key_columns))
+
+        return steps, {table: ' -> '.join(path) for table, path in sorted(indirect.items())}
+
+    def read_cache(self):
+        try:
+            with open(self.cache_file, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.log(f"WARNING: Ignoring plan cache {self.cache_file} - {str(e)}")
+            return {}
+
+    def write_cache(self, entry):
+        """Store this database's entry, keeping the other databases' ones"""
+        with _cache_lock:
+            cache = self.read_cache()
+            cache[self.cache_key] = entry
+            try:
+                temp_path = f"{self.cache_file}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f, indent=2)
+                os.replace(temp_path, self.cache_file)
+            except OSError as e:
+                self.log(f"WARNING: Cannot write plan cache {self.cache_file} - {str(e)}")
+
+    def load(self, refresh=False):
+        """Return the cached plan entry for this database, rediscovering it if the schema changed
+
+        The entry is a dict with ``schema_version``, ``discovered_at``,
+        ``steps`` and ``indirect``.
+        """
+
+        conn = self.engine.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+
+        try:
+            version = self.schema_version(cursor)
+            entry = self.read_cache().get(self.cache_key)
+
+            if entry and entry.get('schema_version') == version and not refresh:
+                conn.commit()
+                return entry
+
+            self.log(f"Discovering unvoid plan from foreign keys (schema {version})...")
+            steps, indirect = self.discover(cursor)
+            conn.commit()
+
+        except Error as e:
+            conn.rollback()
+            self.log(f"ERROR: Plan discovery failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        entry = {
+            'schema_version': version,
+            'discovered_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'steps': steps,
+            'indirect': indirect,
+        }
+        self.write_cache(entry)
+        return entry
+
+    def build_plan(self, entry):
+        """UnvoidSteps for a cache entry; hand-picked steps keep their predicates and flags"""
+
+        known = {step.table: step for step in UNVOID_PLAN}
+        # Entries cached before other_key_columns existed have three fields
+        return tuple(
+            known.get(table) or UnvoidStep(table, key_column, pk_column,
+                                           other_key_columns=other_key_columns[0] if other_key_columns else ())
+            for table, key_column, pk_column, *other_key_columns in entry['steps']
+        )
+
+    def apply(self, refresh=False):
+        """Load the plan and install it on the engine; returns the plan"""
+
+        entry = self.load(refresh)
+        self.engine.plan = self.build_plan(entry)
+
+        extra = [step.table for step in self.engine.plan[len(UNVOID_PLAN):]]
+        self.log(f"Unvoid plan: {len(self.engine.plan)} table(s), discovered {entry['discovered_at']}")
+        if extra:
+            self.log(f"  Added from foreign keys: {', '.join(extra)}")
+        for step in self.engine.plan:
+            if len(step.key_columns) > 1:
+                self.log(f"  {step.table} matched on {' OR '.join(step.key_columns)}")
+        for table, path in entry['indirect'].items():
+            self.log(f"  [NOT IN PLAN] {table} (reached via {path}; no direct person/patient key)")
+
+        return self.engine.plan
@@ -0,0 +1,2163 @@
+#!/usr/bin/env python3
+"""
+Unvoid Engine - CCFN OpenMRS
+============================
+GUI-free database logic shared by the Patient Unvoid Tool and its CLI.
+
+- Patient lookup by ART Identifier
+- Eligibility check (void_reason + date_voided timestamp)
+- Declarative, table-driven unvoid plan (±120 seconds)
+- Dry-run preview of per-table row counts
+- Single-patient and bulk execution
+- Chunked execution with a resumable journal for large footprints
+- Audit trail in nmrs_unvoid_audit
+
+This module never imports tkinter, so it can run from cron, ETL boxes or
+on the database host itself. Progress is reported through plain
+``log(message)`` and ``progress(done, total, label)`` callbacks supplied by
+the caller, which may run the engine on a worker thread and call
+``cancel()`` from another one.
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import configparser
+import csv
+import functools
+import hashlib
+import logging
+import logging.handlers
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from pymysql.err import Error
+
+from unvoid_backup import BACKUP_FORMATS, RowBackup
+from unvoid_db import ISOLATION_LEVELS, ConnectionPool
+from unvoid_metrics import InstrumentedDictCursor, StatementMetrics, instrumented
+from unvoid_schema import SCHEMA_VERSION, installed_version, migrate
+from unvoid_verify import Verifier
+
+
+REQUIRED_VOID_REASON = 'Bulk void via ART/DATIM mapping'
+VOID_WINDOW_SECONDS = 120
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Adaptive window: largest gap (seconds) between void timestamps of one
+# patient's bulk void
+DEFAULT_ADAPTIVE_GAP = 30
+
+# MySQL errors after which the whole transaction can simply be run again
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+TRANSIENT_ERRORS = {
+    ER_LOCK_WAIT_TIMEOUT: 'lock wait timeout',
+    ER_LOCK_DEADLOCK: 'deadlock',
+}
+
+# Named databases for multi-site runs: [database:<site>]
+SITE_SECTION_PREFIX = 'database:'
+
+# Persistent session log shared by the GUI and the CLI
+SESSION_LOGGER = 'unvoid.session'
+DEFAULT_LOG_FILE = 'unvoid_session.log'
+
+# SET clause shared by every unvoid statement; {t} is the table alias prefix
+UNVOID_SET = """
+    SET {t}voided = 0,
+        {t}voided_by = NULL,
+        {t}date_voided = NULL,
+        {t}void_reason = NULL
+"""
+
+
+class UnvoidStep:
+    """One table in the declarative unvoid plan
+
+    A step unvoids the rows of ``table`` that belong to the patient through
+    ``key_column`` and were voided inside the patient's time window. Tables
+    referencing the patient from several columns (relationship.person_a and
+    person_b) list the others in ``other_key_columns``; a row matches on any
+    of them. ``predicates`` are extra ``(sql, params)`` conditions where ``{t}`` stands
+    for the table alias prefix. ``chunked`` steps are walked in ``pk_column``
+    ranges by the chunked unvoid; ``required`` steps warn when nothing matched.
+    """
+
+    def __init__(self, table, key_column, pk_column, predicates=(), chunked=False, required=False,
+                 other_key_columns=()):
+        self.table = table
+        self.key_column = key_column
+        self.key_columns = (key_column,) + tuple(other_key_columns)
+        self.pk_column = pk_column
+        self.predicates = tuple(predicates)
+        self.chunked = chunked
+        self.required = required
+
+    def __repr__(self):
+        return f"UnvoidStep({self.table!r}, {self.key_column!r}, {self.pk_column!r})"
+
+    def conditions(self, alias=''):
+        """Return ``voided = 1`` plus the extra predicates, and their params"""
+        t = f"{alias}." if alias else ""
+        sql = [f"{t}voided = 1"]
+        params = []
+        for predicate, predicate_params in self.predicates:
+            sql.append(predicate.format(t=t))
+            params.extend(predicate_params)
+        return " AND ".join(sql), params
+
+    def key_match(self, value, alias=''):
+        """``key_column = value``, OR'ed over every key column"""
+        t = f"{alias}." if alias else ""
+        matches = [f"{t}{column} = {value}" for column in self.key_columns]
+        return matches[0] if len(matches) == 1 else f"({' OR '.join(matches)})"
+
+    def patient_where(self, patient_id, time_start, time_end, pk_low=None, pk_high=None):
+        """WHERE clause for one patient's window, optionally a primary-key range"""
+        conditions, params = self.conditions()
+        sql = (f"WHERE {self.key_match('%s')} AND {conditions} "
+               f"AND date_voided BETWEEN %s AND %s")
+        params = [patient_id] * len(self.key_columns) + params + [time_start, time_end]
+        if pk_low is not None:
+            sql += f" AND {self.pk_column} BETWEEN %s AND %s"
+            params += [pk_low, pk_high]
+        return sql, params
+
+    def batch_join(self, batch_table='tmp_unvoid_batch'):
+        """JOIN to the batch of patients (table alias ``t``, batch alias ``b``)"""
+        return f"JOIN {batch_table} b ON {self.key_match('b.patient_id', 't')}"
+
+    def batch_where(self):
+        """WHERE clause applying each batch patient's own window"""
+        conditions, params = self.conditions('t')
+        sql = f"WHERE {conditions} AND t.date_voided BETWEEN b.time_start AND b.time_end"
+        return sql, params
+
+
+# IMPORTANT: Only the patient table has void_reason set during bulk void.
+# Other tables only have date_voided timestamp, so they are matched on the
+# time window alone.
+BULK_VOID_REASON_CHECK = ("{t}void_reason = %s", (REQUIRED_VOID_REASON,))
+
+# Every execution path (single, bulk, chunked, preview, rollback) walks the
+# plan in this order, so the tool always takes row locks in the same order.
+UNVOID_PLAN = (
+    UnvoidStep('patient', 'patient_id', 'patient_id',
+               predicates=[BULK_VOID_REASON_CHECK], required=True),
+    UnvoidStep('patient_identifier', 'patient_id', 'patient_identifier_id'),
+    UnvoidStep('patient_program', 'patient_id', 'patient_program_id'),
+    UnvoidStep('person', 'person_id', 'person_id'),
+    UnvoidStep('person_name', 'person_id', 'person_name_id'),
+    UnvoidStep('person_address', 'person_id', 'person_address_id'),
+    UnvoidStep('person_attribute', 'person_id', 'person_attribute_id'),
+    UnvoidStep('visit', 'patient_id', 'visit_id', chunked=True),
+    UnvoidStep('encounter', 'patient_id', 'encounter_id', chunked=True),
+    UnvoidStep('obs', 'person_id', 'obs_id', chunked=True),
+)
+
+# Lookup results
+STATUS_ELIGIBLE = 'eligible'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_NOT_VOIDED = 'not_voided'
+STATUS_WRONG_REASON = 'wrong_reason'
+STATUS_MISSING_TIMESTAMP = 'missing_timestamp'
+
+# Chunked operation states (nmrs_unvoid_operation.status)
+OPERATION_RUNNING = 'RUNNING'
+OPERATION_FAILED = 'FAILED'
+OPERATION_SUCCESS = 'SUCCESS'
+OPERATION_ROLLED_BACK = 'ROLLED_BACK'
+OPERATION_REVERTED = 'REVERTED'
+
+# Kinds of operation (nmrs_unvoid_operation.operation_type)
+OPERATION_TYPE_SINGLE = 'SINGLE'
+OPERATION_TYPE_CHUNKED = 'CHUNKED'
+OPERATION_TYPE_BULK = 'BULK'
+
+# Optional server-side single-patient unvoid (stored_procedure = true). Bump
+# the version when the generated body changes; plan changes are caught by the
+# digest of the body kept in the routine's COMMENT.
+PROCEDURE_NAME = 'nmrs_unvoid_patient'
+PROCEDURE_VERSION = 2
+
+
+class ConfigError(Exception):
+    """Raised when unvoid_config.ini is missing or incomplete"""
+
+
+class OperationError(Exception):
+    """Raised when a journaled operation cannot be resumed or rolled back"""
+
+
+class OperationCancelled(Exception):
+    """Raised when the operator cancels a running operation"""
+
+
+def load_config(path="unvoid_config.ini"):
+    """Load database configuration"""
+
+    config_file = Path(path)
+
+    if not config_file.exists():
+        raise ConfigError(
+            f"Configuration file not found: {config_file}\n\n"
+            "Please create unvoid_config.ini with database settings."
+        )
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    if not config.has_section('database') and not site_sections(config):
+        raise ConfigError(f"Missing [database] section in {config_file}")
+
+    if not config.has_section('settings'):
+        config.add_section('settings')
+
+    isolation_level = config.get('session', 'isolation_level', fallback='').strip().upper()
+    if isolation_level and isolation_level not in ISOLATION_LEVELS:
+        raise ConfigError(
+            f"Invalid isolation_level '{isolation_level}' in [session] of {config_file}\n\n"
+            f"Use one of: {', '.join(ISOLATION_LEVELS)}"
+        )
+
+    backup_format = config.get('backup', 'format', fallback='csv').strip().lower()
+    if backup_format not in BACKUP_FORMATS:
+        raise ConfigError(
+            f"Invalid format '{backup_format}' in [backup] of {config_file}\n\n"
+            f"Use one of: {', '.join(BACKUP_FORMATS)}"
+        )
+
+    return config
+
+
+def retry_transient(method):
+    """Re-run an UnvoidEngine transaction after a deadlock or lock wait timeout
+
+    The method must roll back before raising. Waits are jittered and grow
+    exponentially (retry_backoff, retry_max_backoff) for at most
+    retry_attempts re-runs; the current attempt number is kept on
+    ``self.attempt`` for the audit trail and every retry is counted in the
+    metrics. Cancelling during a wait stops the retries. While it runs,
+    ``self.retry_reason`` tells the method whether a failure will be retried.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        attempt = 1
+        self.retrying = True
+        try:
+            while True:
+                self.attempt = attempt
+                try:
+                    return method(self, *args, **kwargs)
+                except Error as e:
+                    reason = self.retry_reason(e)
+                    if reason is None:
+                        raise
+
+                delay = random.uniform(0, min(self.retry_max_backoff, self.retry_backoff * 2 ** (attempt - 1)))
+                self.metrics.retry(reason)
+                self.log(f"WARNING: Transaction hit a {reason} - retrying in {delay:.2f}s "
+                         f"(attempt {attempt + 1} of {self.retry_attempts + 1})")
+                if self.cancel_event.wait(delay):
+                    self.log("CANCELLED: Retry abandoned at operator request")
+                    raise OperationCancelled("Operation cancelled by operator")
+                attempt += 1
+        finally:
+            self.attempt = 1
+            self.retrying = False
+
+    return wrapper
+
+
+def window_label(patient):
+    """Describe a patient's unvoid window relative to date_voided for logs and audit remarks
+
+    '±120sec' for the fixed window, '-3s/+14s' for an adaptive one.
+    """
+    anchor = patient['patient_date_voided']
+    before = int((anchor - patient['time_start']).total_seconds())
+    after = int((patient['time_end'] - anchor).total_seconds())
+    if before == after == VOID_WINDOW_SECONDS:
+        return f"±{VOID_WINDOW_SECONDS}sec"
+    return f"-{before}s/+{after}s"
+
+
+def site_sections(config):
+    """Return {site: section} for every [database:<site>] section, in file order"""
+    return {
+        section.split(':', 1)[1].strip(): section
+        for section in config.sections()
+        if section.startswith(SITE_SECTION_PREFIX)
+    }
+
+
+def open_session_log(config):
+    """Attach the rotating on-disk session log configured in [logging]
+
+    Returns the session logger. Every line shown to the operator should be
+    passed to ``logger.info``. An empty ``log_file`` disables the file.
+    """
+
+    logger = logging.getLogger(SESSION_LOGGER)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    log_file = config.get('logging', 'log_file', fallback=DEFAULT_LOG_FILE).strip()
+    if not log_file or logger.handlers:
+        return logger
+
+    handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=config.getint('logging', 'max_bytes', fallback=1024 * 1024),
+        backupCount=config.getint('logging', 'backup_count', fallback=5),
+        encoding='utf-8'
+    )
+    handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    logger.addHandler(handler)
+
+    return logger
+
+
+def read_identifiers(path):
+    """Read ART identifiers from a CSV or plain text file
+
+    The first column of every row is used. Blank lines, lines starting with
+    '#' and a leading header row are skipped. Duplicates are dropped while
+    keeping the original order.
+    """
+
+    identifiers = []
+    seen = set()
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row_number, row in enumerate(csv.reader(f)):
+            if not row:
+                continue
+
+            value = row[0].strip()
+            if not value or value.startswith('#'):
+                continue
+
+            if row_number == 0 and value.lower().replace('_', ' ') in (
+                    'identifier', 'art identifier', 'art number', 'art id'):
+                continue
+
+            if value not in seen:
+                seen.add(value)
+                identifiers.append(value)
+
+    return identifiers
+
+
+# Columns of the eligibility report written by write_eligibility_report
+ELIGIBILITY_COLUMNS = (
+    'identifier', 'status', 'patient_id', 'patient_name', 'void_reason',
+    'date_voided', 'time_start', 'time_end',
+)
+
+
+def write_eligibility_report(path, results):
+    """Write classify_identifiers results to a CSV file"""
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ELIGIBILITY_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+class UnvoidEngine:
+    """Headless lookup, eligibility check, unvoid and audit"""
+
+    def __init__(self, config, log=None, plan=UNVOID_PLAN, progress=None, section='database'):
+        self.config = config
+        self.section = section
+        self.connection = None
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda done, total, label: None)
+        self.plan = plan
+        self.cancel_event = threading.Event()
+        self.pool = ConnectionPool(config, section=section, multi_statements=self.batch_statements, log=self.log)
+        self.metrics = StatementMetrics(config, log=self.log)
+        self.backup = RowBackup(config, log=self.log)
+        self.verifier = Verifier(config, log=self.log)
+        self.schema_version = None
+        self.last_operation_id = None
+        self.attempt = 1
+        self.retrying = False
+        self.procedure_digest = None
+
+    @property
+    def admin_name(self):
+        return self.config['settings'].get('admin_name', 'Administrator')
+
+    @property
+    def chunked(self):
+        return self.config['settings'].getboolean('chunked_unvoid', fallback=False)
+
+    @property
+    def chunk_size(self):
+        return self.config['settings'].getint('chunk_size', fallback=DEFAULT_CHUNK_SIZE)
+
+    @property
+    def retry_attempts(self):
+        return self.config.getint('session', 'retry_attempts', fallback=3)
+
+    @property
+    def retry_backoff(self):
+        return self.config.getfloat('session', 'retry_backoff', fallback=0.2)
+
+    @property
+    def retry_max_backoff(self):
+        return self.config.getfloat('session', 'retry_max_backoff', fallback=5.0)
+
+    @property
+    def adaptive_window(self):
+        return self.config['settings'].getboolean('adaptive_window', fallback=False)
+
+    @property
+    def adaptive_gap(self):
+        return self.config['settings'].getint('adaptive_gap', fallback=DEFAULT_ADAPTIVE_GAP)
+
+    @property
+    def batch_statements(self):
+        return self.config['settings'].getboolean('batch_statements', fallback=False)
+
+    @property
+    def stored_procedure(self):
+        return self.config['settings'].getboolean('stored_procedure', fallback=False)
+
+    def connect(self):
+        """Open a new, unpooled database connection"""
+        return self.pool.connect()
+
+    def test_connection(self):
+        """Test database connection, raising Error on failure
+
+        The connection is kept and reused by the first operation.
+        """
+        self.get_connection()
+
+    def get_connection(self):
+        """Get database connection, raising Error on failure
+
+        The cached connection is pinged if it has been idle for longer than
+        ``validate_after`` and transparently replaced if the server dropped it.
+        """
+        if self.connection is not None:
+            if self.pool.validate(self.connection):
+                return self.connection
+
+            self.log("Database connection lost - reconnecting...")
+            self.pool.discard(self.connection)
+            self.connection = None
+
+        self.connection = self.pool.acquire()
+        self.connection.metrics = self.metrics
+        return self.connection
+
+    def close(self):
+        """Return the cached connection and close the pool"""
+        if self.connection is not None:
+            self.pool.release(self.connection)
+        self.connection = None
+        self.pool.close()
+
+    def ensure_schema(self):
+        """Bootstrap or upgrade the tool's tables once per engine
+
+        The first call reads the installed version and applies pending
+        migrations; later calls return the cached version without touching
+        the database, so unvoid transactions never run DDL.
+        """
+
+        if self.schema_version is not None:
+            return self.schema_version
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            version = installed_version(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+
+        if version < SCHEMA_VERSION:
+            applied = migrate(conn, log=self.log)
+            if applied:
+                self.log(f"Schema upgraded from version {version} to {SCHEMA_VERSION}")
+            version = SCHEMA_VERSION
+        elif version > SCHEMA_VERSION:
+            self.log(f"WARNING: Database schema version {version} is newer than this tool "
+                     f"(version {SCHEMA_VERSION}); please upgrade the tool")
+
+        self.schema_version = version
+
+        if self.stored_procedure:
+            self.ensure_procedure()
+
+        return version
+
+    def procedure_sql(self, cursor):
+        """CREATE PROCEDURE statement implementing unvoid_patient for the current plan
+
+        Returns ``(sql, digest)``. The procedure applies the same eligibility
+        check, window, undo capture, audit and audit detail as the
+        client-side path, inside the caller's transaction, and returns one
+        row: operation_id, audit_id, then the rows unvoided per plan step.
+        """
+
+        required_reason = cursor.mogrify("%s", (REQUIRED_VOID_REASON,))
+        declares = []
+        statements = []
+        details = []
+        for index, step in enumerate(self.plan, 1):
+            conditions, params = step.conditions()
+            where = (f"WHERE {step.key_match('p_patient_id')} AND {cursor.mogrify(conditions, params)} "
+                     f"AND date_voided BETWEEN p_time_start AND p_time_end")
+            declares.append(f"DECLARE v_rows_{index} INT DEFAULT 0;")
+            statements.append(f"""
+    INSERT IGNORE INTO nmrs_unvoid_undo
+    (operation_id, table_name, row_id, patient_id, voided_by, date_voided, void_reason)
+    SELECT v_operation_id, '{step.table}', {step.pk_column}, p_patient_id, voided_by, date_voided, void_reason
+    FROM {step.table}
+    {where};
+    UPDATE {step.table} {UNVOID_SET.format(t='')} {where};
+    SET v_rows_{index} = ROW_COUNT();""")
+            details.append(f"(v_audit_id, '{step.table}', v_rows_{index}, p_time_start, p_time_end)")
+
+        rows = [f"v_rows_{index}" for index in range(1, len(self.plan) + 1)]
+        declare_block = "\n    ".join(declares)
+        body = f"""
+BEGIN
+    DECLARE v_operation_id INT;
+    DECLARE v_audit_id INT;
+    DECLARE v_total INT;
+    {declare_block}
+
+    IF NOT EXISTS (SELECT 1 FROM patient
+                   WHERE patient_id = p_patient_id
+                     AND void_reason = {required_reason}
+                     AND date_voided IS NOT NULL) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '{PROCEDURE_NAME}: patient is not eligible';
+    END IF;
+
+    INSERT INTO nmrs_unvoid_operation
+    (operation_type, identifier, patient_id, patient_name, window_start, window_end, status, executed_by)
+    VALUES ('{OPERATION_TYPE_SINGLE}', p_identifier, p_patient_id, p_patient_name, p_time_start, p_time_end,
+            '{OPERATION_RUNNING}', p_executed_by);
+    SET v_operation_id = LAST_INSERT_ID();
+{''.join(statements)}
+
+    SET v_total = {' + '.join(rows)};
+
+    INSERT INTO nmrs_unvoid_audit
+    (identifier, patient_id, patient_name, executed_by, action_status, attempts, remarks)
+    VALUES (p_identifier, p_patient_id, p_patient_name, p_executed_by, 'SUCCESS', p_attempts,
+            CONCAT('Timestamp-based unvoid: ', p_void_timestamp, ' (', p_window, '). ',
+                   'Range: ', p_time_start, ' to ', p_time_end, '. ',
+                   'Total: ', v_total, ' records. ',
+                   'void_reason: ', {required_reason}));
+    SET v_audit_id = LAST_INSERT_ID();
+
+    INSERT INTO nmrs_unvoid_audit_detail
+    (audit_id, table_name, rows_affected, window_start, window_end)
+    VALUES {', '.join(details)};
+
+    UPDATE nmrs_unvoid_operation
+    SET status = '{OPERATION_SUCCESS}', finished_at = NOW()
+    WHERE operation_id = v_operation_id;
+
+    SELECT v_operation_id, v_audit_id, {', '.join(rows)};
+END"""
+
+        digest = hashlib.sha1(body.encode('utf-8')).hexdigest()[:12]
+        sql = f"""
+CREATE PROCEDURE {PROCEDURE_NAME} (
+    IN p_patient_id INT,
+    IN p_identifier VARCHAR(50),
+    IN p_patient_name VARCHAR(255),
+    IN p_void_timestamp DATETIME,
+    IN p_time_start DATETIME,
+    IN p_time_end DATETIME,
+    IN p_window VARCHAR(40),
+    IN p_executed_by VARCHAR(100),
+    IN p_attempts SMALLINT
+)
+MODIFIES SQL DATA
+COMMENT 'nmrs_unvoid v{PROCEDURE_VERSION} {digest}'
+{body}"""
+        return sql, digest
+
+    def ensure_procedure(self):
+        """Install or upgrade the unvoid procedure when its version or plan changed
+
+        Returns True when the procedure is usable. The installed version is
+        read from the routine's COMMENT; the check is cached until the plan
+        changes. If the procedure cannot be installed (e.g. no CREATE ROUTINE
+        privilege) unvoids fall back to client-side statements.
+        """
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            sql, digest = self.procedure_sql(cursor)
+            if digest == self.procedure_digest:
+                return True
+
+            cursor.execute("""
+                SELECT ROUTINE_COMMENT
+                FROM information_schema.ROUTINES
+                WHERE ROUTINE_SCHEMA = DATABASE()
+                  AND ROUTINE_NAME = %s
+                  AND ROUTINE_TYPE = 'PROCEDURE'
+            """, (PROCEDURE_NAME,))
+            row = cursor.fetchone()
+            installed = row[0] if row else None
+            conn.commit()
+
+            if installed != f"nmrs_unvoid v{PROCEDURE_VERSION} {digest}":
+                self.log(f"Installing stored procedure {PROCEDURE_NAME} "
+                         f"(v{PROCEDURE_VERSION}, {len(self.plan)} tables)"
+                         + (f", replacing '{installed}'" if installed else "") + "...")
+                cursor.execute(f"DROP PROCEDURE IF EXISTS {PROCEDURE_NAME}")
+                cursor.execute(sql)
+                self.log(f"  [OK] {PROCEDURE_NAME} installed")
+
+            self.procedure_digest = digest
+            return True
+
+        except Error as e:
+            conn.rollback()
+            self.procedure_digest = None
+            self.log(f"WARNING: Stored procedure {PROCEDURE_NAME} unavailable - {str(e)}")
+            self.log(f"         Unvoids use client-side statements")
+            return False
+
+        finally:
+            cursor.close()
+
+    def _call_procedure(self, cursor, patient):
+        """Unvoid one patient with a single CALL; returns (operation_id, counts)"""
+
+        self.log(f"Unvoiding {len(self.plan)} tables with CALL {PROCEDURE_NAME}...")
+        started = time.perf_counter()
+        cursor.execute(f"CALL {PROCEDURE_NAME}(%s, %s, %s, %s, %s, %s, %s, %s, %s)", (
+            patient['patient_id'], patient['identifier'], patient['patient_name'],
+            patient['patient_date_voided'], patient['time_start'], patient['time_end'],
+            window_label(patient), self.admin_name, self.attempt
+        ))
+        row = cursor.fetchone()
+        while cursor.nextset():
+            pass
+
+        counts = {step.table: int(rows) for step, rows in zip(self.plan, row[2:])}
+        for step in self.plan:
+            self._log_step(step, counts[step.table])
+        self.log(f"  Procedure completed in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return row[0], counts
+
+    def _begin(self, conn):
+        """Start an explicit transaction when the session runs in autocommit"""
+        if conn.get_autocommit():
+            conn.begin()
+
+    def cancel(self):
+        """Ask the running operation to stop and roll back
+
+        Safe to call from another thread. Besides flagging the operation, the
+        statement currently executing (for example a long obs UPDATE) is
+        interrupted with KILL QUERY from a separate connection.
+        """
+
+        self.cancel_event.set()
+        conn = self.connection
+        if not (conn and conn.open):
+            return
+
+        self.log("Cancel requested - interrupting running statement...")
+        killer = self.connect()
+        try:
+            with killer.cursor() as cursor:
+                cursor.execute("KILL QUERY %s", (conn.thread_id(),))
+        finally:
+            killer.close()
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise OperationCancelled("Operation cancelled by operator")
+
+    def retry_reason(self, error):
+        """Name of the transient error when retry_transient will re-run the transaction, else None"""
+        if not self.retrying or not isinstance(error, Error):
+            return None
+        reason = TRANSIENT_ERRORS.get(error.args[0] if error.args else None)
+        if reason is None or self.attempt > self.retry_attempts or self.cancel_event.is_set():
+            return None
+        return reason
+
+    def _handle_failure(self, conn, error, description):
+        """Roll back after an error or cancel; returns the exception to raise"""
+
+        conn.rollback()
+
+        if self.cancel_event.is_set():
+            self.log(f"CANCELLED: {description} rolled back at operator request")
+            if isinstance(error, OperationCancelled):
+                return error
+            return OperationCancelled("Operation cancelled by operator")
+
+        if self.retry_reason(error):
+            self.log(f"WARNING: {description} rolled back - {str(error)}")
+            return error
+
+        self.log(f"ERROR: {description} failed - {str(error)}")
+        return error
+
+    @instrumented('lookup')
+    def lookup_patient(self, identifier):
+        """Find a voided patient by identifier and check eligibility
+
+        Returns ``(status, patient)``. ``patient`` is the looked-up row (or
+        None when nothing was found); for STATUS_ELIGIBLE it also carries the
+        ``time_start``/``time_end`` unvoid window.
+        """
+
+        self.log(f"Searching for patient: {identifier}")
+
+        conn = self.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+
+        try:
+            # Find patient by identifier (voided records only)
+            # CRITICAL: Get void_reason and date_voided from patient table for safety check
+            # NOTE: person_name may be voided too, so we don't filter by voided = 0
+            query = """
+                SELECT
+                    pi.patient_id,
+                    pi.identifier,
+                    CONCAT(pn.given_name, ' ', IFNULL(pn.family_name, '')) AS patient_name,
+                    p.gender,
+                    p.birthdate,
+                    pi.voided AS identifier_voided,
+                    pi.date_voided AS identifier_date_voided,
+                    pat.voided AS patient_voided,
+                    pat.date_voided AS patient_date_voided,
+                    pat.void_reason AS patient_void_reason
+                FROM patient_identifier pi
+                JOIN person p ON pi.patient_id = p.person_id
+                JOIN patient pat ON pi.patient_id = pat.patient_id
+                LEFT JOIN person_name pn ON p.person_id = pn.person_id
+                WHERE pi.identifier = %s AND pi.voided = 1
+                ORDER BY pn.preferred DESC, pn.date_created DESC
+                LIMIT 1
+            """
+
+            cursor.execute(query, (identifier,))
+            result = cursor.fetchone()
+            cursor.fetchall()  # Consume any remaining results
+
+            if not result:
+                # Check if exists but not voided
+                cursor.execute(
+                    "SELECT patient_id FROM patient_identifier WHERE identifier = %s AND voided = 0",
+                    (identifier,)
+                )
+                exists = cursor.fetchone()
+                cursor.fetchall()  # Consume any remaining results
+
+                if exists:
+                    self.log(f"ERROR: Patient {identifier} is NOT voided. No action needed.")
+                    return STATUS_NOT_VOIDED, None
+
+                self.log(f"ERROR: Patient {identifier} not found in database.")
+                return STATUS_NOT_FOUND, None
+
+            # CRITICAL SAFETY CHECK: Verify void_reason
+            void_reason = result.get('patient_void_reason', '')
+
+            if void_reason != REQUIRED_VOID_REASON:
+                self.log(f"ERROR: Invalid void reason: '{void_reason}'")
+                self.log(f"       Required: '{REQUIRED_VOID_REASON}'")
+                self.log(f"       Operation BLOCKED for safety")
+                return STATUS_WRONG_REASON, result
+
+            # Verify we have a date_voided timestamp
+            if not result.get('patient_date_voided'):
+                self.log(f"ERROR: No date_voided timestamp found")
+                self.log(f"       Operation BLOCKED for safety")
+                return STATUS_MISSING_TIMESTAMP, result
+
+            # Calculate time range (±120 seconds)
+            void_timestamp = result['patient_date_voided']
+            result['time_start'] = void_timestamp - timedelta(seconds=VOID_WINDOW_SECONDS)
+            result['time_end'] = void_timestamp + timedelta(seconds=VOID_WINDOW_SECONDS)
+
+            self.log(f"SUCCESS: Found patient - {result['patient_name']} (ID: {result['patient_id']})")
+            self.log(f"         Void reason: '{void_reason}' - VALID")
+            self.log(f"         Void timestamp: {void_timestamp}")
+            self.log(f"         Time range: {result['time_start']} to {result['time_end']} (±120 sec)")
+
+            if self.adaptive_window:
+                self.tighten_window(result)
+
+            return STATUS_ELIGIBLE, result
+
+        except Error as e:
+            self.log(f"ERROR: Database query failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+    def tighten_window(self, patient):
+        """Narrow the ±120 second window to the patient's bulk-void rows, in one aggregated query
+
+        Counts every plan table's voided rows per date_voided second inside
+        the fixed window. Safety rule: starting from the patient's own void
+        timestamp, neighbouring seconds (of any table) are taken in while the
+        gap to the next one is at most ``adaptive_gap`` seconds; the first
+        larger gap is treated as the edge of this patient's bulk void.
+        ``time_start``/``time_end`` become the bounds of that cluster, so they
+        never widen the fixed window.
+
+        Rows of the fixed window outside the cluster stay voided; their
+        per-table counts are stored on ``patient['excluded_counts']`` so the
+        operator confirms them before unvoiding. Returns the new bounds.
+        """
+
+        anchor = patient['patient_date_voided']
+        selects = []
+        params = []
+        for step in self.plan:
+            where, where_params = step.patient_where(
+                patient['patient_id'], patient['time_start'], patient['time_end']
+            )
+            selects.append(
+                f"SELECT '{step.table}' AS table_name, date_voided, COUNT(*) AS row_count "
+                f"FROM {step.table} {where} GROUP BY date_voided"
+            )
+            params += where_params
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(" UNION ALL ".join(selects), params)
+            rows = cursor.fetchall()
+            conn.commit()
+
+        except Error as e:
+            self.log(f"ERROR: Adaptive window query failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        gap = timedelta(seconds=self.adaptive_gap)
+        stamps = sorted({date_voided for table_name, date_voided, row_count in rows})
+
+        time_start = time_end = anchor
+        for stamp in reversed([stamp for stamp in stamps if stamp < anchor]):
+            if time_start - stamp > gap:
+                break
+            time_start = stamp
+        for stamp in [stamp for stamp in stamps if stamp > anchor]:
+            if stamp - time_end > gap:
+                break
+            time_end = stamp
+
+        covered = {}
+        excluded = {}
+        for table_name, date_voided, row_count in rows:
+            if time_start <= date_voided <= time_end:
+                low, high, count = covered.get(table_name, (date_voided, date_voided, 0))
+                covered[table_name] = (min(low, date_voided), max(high, date_voided), count + int(row_count))
+            else:
+                excluded[table_name] = excluded.get(table_name, 0) + int(row_count)
+
+        patient['time_start'] = time_start
+        patient['time_end'] = time_end
+        patient['excluded_counts'] = {step.table: excluded[step.table] for step in self.plan if step.table in excluded}
+
+        self.log(f"ADAPTIVE WINDOW: {time_start} to {time_end} ({window_label(patient)}, "
+                 f"gaps up to {self.adaptive_gap}s)")
+        for step in self.plan:
+            if step.table in covered:
+                low, high, count = covered[step.table]
+                self.log(f"         {step.table:<20} {count:>8}  {low} to {high}")
+        if excluded:
+            self.log(f"WARNING: {sum(excluded.values())} voided row(s) in the ±120 sec range lie outside "
+                     f"the adaptive window and will stay voided:")
+            for table, count in patient['excluded_counts'].items():
+                self.log(f"         {table:<20} {count:>8}")
+
+        return time_start, time_end
+
+    @instrumented('preview')
+    def preview_counts(self, patient):
+        """Count the rows each table would unvoid, in one round trip
+
+        Runs a single UNION ALL of COUNT(*) queries using the same
+        patient_id / voided / void_reason / date_voided window as
+        unvoid_patient. Returns a dict of table -> row count in plan order
+        and stores it on ``patient['preview_counts']``.
+        """
+
+        selects = []
+        params = []
+        for step in self.plan:
+            where, where_params = step.patient_where(
+                patient['patient_id'], patient['time_start'], patient['time_end']
+            )
+            selects.append(
+                f"SELECT '{step.table}' AS table_name, COUNT(*) AS row_count FROM {step.table} {where}"
+            )
+            params += where_params
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(" UNION ALL ".join(selects), params)
+            counts = {table_name: int(row_count) for table_name, row_count in cursor.fetchall()}
+            conn.commit()
+
+        except Error as e:
+            self.log(f"ERROR: Preview query failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        counts = {step.table: counts.get(step.table, 0) for step in self.plan}
+        patient['preview_counts'] = counts
+
+        self.log(f"PREVIEW: {sum(counts.values())} record(s) would be unvoided")
+        for table, row_count in counts.items():
+            if row_count:
+                self.log(f"         {table:<20} {row_count:>8}")
+
+        return counts
+
+    @instrumented('discover_events')
+    def discover_void_events(self, bucket_seconds=VOID_WINDOW_SECONDS):
+        """Group bulk-voided patients into void events, in one aggregated query
+
+        Patients voided with REQUIRED_VOID_REASON are bucketed by
+        ``FLOOR(UNIX_TIMESTAMP(date_voided) / bucket_seconds)``; runs of
+        adjacent non-empty buckets form one event. Each plan table is counted
+        with the same per-patient window as unvoid_patient.
+
+        Returns a list of events (oldest first), each a dict with
+        ``event_no``, ``start``, ``end``, ``patients``, ``counts``
+        (table -> rows) and ``total``.
+        """
+
+        selects = [
+            "SELECT '' AS table_name, FLOOR(UNIX_TIMESTAMP(p.date_voided) / %s) AS bucket, "
+            "MIN(p.date_voided), MAX(p.date_voided), COUNT(*) "
+            "FROM patient p "
+            "WHERE p.voided = 1 AND p.void_reason = %s AND p.date_voided IS NOT NULL "
+            "GROUP BY bucket"
+        ]
+        params = [bucket_seconds, REQUIRED_VOID_REASON]
+
+        for step in self.plan:
+            conditions, condition_params = step.conditions('t')
+            selects.append(
+                f"SELECT '{step.table}' AS table_name, FLOOR(UNIX_TIMESTAMP(p.date_voided) / %s) AS bucket, "
+                f"NULL, NULL, COUNT(*) "
+                f"FROM {step.table} t JOIN patient p ON {step.key_match('p.patient_id', 't')} "
+                f"WHERE p.voided = 1 AND p.void_reason = %s AND p.date_voided IS NOT NULL "
+                f"AND {conditions} "
+                f"AND t.date_voided BETWEEN p.date_voided - INTERVAL %s SECOND "
+                f"AND p.date_voided + INTERVAL %s SECOND "
+                f"GROUP BY bucket"
+            )
+            params += [bucket_seconds, REQUIRED_VOID_REASON] + condition_params
+            params += [VOID_WINDOW_SECONDS, VOID_WINDOW_SECONDS]
+
+        self.log("Discovering bulk void events...")
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(" UNION ALL ".join(selects), params)
+            rows = cursor.fetchall()
+            conn.commit()
+
+        except Error as e:
+            self.log(f"ERROR: Void event discovery failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        buckets = {}
+        table_rows = []
+        for table_name, bucket, first_voided, last_voided, row_count in rows:
+            if table_name:
+                table_rows.append((table_name, int(bucket), int(row_count)))
+            else:
+                buckets[int(bucket)] = (first_voided, last_voided, int(row_count))
+
+        # Merge runs of adjacent buckets into events
+        events = []
+        event_of_bucket = {}
+        previous = None
+        for bucket in sorted(buckets):
+            first_voided, last_voided, patients = buckets[bucket]
+            if previous is None or bucket - previous > 1:
+                events.append({
+                    'event_no': len(events) + 1,
+                    'start': first_voided,
+                    'end': last_voided,
+                    'patients': 0,
+                    'counts': {step.table: 0 for step in self.plan},
+                    'total': 0,
+                })
+            event = events[-1]
+            event['end'] = last_voided
+            event['patients'] += patients
+            event_of_bucket[bucket] = event
+            previous = bucket
+
+        for table_name, bucket, row_count in table_rows:
+            event = event_of_bucket[bucket]
+            event['counts'][table_name] += row_count
+            event['total'] += row_count
+
+        self.log(f"VOID EVENTS: {len(events)} event(s) with void_reason '{REQUIRED_VOID_REASON}'")
+        for event in events:
+            self.log(f"  #{event['event_no']} {event['start']} to {event['end']}: "
+                     f"{event['patients']} patient(s), {event['total']} record(s)")
+            for table, row_count in event['counts'].items():
+                if row_count:
+                    self.log(f"         {table:<20} {row_count:>8}")
+
+        return events
+
+    @instrumented('unvoid')
+    def unvoid_patient(self, patient):
+        """Execute timestamp-based unvoid operations (SAFE)
+
+        Returns the total number of records unvoided. On a database error
+        the transaction is rolled back and the error is re-raised. The
+        backup, when enabled, is taken once; deadlock retries reuse it.
+        """
+
+        self.log("-" * 70)
+        self.log(f"STARTING TIMESTAMP-BASED UNVOID OPERATION")
+        self.log(f"Patient: {patient['patient_name']} ({patient['identifier']})")
+        self.log(f"Patient ID: {patient['patient_id']}")
+        self.log(f"Void Timestamp: {patient['patient_date_voided']}")
+        self.log(f"Time Range: {patient['time_start']} to {patient['time_end']} ({window_label(patient)})")
+        self.log("-" * 70)
+
+        self.cancel_event.clear()
+        backup_folder = None
+        if self.backup.enabled:
+            self.ensure_schema()
+            backup_folder = self._backup(self.get_connection(), self.backup.backup_patient, patient)
+        return self._unvoid_patient(patient, backup_folder)
+
+    @retry_transient
+    def _unvoid_patient(self, patient, backup_folder=None):
+        """One attempt of unvoid_patient, in a single transaction"""
+
+        patient_id = patient['patient_id']
+        identifier = patient['identifier']
+
+        # Get timestamp range
+        void_timestamp = patient['patient_date_voided']
+        time_start = patient['time_start']
+        time_end = patient['time_end']
+
+        self.ensure_schema()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Checked before BEGIN: (re)installing the procedure commits implicitly
+        use_procedure = self.stored_procedure and self.ensure_procedure()
+
+        try:
+            self._begin(conn)
+
+            if use_procedure:
+                # Eligibility check, undo, updates and audit in one round trip
+                operation_id, counts = self._call_procedure(cursor, patient)
+                total_updated = sum(counts.values())
+
+            else:
+                operation_id = self._start_operation(
+                    cursor, OPERATION_TYPE_SINGLE, identifier, patient_id, patient['patient_name'],
+                    time_start, time_end
+                )
+
+                durations = {}
+                counts = self.execute_plan(cursor, patient, durations, operation_id)
+                total_updated = sum(counts.values())
+
+                # Log to audit table with timestamp info
+                remarks = (
+                    f'Timestamp-based unvoid: {void_timestamp} ({window_label(patient)}). '
+                    f'Range: {time_start} to {time_end}. '
+                    f'Total: {total_updated} records. '
+                    f'void_reason: {REQUIRED_VOID_REASON}'
+                )
+                audit_id = self.write_audit(cursor, identifier, patient_id, patient['patient_name'], 'SUCCESS', remarks)
+                self.write_audit_details(cursor, audit_id, counts, time_start, time_end, durations)
+                self._set_operation_status(cursor, operation_id, OPERATION_SUCCESS)
+
+            # Commit transaction
+            conn.commit()
+            patient['operation_id'] = operation_id
+
+            self.log("-" * 70)
+            self.log(f"SUCCESS: Unvoided {total_updated} total records")
+            self.log(f"         within timestamp range ({window_label(patient)})")
+            self.log(f"         Records outside this range remain voided (SAFE)")
+            self.log("-" * 70)
+            self.log(f"Audit entry created in nmrs_unvoid_audit")
+            self.log(f"Undo recorded as operation #{operation_id} (unvoid_cli.py revert {operation_id})")
+            if backup_folder:
+                self.log(f"Rows backed up beforehand to {backup_folder}")
+            self.log("-" * 70)
+
+            patient['verification'] = self._verify(operation_id, identifier)
+            return total_updated
+
+        except (Error, OperationCancelled) as e:
+            raise self._handle_failure(conn, e, "Unvoid operation")
+
+        finally:
+            cursor.close()
+
+    def _backup(self, conn, backup, target):
+        """Run a RowBackup method; nothing is unvoided if the restore point cannot be written"""
+        try:
+            return backup(conn, self.plan, target)
+        except OSError as e:
+            self.log(f"ERROR: Backup failed - {str(e)}")
+            raise OperationError(f"Backup failed - {str(e)}. Nothing was unvoided.")
+        except Error as e:
+            self.log(f"ERROR: Backup failed - {str(e)}")
+            raise
+
+    def execute_plan(self, cursor, patient, durations=None, operation_id=None):
+        """Run every plan step for one patient inside the caller's transaction
+
+        With an ``operation_id`` the primary keys and prior void columns of
+        the rows are first copied to nmrs_unvoid_undo (INSERT ... SELECT), so
+        the operation can be reverted.
+
+        Each step is timed; per-table milliseconds are stored in
+        ``durations`` when given. With ``batch_statements = true`` all
+        UPDATEs are sent as one multi-statement batch, a single network
+        round trip, and no per-table timing is available.
+        Returns a dict of table -> rows unvoided.
+        """
+
+        if durations is None:
+            durations = {}
+
+        statements = []
+        for step in self.plan:
+            where, params = step.patient_where(
+                patient['patient_id'], patient['time_start'], patient['time_end']
+            )
+            capture = None
+            if operation_id is not None:
+                capture = self._undo_statement(step, where, params, operation_id, patient['patient_id'])
+            statements.append((step, capture, (f"UPDATE {step.table} {UNVOID_SET.format(t='')} {where}", params)))
+
+        counts = {}
+
+        if self.batch_statements:
+            self._check_cancelled()
+            self.log(f"Unvoiding {len(statements)} tables in one round trip...")
+            started = time.perf_counter()
+            batch = []
+            for step, capture, update in statements:
+                if capture:
+                    batch.append(cursor.mogrify(*capture))
+                batch.append(cursor.mogrify(*update))
+            cursor.execute(";\n".join(batch))
+
+            # One result per statement; the UPDATE follows its undo capture
+            first = True
+            for step, capture, update in statements:
+                for result in range(2 if capture else 1):
+                    if not first:
+                        cursor.nextset()
+                    first = False
+                counts[step.table] = cursor.rowcount
+                self._log_step(step, cursor.rowcount)
+
+            self.progress(len(statements), len(statements), "batch")
+            self.log(f"  Batch completed in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return counts
+
+        for index, (step, capture, update) in enumerate(statements):
+            self._check_cancelled()
+            self.log(f"Unvoiding {step.table}...")
+            started = time.perf_counter()
+            if capture:
+                cursor.execute(*capture)
+            cursor.execute(*update)
+            counts[step.table] = cursor.rowcount
+            durations[step.table] = int((time.perf_counter() - started) * 1000)
+            self._log_step(step, cursor.rowcount, started)
+            self.progress(index + 1, len(statements), step.table)
+
+        return counts
+
+    def _log_step(self, step, rows, started=None):
+        elapsed = f" ({(time.perf_counter() - started) * 1000:.0f} ms)" if started else ""
+        if rows > 0:
+            self.log(f"  [OK] {rows} record(s) unvoided in {step.table}{elapsed}")
+        elif step.required:
+            self.log(f"  [WARNING] No records matched in {step.table} table")
+
+    @instrumented('unvoid_chunked')
+    def unvoid_patient_chunked(self, patient, chunk_size=None):
+        """Unvoid in bounded transactions, journaling every committed chunk
+
+        visit, encounter and obs are walked in primary-key ranges of
+        ``chunk_size`` rows, each range committed on its own. The remaining
+        tables, including the patient row, are unvoided last in one small
+        transaction, so the patient stays voided (and resumable) until every
+        chunk is done. Prior void columns are copied to nmrs_unvoid_undo so an
+        unfinished operation can be rolled back.
+
+        Returns ``(operation_id, total_updated)``.
+        """
+
+        self.cancel_event.clear()
+        self.ensure_schema()
+        conn = self.get_connection()
+        if self.backup.enabled:
+            self._backup(conn, self.backup.backup_patient, patient)
+        cursor = conn.cursor()
+
+        try:
+            operation_id = self._start_operation(
+                cursor, OPERATION_TYPE_CHUNKED,
+                patient['identifier'], patient['patient_id'], patient['patient_name'],
+                patient['time_start'], patient['time_end'], chunk_size or self.chunk_size
+            )
+            conn.commit()
+
+        except Error as e:
+            conn.rollback()
+            self.log(f"ERROR: Unvoid operation failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        self.log("-" * 70)
+        self.log(f"STARTING CHUNKED UNVOID OPERATION #{operation_id}")
+        self.log(f"Patient: {patient['patient_name']} ({patient['identifier']})")
+        self.log(f"Patient ID: {patient['patient_id']}")
+        self.log(f"Time Range: {patient['time_start']} to {patient['time_end']} ({window_label(patient)})")
+        self.log(f"Chunk size: {chunk_size or self.chunk_size} rows")
+        self.log("-" * 70)
+
+        return operation_id, self._run_operation(self._load_operation(operation_id))
+
+    @instrumented('resume')
+    def resume_operation(self, operation_id):
+        """Finish an interrupted chunked unvoid from its last committed chunk"""
+
+        operation = self._load_operation(operation_id)
+        if operation['status'] not in (OPERATION_RUNNING, OPERATION_FAILED):
+            raise OperationError(
+                f"Operation #{operation_id} is {operation['status']}; only "
+                f"{OPERATION_RUNNING} or {OPERATION_FAILED} operations can be resumed."
+            )
+
+        self.cancel_event.clear()
+        self.log("-" * 70)
+        self.log(f"RESUMING CHUNKED UNVOID OPERATION #{operation_id}")
+        self.log(f"Patient: {operation['patient_name']} ({operation['identifier']})")
+        self.log("-" * 70)
+
+        return self._run_operation(operation)
+
+    @instrumented('rollback')
+    def rollback_operation(self, operation_id):
+        """Re-void every row an unfinished chunked unvoid already committed
+
+        Rows are restored from nmrs_unvoid_undo with one joined UPDATE per
+        table. Returns the number of rows re-voided.
+        """
+
+        operation = self._load_operation(operation_id)
+        if operation['status'] not in (OPERATION_RUNNING, OPERATION_FAILED):
+            raise OperationError(
+                f"Operation #{operation_id} is {operation['status']}; only "
+                f"{OPERATION_RUNNING} or {OPERATION_FAILED} operations can be rolled back."
+            )
+
+        return self._revoid_operation(operation, OPERATION_ROLLED_BACK, "Rolled back")
+
+    @instrumented('revert')
+    def revert_operation(self, operation_id):
+        """Re-void exactly the rows a completed unvoid restored
+
+        Works for single, chunked and bulk operations. Rows that were changed
+        again since (no longer unvoided) are left alone. Returns the number
+        of rows re-voided.
+        """
+
+        operation = self._load_operation(operation_id)
+        if operation['status'] != OPERATION_SUCCESS:
+            raise OperationError(
+                f"Operation #{operation_id} is {operation['status']}; only {OPERATION_SUCCESS} "
+                f"operations can be reverted (use rollback for {OPERATION_RUNNING}/{OPERATION_FAILED})."
+            )
+
+        return self._revoid_operation(operation, OPERATION_REVERTED, "Reverted")
+
+    def _recorded_tables(self, cursor, operation_id):
+        """Return [(table, pk_column)] for every table with undo rows in the operation
+
+        Tables come from nmrs_unvoid_undo, not the current plan, which may
+        have changed since the unvoid. Key columns come from the plan, else
+        from the table's single-column primary key; a table with neither
+        raises OperationError before anything is re-voided.
+        """
+
+        cursor.execute(
+            "SELECT DISTINCT table_name FROM nmrs_unvoid_undo WHERE operation_id = %s",
+            (operation_id,)
+        )
+        recorded = {row[0] for row in cursor.fetchall()}
+
+        # Plan order first, so locks are taken in the usual order
+        tables = [(step.table, step.pk_column) for step in self.plan if step.table in recorded]
+        missing = sorted(recorded - {table for table, pk_column in tables})
+
+        for table in missing:
+            cursor.execute("""
+                SELECT MIN(COLUMN_NAME), COUNT(*)
+                FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = %s
+                  AND CONSTRAINT_NAME = 'PRIMARY'
+            """, (table,))
+            pk_column, pk_columns = cursor.fetchone()
+            if pk_columns != 1:
+                cursor.connection.rollback()
+                raise OperationError(
+                    f"Operation #{operation_id} has undo rows for {table}, which is not in the "
+                    f"unvoid plan and has no single-column primary key. Nothing was re-voided."
+                )
+            self.log(f"  {table} is not in the current plan; re-voided by its primary key {pk_column}")
+            tables.append((table, pk_column))
+
+        return tables
+
+    def _revoid_operation(self, operation, final_status, action):
+        """Restore the prior void columns of an operation's undo rows"""
+
+        operation_id = operation['operation_id']
+        operation_type = operation.get('operation_type', OPERATION_TYPE_CHUNKED)
+
+        self.cancel_event.clear()
+        self.log("-" * 70)
+        self.log(f"{action.upper()}: {operation_type} UNVOID OPERATION #{operation_id}")
+        self.log(f"Source: {operation['patient_name'] or operation['identifier']}")
+        self.log("-" * 70)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            tables = self._recorded_tables(cursor, operation_id)
+            conn.commit()
+
+            self._begin(conn)
+            total_restored = 0
+            counts = {}
+
+            for table, pk_column in tables:
+                self._check_cancelled()
+                cursor.execute(f"""
+                    UPDATE {table} t
+                    JOIN nmrs_unvoid_undo u
+                      ON u.row_id = t.{pk_column}
+                     AND u.operation_id = %s
+                     AND u.table_name = %s
+                    SET t.voided = 1,
+                        t.voided_by = u.voided_by,
+                        t.date_voided = u.date_voided,
+                        t.void_reason = u.void_reason
+                    WHERE t.voided = 0
+                """, (operation_id, table))
+                rows = cursor.rowcount
+                counts[table] = rows
+                total_restored += rows
+                if rows > 0:
+                    self.log(f"  [OK] {rows} record(s) re-voided in {table}")
+
+            self._set_operation_status(cursor, operation_id, final_status)
+            remarks = (
+                f'{action} {operation_type.lower()} unvoid operation #{operation_id}. '
+                f'Total: {total_restored} records re-voided.'
+            )
+
+            if operation['patient_id'] is not None:
+                audit_id = self.write_audit(
+                    cursor, operation['identifier'], operation['patient_id'], operation['patient_name'],
+                    final_status, remarks
+                )
+                self.write_audit_details(
+                    cursor, audit_id, counts, operation['window_start'], operation['window_end']
+                )
+            else:
+                # Bulk: one entry per patient whose patient row was restored
+                cursor.execute("""
+                    INSERT INTO nmrs_unvoid_audit
+                    (identifier, patient_id, patient_name, executed_by, action_status, remarks)
+                    SELECT
+                        COALESCE(
+                            (SELECT pi.identifier
+                             FROM patient_identifier pi
+                             WHERE pi.patient_id = u.patient_id
+                             ORDER BY pi.preferred DESC, pi.patient_identifier_id
+                             LIMIT 1),
+                            CONCAT('patient_id:', u.patient_id)
+                        ),
+                        u.patient_id,
+                        (SELECT CONCAT(pn.given_name, ' ', IFNULL(pn.family_name, ''))
+                         FROM person_name pn
+                         WHERE pn.person_id = u.patient_id
+                         ORDER BY pn.preferred DESC, pn.date_created DESC
+                         LIMIT 1),
+                        %s, %s, %s
+                    FROM nmrs_unvoid_undo u
+                    WHERE u.operation_id = %s AND u.table_name = 'patient'
+                """, (self.admin_name, final_status, remarks, operation_id))
+
+            conn.commit()
+
+            self.log(f"SUCCESS: Re-voided {total_restored} total records")
+            self.log("-" * 70)
+
+            return total_restored
+
+        except (Error, OperationCancelled) as e:
+            raise self._handle_failure(conn, e, f"{action} of operation #{operation_id}")
+
+        finally:
+            cursor.close()
+
+    def _verify(self, operation_id, label):
+        """Post-commit consistency check; a failure only warns, the unvoid stands"""
+
+        if not self.verifier.enabled:
+            return None
+
+        try:
+            report = self.verifier.verify_operation(self.get_connection(), operation_id, label)
+        except Error as e:
+            self.log(f"WARNING: Verification of operation #{operation_id} failed - {str(e)}")
+            self.log(f"         Run it again with: unvoid_cli.py verify {operation_id}")
+            return None
+
+        self.verifier.write_report(report)
+        return report
+
+    @instrumented('verify')
+    def verify_operation(self, operation_id, output=None):
+        """Check the patients of a finished operation for orphan states; returns the report
+
+        The report is written to ``output`` when given, else to the
+        configured report directory.
+        """
+
+        operation = self._load_operation(operation_id)
+        report = self.verifier.verify_operation(self.get_connection(), operation_id, operation['identifier'])
+        self.verifier.write_report(report, output)
+        return report
+
+    def _load_operation(self, operation_id):
+        self.ensure_schema()
+        conn = self.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+
+        try:
+            cursor.execute(
+                "SELECT * FROM nmrs_unvoid_operation WHERE operation_id = %s",
+                (operation_id,)
+            )
+            operation = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        if not operation:
+            raise OperationError(f"Operation #{operation_id} not found in nmrs_unvoid_operation.")
+
+        return operation
+
+    def committed_operation(self, identifier_prefix):
+        """Id of the latest SUCCESS operation whose identifier starts with the prefix, or None"""
+
+        self.ensure_schema()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT MAX(operation_id) FROM nmrs_unvoid_operation
+                WHERE identifier LIKE %s AND status = %s
+            """, (f"{identifier_prefix}%", OPERATION_SUCCESS))
+            operation_id = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            cursor.close()
+
+        return operation_id
+
+    def _set_operation_status(self, cursor, operation_id, status):
+        finished_at = None if status == OPERATION_RUNNING else datetime.now()
+        cursor.execute(
+            "UPDATE nmrs_unvoid_operation SET status = %s, finished_at = %s WHERE operation_id = %s",
+            (status, finished_at, operation_id)
+        )
+
+    @retry_transient
+    def _run_operation(self, operation):
+        """Run the chunked tables, then the final transaction; returns total rows"""
+
+        # Reloaded on every attempt: a failed attempt may have changed the status
+        operation = self._load_operation(operation['operation_id'])
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        operation_id = operation['operation_id']
+
+        try:
+            if operation['status'] != OPERATION_RUNNING:
+                self._set_operation_status(cursor, operation_id, OPERATION_RUNNING)
+                conn.commit()
+
+            chunked_steps = [step for step in self.plan if step.chunked]
+            final_steps = [step for step in self.plan if not step.chunked]
+            total_steps = len(self.plan)
+
+            for index, step in enumerate(chunked_steps):
+                self._run_chunks(cursor, operation, step)
+                self.progress(index + 1, total_steps, step.table)
+
+            # Final transaction: small tables, patient row and audit together
+            self._begin(conn)
+            for index, step in enumerate(final_steps):
+                self._check_cancelled()
+                self.log(f"Unvoiding {step.table}...")
+                started = time.perf_counter()
+                rows = self._unvoid_range(cursor, operation, step)
+                self._journal_chunk(cursor, operation_id, step.table, 0, None, None, rows)
+                self._log_step(step, rows, started)
+                self.progress(len(chunked_steps) + index + 1, total_steps, step.table)
+
+            cursor.execute(
+                "SELECT COALESCE(SUM(rows_affected), 0) FROM nmrs_unvoid_journal WHERE operation_id = %s",
+                (operation_id,)
+            )
+            total_updated = int(cursor.fetchone()[0])
+
+            self._set_operation_status(cursor, operation_id, OPERATION_SUCCESS)
+            remarks = (
+                f'Chunked timestamp-based unvoid, operation #{operation_id} '
+                f'({operation["chunk_size"]} rows per chunk). '
+                f'Range: {operation["window_start"]} to {operation["window_end"]}. '
+                f'Total: {total_updated} records. '
+                f'void_reason: {REQUIRED_VOID_REASON}'
+            )
+            audit_id = self.write_audit(
+                cursor, operation['identifier'], operation['patient_id'], operation['patient_name'],
+                'SUCCESS', remarks
+            )
+            cursor.execute("""
+                INSERT INTO nmrs_unvoid_audit_detail
+                (audit_id, table_name, rows_affected, window_start, window_end)
+                SELECT %s, table_name, SUM(rows_affected), %s, %s
+                FROM nmrs_unvoid_journal
+                WHERE operation_id = %s
+                GROUP BY table_name
+            """, (audit_id, operation['window_start'], operation['window_end'], operation_id))
+            conn.commit()
+
+            self.log("-" * 70)
+            self.log(f"SUCCESS: Unvoided {total_updated} total records (operation #{operation_id})")
+            self.log(f"         within timestamp range {operation['window_start']} to {operation['window_end']}")
+            self.log(f"         Records outside this range remain voided (SAFE)")
+            self.log("-" * 70)
+            self.log(f"Audit entry created in nmrs_unvoid_audit")
+            self.log(f"Undo recorded as operation #{operation_id} (unvoid_cli.py revert {operation_id})")
+            self.log("-" * 70)
+
+            self._verify(operation_id, operation['identifier'])
+            return total_updated
+
+        except (Error, OperationCancelled) as e:
+            error = self._handle_failure(conn, e, f"Current chunk of operation #{operation_id}")
+            if self.retry_reason(e):
+                # Retried from its last committed chunk; the operation stays RUNNING
+                raise error
+            self.log(f"       Committed chunks are journaled; resume or roll back operation #{operation_id}")
+            try:
+                self._set_operation_status(cursor, operation_id, OPERATION_FAILED)
+                conn.commit()
+            except Error:
+                pass
+            raise error
+
+        finally:
+            cursor.close()
+
+    def _run_chunks(self, cursor, operation, step):
+        """Walk one table in primary-key ranges, committing each range"""
+
+        conn = cursor.connection
+        operation_id = operation['operation_id']
+        chunk_size = operation['chunk_size']
+        table, pk_column = step.table, step.pk_column
+
+        # Resume after the last committed chunk
+        cursor.execute("""
+            SELECT MAX(pk_high), COUNT(*)
+            FROM nmrs_unvoid_journal
+            WHERE operation_id = %s AND table_name = %s
+        """, (operation_id, table))
+        last_pk, chunk_no = cursor.fetchone()
+        last_pk = last_pk or 0
+
+        self.log(f"Unvoiding {table} in chunks of {chunk_size}...")
+        if chunk_no:
+            self.log(f"  Resuming after {table}.{pk_column} = {last_pk} ({chunk_no} chunk(s) already done)")
+
+        while True:
+            self._check_cancelled()
+            where, params = step.patient_where(
+                operation['patient_id'], operation['window_start'], operation['window_end']
+            )
+            cursor.execute(f"""
+                SELECT MAX({pk_column})
+                FROM (
+                    SELECT {pk_column}
+                    FROM {table}
+                    {where}
+                      AND {pk_column} > %s
+                    ORDER BY {pk_column}
+                    LIMIT %s
+                ) chunk
+            """, params + [last_pk, chunk_size])
+            pk_high = cursor.fetchone()[0]
+            conn.commit()
+
+            if pk_high is None:
+                break
+
+            chunk_no += 1
+            started = time.perf_counter()
+            self._begin(conn)
+            rows = self._unvoid_range(cursor, operation, step, last_pk + 1, pk_high)
+            self._journal_chunk(cursor, operation_id, table, chunk_no, last_pk + 1, pk_high, rows)
+            conn.commit()
+
+            self.log(f"  [OK] chunk {chunk_no}: {rows} record(s) unvoided in {table} "
+                     f"({pk_column} {last_pk + 1}-{pk_high}, "
+                     f"{(time.perf_counter() - started) * 1000:.0f} ms)")
+            last_pk = pk_high
+
+    def _unvoid_range(self, cursor, operation, step, pk_low=None, pk_high=None):
+        """Copy prior void columns to the undo table, then unvoid; returns rows updated"""
+
+        where, params = step.patient_where(
+            operation['patient_id'], operation['window_start'], operation['window_end'],
+            pk_low, pk_high
+        )
+
+        cursor.execute(*self._undo_statement(
+            step, where, params, operation['operation_id'], operation['patient_id']
+        ))
+        cursor.execute(f"UPDATE {step.table} {UNVOID_SET.format(t='')} {where}", params)
+        return cursor.rowcount
+
+    def _undo_statement(self, step, where, params, operation_id, patient_id):
+        """INSERT ... SELECT copying the rows' keys and prior void columns to nmrs_unvoid_undo"""
+        sql = f"""
+            INSERT IGNORE INTO nmrs_unvoid_undo
+            (operation_id, table_name, row_id, patient_id, voided_by, date_voided, void_reason)
+            SELECT %s, %s, {step.pk_column}, %s, voided_by, date_voided, void_reason
+            FROM {step.table}
+            {where}
+        """
+        return sql, [operation_id, step.table, patient_id] + params
+
+    def _start_operation(self, cursor, operation_type, identifier, patient_id, patient_name,
+                         window_start=None, window_end=None, chunk_size=None):
+        """Insert a RUNNING operation row; returns its id"""
+        cursor.execute("""
+            INSERT INTO nmrs_unvoid_operation
+            (operation_type, identifier, patient_id, patient_name, window_start, window_end,
+             chunk_size, status, executed_by)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            operation_type, identifier, patient_id, patient_name, window_start, window_end,
+            chunk_size, OPERATION_RUNNING, self.admin_name
+        ))
+        return cursor.lastrowid
+
+    def _journal_chunk(self, cursor, operation_id, table, chunk_no, pk_low, pk_high, rows):
+        cursor.execute("""
+            INSERT INTO nmrs_unvoid_journal
+            (operation_id, table_name, chunk_no, pk_low, pk_high, rows_affected)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (operation_id, table, chunk_no, pk_low, pk_high, rows))
+
+    @instrumented('bulk_prepare')
+    def prepare_bulk(self, identifiers):
+        """Load identifiers into a temporary table and resolve eligible patients
+
+        Returns the number of eligible rows and the list of blocked identifiers.
+        The same safety rules as lookup_patient apply: a voided identifier, the
+        bulk void_reason on the patient and a date_voided timestamp. The batch
+        lives in the session of the cached connection until bulk_unvoid runs.
+        """
+
+        self.cancel_event.clear()
+        self.ensure_schema()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            self.create_batch_table(cursor)
+
+            cursor.executemany(
+                "INSERT IGNORE INTO tmp_unvoid_batch (identifier) VALUES (%s)",
+                [(identifier,) for identifier in identifiers]
+            )
+
+            # Calculate each patient's own time range (±120 seconds)
+            cursor.execute("""
+                UPDATE tmp_unvoid_batch b
+                JOIN patient_identifier pi ON pi.identifier = b.identifier AND pi.voided = 1
+                JOIN patient pat ON pat.patient_id = pi.patient_id
+                SET b.patient_id = pat.patient_id,
+                    b.time_start = pat.date_voided - INTERVAL %s SECOND,
+                    b.time_end = pat.date_voided + INTERVAL %s SECOND
+                WHERE pat.void_reason = %s
+                  AND pat.date_voided IS NOT NULL
+            """, (VOID_WINDOW_SECONDS, VOID_WINDOW_SECONDS, REQUIRED_VOID_REASON))
+
+            cursor.execute("SELECT COUNT(*) FROM tmp_unvoid_batch WHERE patient_id IS NOT NULL")
+            eligible = cursor.fetchone()[0]
+
+            cursor.execute("SELECT identifier FROM tmp_unvoid_batch WHERE patient_id IS NULL ORDER BY identifier")
+            blocked = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute("""
+                SELECT patient_id, GROUP_CONCAT(identifier ORDER BY identifier SEPARATOR ', ')
+                FROM tmp_unvoid_batch
+                WHERE patient_id IS NOT NULL
+                GROUP BY patient_id
+                HAVING COUNT(*) > 1
+                ORDER BY patient_id
+            """)
+            shared = cursor.fetchall()
+
+            # Release the locks taken while resolving the batch before the
+            # operator starts reading confirmation prompts
+            conn.commit()
+
+        except (Error, OperationCancelled) as e:
+            raise self._handle_failure(conn, e, "Bulk lookup")
+
+        finally:
+            cursor.close()
+
+        self.log(f"Eligible patients: {eligible}")
+        self.log(f"Blocked identifiers: {len(blocked)}")
+        for identifier in blocked:
+            self.log(f"  [BLOCKED] {identifier} (not found, not voided, wrong void_reason or no date_voided)")
+        for patient_id, identifiers in shared:
+            self.log(f"  [SHARED] patient ID {patient_id} is listed as {identifiers}; unvoided and audited once")
+
+        return eligible, blocked
+
+    @instrumented('event_prepare')
+    def prepare_event(self, window_start, window_end):
+        """Load every patient of one bulk void event into the batch table
+
+        Selects, in one INSERT ... SELECT, the patients voided with the bulk
+        void_reason whose date_voided falls between ``window_start`` and
+        ``window_end`` (for example an event from discover_void_events).
+        Each patient keeps its own ±120 second window, exactly as in
+        prepare_bulk. Returns the number of patients; run bulk_unvoid next.
+        """
+
+        self.cancel_event.clear()
+        self.ensure_schema()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            # Keyed on patient_id: every patient of the event is unvoided even
+            # when two of them share an identifier
+            self.create_batch_table(cursor, by_patient=True)
+
+            # The audit identifier is the patient's preferred identifier
+            cursor.execute("""
+                INSERT INTO tmp_unvoid_batch (identifier, patient_id, time_start, time_end)
+                SELECT
+                    COALESCE(
+                        (SELECT pi.identifier
+                         FROM patient_identifier pi
+                         WHERE pi.patient_id = pat.patient_id
+                         ORDER BY pi.preferred DESC, pi.patient_identifier_id
+                         LIMIT 1),
+                        CONCAT('patient_id:', pat.patient_id)
+                    ),
+                    pat.patient_id,
+                    pat.date_voided - INTERVAL %s SECOND,
+                    pat.date_voided + INTERVAL %s SECOND
+                FROM patient pat
+                WHERE pat.voided = 1
+                  AND pat.void_reason = %s
+                  AND pat.date_voided IS NOT NULL
+                  AND pat.date_voided BETWEEN %s AND %s
+            """, (VOID_WINDOW_SECONDS, VOID_WINDOW_SECONDS, REQUIRED_VOID_REASON, window_start, window_end))
+            eligible = cursor.rowcount
+
+            cursor.execute("""
+                SELECT identifier, GROUP_CONCAT(patient_id ORDER BY patient_id)
+                FROM tmp_unvoid_batch
+                GROUP BY identifier
+                HAVING COUNT(*) > 1
+                ORDER BY identifier
+            """)
+            shared = cursor.fetchall()
+
+            conn.commit()
+
+        except (Error, OperationCancelled) as e:
+            raise self._handle_failure(conn, e, "Void event lookup")
+
+        finally:
+            cursor.close()
+
+        self.log(f"VOID EVENT: {window_start} to {window_end}")
+        self.log(f"Eligible patients: {eligible}")
+        for identifier, patient_ids in shared:
+            self.log(f"  [SHARED] {identifier} is the identifier of patient IDs {patient_ids}; all are unvoided")
+
+        return eligible
+
+    @instrumented('classify')
+    def classify_identifiers(self, identifiers):
+        """Classify a whole identifier list in one joined query
+
+        Applies lookup_patient's rules to every identifier at once: not
+        found, not voided (already active), wrong void_reason, missing
+        date_voided or eligible (with its ±120 second window). The list is
+        shipped in a temporary table. Returns one dict per identifier, in
+        input order, with the keys of ELIGIBILITY_COLUMNS.
+        """
+
+        conn = self.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+
+        try:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_classify")
+            cursor.execute("""
+                CREATE TEMPORARY TABLE tmp_unvoid_classify (
+                    identifier      VARCHAR(50) NOT NULL PRIMARY KEY
+                ) ENGINE=InnoDB
+            """)
+            cursor.executemany(
+                "INSERT IGNORE INTO tmp_unvoid_classify (identifier) VALUES (%s)",
+                [(identifier,) for identifier in identifiers]
+            )
+
+            # Voided identifier rows first, as in lookup_patient; an active
+            # row only matters when no voided one exists
+            cursor.execute("""
+                SELECT
+                    c.identifier,
+                    pi.patient_id,
+                    (SELECT CONCAT(pn.given_name, ' ', IFNULL(pn.family_name, ''))
+                     FROM person_name pn
+                     WHERE pn.person_id = pi.patient_id
+                     ORDER BY pn.preferred DESC, pn.date_created DESC
+                     LIMIT 1) AS patient_name,
+                    pat.void_reason,
+                    pat.date_voided,
+                    EXISTS (SELECT 1 FROM patient_identifier a
+                            WHERE a.identifier = c.identifier AND a.voided = 0) AS active
+                FROM tmp_unvoid_classify c
+                LEFT JOIN patient_identifier pi ON pi.identifier = c.identifier AND pi.voided = 1
+                LEFT JOIN patient pat ON pat.patient_id = pi.patient_id
+                ORDER BY c.identifier, pi.patient_identifier_id DESC
+            """)
+            rows = cursor.fetchall()
+
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_classify")
+            conn.commit()
+
+        except Error as e:
+            conn.rollback()
+            self.log(f"ERROR: Eligibility check failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        window = timedelta(seconds=VOID_WINDOW_SECONDS)
+        classified = {}
+        for row in rows:
+            if row['identifier'] in classified:
+                continue
+
+            if row['patient_id'] is None:
+                row['status'] = STATUS_NOT_VOIDED if row['active'] else STATUS_NOT_FOUND
+            elif row['void_reason'] != REQUIRED_VOID_REASON:
+                row['status'] = STATUS_WRONG_REASON
+            elif row['date_voided'] is None:
+                row['status'] = STATUS_MISSING_TIMESTAMP
+            else:
+                row['status'] = STATUS_ELIGIBLE
+                row['time_start'] = row['date_voided'] - window
+                row['time_end'] = row['date_voided'] + window
+            classified[row['identifier']] = row
+
+        results = [classified[identifier] for identifier in identifiers if identifier in classified]
+
+        summary = {}
+        for row in results:
+            summary[row['status']] = summary.get(row['status'], 0) + 1
+        self.log(f"ELIGIBILITY: {len(results)} identifier(s) classified")
+        for status in (STATUS_ELIGIBLE, STATUS_NOT_FOUND, STATUS_NOT_VOIDED,
+                       STATUS_WRONG_REASON, STATUS_MISSING_TIMESTAMP):
+            self.log(f"         {status:<20} {summary.get(status, 0):>8}")
+
+        return results
+
+    @instrumented('bulk_unvoid')
+    def bulk_unvoid(self, source_name):
+        """Unvoid all patients prepared by prepare_bulk/prepare_event with one joined UPDATE per table
+
+        Returns ``(total_updated, patients_audited)``. On a database error
+        the transaction is rolled back and the error is re-raised. The
+        backup, when enabled, is taken once; deadlock retries reuse it.
+        """
+
+        self.log("-" * 70)
+        self.log("STARTING BULK TIMESTAMP-BASED UNVOID OPERATION")
+        self.log("-" * 70)
+
+        self.cancel_event.clear()
+        backup_folder = None
+        if self.backup.enabled:
+            backup_folder = self._backup(self.get_connection(), self.backup.backup_batch, source_name)
+        return self._bulk_unvoid(source_name, backup_folder)
+
+    @retry_transient
+    def _bulk_unvoid(self, source_name, backup_folder=None):
+        """One attempt of bulk_unvoid, in a single transaction"""
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            self._begin(conn)
+            total_updated = 0
+            cursor.execute("DELETE FROM tmp_unvoid_counts")
+            operation_id = self._start_operation(cursor, OPERATION_TYPE_BULK, source_name[:50], None, None)
+
+            for index, step in enumerate(self.plan):
+                self._check_cancelled()
+                self.log(f"Unvoiding {step.table}...")
+
+                where, params = step.batch_where()
+                started = time.perf_counter()
+
+                # Undo capture; the locking read keeps it equal to what the
+                # UPDATE below changes
+                cursor.execute(f"""
+                    INSERT IGNORE INTO nmrs_unvoid_undo
+                    (operation_id, table_name, row_id, patient_id, voided_by, date_voided, void_reason)
+                    SELECT %s, %s, t.{step.pk_column}, b.patient_id, t.voided_by, t.date_voided, t.void_reason
+                    FROM {step.table} t {step.batch_join()}
+                    {where}
+                """, [operation_id, step.table] + params)
+
+                cursor.execute(
+                    f"UPDATE {step.table} t {step.batch_join()} {UNVOID_SET.format(t='t.')} {where}",
+                    params
+                )
+                rows = cursor.rowcount
+
+                # Per-patient counts for the audit detail, from the undo rows
+                cursor.execute("""
+                    INSERT INTO tmp_unvoid_counts
+                    (patient_id, table_name, rows_affected, window_start, window_end)
+                    SELECT u.patient_id, u.table_name, COUNT(DISTINCT u.row_id), b.time_start, b.time_end
+                    FROM nmrs_unvoid_undo u
+                    JOIN tmp_unvoid_batch b ON b.patient_id = u.patient_id
+                    WHERE u.operation_id = %s AND u.table_name = %s
+                    GROUP BY u.patient_id, u.table_name, b.time_start, b.time_end
+                """, (operation_id, step.table))
+                total_updated += rows
+                self._log_step(step, rows, started)
+                self.progress(index + 1, len(self.plan), step.table)
+
+            # One audit entry per patient, written in a single statement; a
+            # patient listed under several identifiers is audited once
+            remarks = (
+                f'Bulk timestamp-based unvoid from {source_name} (±120sec per patient). '
+                f'Batch total: {total_updated} records. '
+                f'void_reason: {REQUIRED_VOID_REASON}'
+            )
+            cursor.execute("""
+                INSERT INTO nmrs_unvoid_audit
+                (identifier, patient_id, patient_name, executed_by, action_status, attempts, remarks)
+                SELECT
+                    MIN(b.identifier),
+                    b.patient_id,
+                    (SELECT CONCAT(pn.given_name, ' ', IFNULL(pn.family_name, ''))
+                     FROM person_name pn
+                     WHERE pn.person_id = b.patient_id
+                     ORDER BY pn.preferred DESC, pn.date_created DESC
+                     LIMIT 1),
+                    %s, 'SUCCESS', %s, %s
+                FROM tmp_unvoid_batch b
+                WHERE b.patient_id IS NOT NULL
+                GROUP BY b.patient_id
+            """, (self.admin_name, self.attempt, remarks))
+            audited = cursor.rowcount
+            first_audit_id = cursor.lastrowid
+
+            # Attach the counts to this run's headers. Other sessions cannot
+            # audit these patients meanwhile: their patient rows stay locked
+            # by the UPDATEs above until commit.
+            cursor.execute("""
+                INSERT INTO nmrs_unvoid_audit_detail
+                (audit_id, table_name, rows_affected, window_start, window_end)
+                SELECT a.audit_id, c.table_name, c.rows_affected, c.window_start, c.window_end
+                FROM tmp_unvoid_counts c
+                JOIN nmrs_unvoid_audit a
+                  ON a.patient_id = c.patient_id
+                 AND a.audit_id >= %s
+            """, (first_audit_id,))
+
+            self._set_operation_status(cursor, operation_id, OPERATION_SUCCESS)
+            conn.commit()
+            self.last_operation_id = operation_id
+
+            self.log("-" * 70)
+            self.log(f"SUCCESS: Unvoided {total_updated} total records for {audited} patient(s)")
+            self.log(f"         within each patient's timestamp range (±120 seconds)")
+            self.log(f"         Records outside these ranges remain voided (SAFE)")
+            self.log("-" * 70)
+            self.log(f"{audited} audit entries created in nmrs_unvoid_audit (per-table counts in nmrs_unvoid_audit_detail)")
+            self.log(f"Undo recorded as operation #{operation_id} (unvoid_cli.py revert {operation_id})")
+            if backup_folder:
+                self.log(f"Rows backed up beforehand to {backup_folder}")
+            self.log("-" * 70)
+
+            self._verify(operation_id, source_name)
+            return total_updated, audited
+
+        except (Error, OperationCancelled) as e:
+            raise self._handle_failure(conn, e, "Bulk unvoid operation")
+
+        finally:
+            cursor.close()
+
+    def write_audit(self, cursor, identifier, patient_id, patient_name, status, remarks):
+        """Insert one audit entry (committed with the caller's transaction)"""
+
+        audit_query = """
+            INSERT INTO nmrs_unvoid_audit
+            (identifier, patient_id, patient_name, executed_by, action_status, attempts, remarks)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        cursor.execute(audit_query, (
+            identifier,
+            patient_id,
+            patient_name,
+            self.admin_name,
+            status,
+            self.attempt,
+            remarks
+        ))
+        return cursor.lastrowid
+
+    def write_audit_details(self, cursor, audit_id, counts, window_start, window_end, durations=None):
+        """Insert one detail row per plan table for an audit entry, in one executemany"""
+
+        durations = durations or {}
+        cursor.executemany("""
+            INSERT INTO nmrs_unvoid_audit_detail
+            (audit_id, table_name, rows_affected, window_start, window_end, duration_ms)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, [
+            (audit_id, table, rows, window_start, window_end, durations.get(table))
+            for table, rows in counts.items()
+        ])
+
+    def create_batch_table(self, cursor, by_patient=False):
+        """(Re)create the session's tmp_unvoid_batch table
+
+        Identifier lists are keyed on the identifier. With ``by_patient`` the
+        key is patient_id instead, so patients sharing an identifier (for
+        example duplicate ART numbers) are all kept.
+        """
+        if by_patient:
+            columns = """
+                identifier      VARCHAR(50) NOT NULL,
+                patient_id      INT NOT NULL PRIMARY KEY,
+                time_start      DATETIME NULL,
+                time_end        DATETIME NULL,
+
+                INDEX idx_batch_identifier (identifier)
+            """
+        else:
+            columns = """
+                identifier      VARCHAR(50) NOT NULL PRIMARY KEY,
+                patient_id      INT NULL,
+                time_start      DATETIME NULL,
+                time_end        DATETIME NULL,
+
+                INDEX idx_batch_patient_id (patient_id)
+            """
+
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_batch")
+        cursor.execute(f"CREATE TEMPORARY TABLE tmp_unvoid_batch ({columns}) ENGINE=InnoDB")
+
+        # Per-patient row counts of a bulk run, copied into the audit detail
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_counts")
+        cursor.execute("""
+            CREATE TEMPORARY TABLE tmp_unvoid_counts (
+                patient_id      INT NOT NULL,
+                table_name      VARCHAR(64) NOT NULL,
+                rows_affected   INT NOT NULL,
+                window_start    DATETIME NULL,
+                window_end      DATETIME NULL,
+
+                PRIMARY KEY (patient_id, table_name)
+            ) ENGINE=InnoDB
+        """)
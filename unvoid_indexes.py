@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Unvoid Index Advisor - CCFN OpenMRS
+===================================
+Checks that every table in the unvoid plan can find a patient's voided rows
+without scanning them all, and optionally adds composite helper indexes on
+``(patient_id|person_id, voided, date_voided)`` for the duration of a bulk
+recovery.
+
+- Existing indexes are read from information_schema.STATISTICS
+- Each planned UPDATE is run through EXPLAIN and full scans are reported
+- Helper indexes are named ``idx_unvoid_<table>`` and built online
+  (ALGORITHM=INPLACE, LOCK=NONE) where the server supports it
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+from datetime import datetime, timedelta
+
+from pymysql.err import Error
+
+from unvoid_engine import REQUIRED_VOID_REASON, UNVOID_SET, VOID_WINDOW_SECONDS
+from unvoid_metrics import InstrumentedDictCursor
+
+
+HELPER_INDEX_PREFIX = 'idx_unvoid_'
+
+# Index coverage of a plan step
+INDEX_OK = 'OK'
+INDEX_PARTIAL = 'PARTIAL'
+INDEX_MISSING = 'MISSING'
+
+# EXPLAIN access types that read the whole table or index
+FULL_SCAN_TYPES = ('ALL', 'index')
+
+# MySQL refuses ALGORITHM/LOCK clauses it cannot honour with these codes
+ER_ALTER_OPERATION_NOT_SUPPORTED = (1845, 1846)
+
+
+def helper_index_name(step):
+    return f"{HELPER_INDEX_PREFIX}{step.table}"
+
+
+def helper_index_columns(step):
+    return (step.key_column, 'voided', 'date_voided')
+
+
+class IndexAdvisor:
+    """Index report and helper index management for an UnvoidEngine's plan"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.log = engine.log
+
+    def existing_indexes(self, cursor):
+        """Return {table: {index_name: (unique, [columns])}} for the plan tables"""
+
+        tables = [step.table for step in self.engine.plan]
+        placeholders = ", ".join(["%s"] * len(tables))
+        cursor.execute(f"""
+            SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name,
+                   NON_UNIQUE AS non_unique, COLUMN_NAME AS column_name
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME IN ({placeholders})
+            ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+        """, tables)
+
+        indexes = {table: {} for table in tables}
+        for row in cursor.fetchall():
+            unique, columns = indexes[row['table_name']].setdefault(
+                row['index_name'], (not int(row['non_unique']), [])
+            )
+            columns.append(row['column_name'])
+        return indexes
+
+    def coverage(self, step, indexes):
+        """Classify how well the table's indexes serve the step's predicates
+
+        Returns ``(status, index_name)``. A unique key on the patient column
+        or an index leading with all three window columns is OK; an index
+        that only leads with the patient column is PARTIAL (MySQL reads every
+        row of the patient, voided or not).
+        """
+
+        wanted = list(helper_index_columns(step))
+        best = (INDEX_MISSING, None)
+
+        for name, (unique, columns) in indexes.items():
+            if columns[:1] != wanted[:1]:
+                continue
+            if (unique and len(columns) == 1) or columns[:3] == wanted:
+                return INDEX_OK, name
+            best = (INDEX_PARTIAL, name)
+
+        return best
+
+    def sample_patient(self, cursor, identifier=None):
+        """Pick the patient whose window is EXPLAINed
+
+        Uses the given identifier, else the most recently bulk-voided patient,
+        else a placeholder so the plan can still be explained.
+        """
+
+        if identifier:
+            cursor.execute("""
+                SELECT pat.patient_id, pat.date_voided
+                FROM patient_identifier pi
+                JOIN patient pat ON pat.patient_id = pi.patient_id
+                WHERE pi.identifier = %s
+                LIMIT 1
+            """, (identifier,))
+        else:
+            cursor.execute("""
+                SELECT patient_id, date_voided
+                FROM patient
+                WHERE voided = 1 AND void_reason = %s AND date_voided IS NOT NULL
+                ORDER BY date_voided DESC
+                LIMIT 1
+            """, (REQUIRED_VOID_REASON,))
+
+        row = cursor.fetchone()
+        if row and row['date_voided']:
+            return row['patient_id'], row['date_voided']
+        return 0, datetime.now()
+
+    def explain(self, cursor, step, patient_id, void_timestamp):
+        """EXPLAIN the step's single-patient UPDATE; returns the plan row"""
+
+        window = timedelta(seconds=VOID_WINDOW_SECONDS)
+        where, params = step.patient_where(patient_id, void_timestamp - window, void_timestamp + window)
+        cursor.execute(f"EXPLAIN UPDATE {step.table} {UNVOID_SET.format(t='')} {where}", params)
+        rows = cursor.fetchall()
+        return rows[0] if rows else {}
+
+    def check(self, identifier=None):
+        """Log an index report for every plan step; returns the steps needing a helper index"""
+
+        self.log("-" * 70)
+        self.log("INDEX CHECK")
+        self.log("-" * 70)
+
+        conn = self.engine.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+
+        try:
+            indexes = self.existing_indexes(cursor)
+            patient_id, void_timestamp = self.sample_patient(cursor, identifier)
+            self.log(f"EXPLAIN uses patient ID {patient_id}, void timestamp {void_timestamp}")
+
+            needs_helper = []
+            for step in self.engine.plan:
+                status, index_name = self.coverage(step, indexes[step.table])
+                plan = self.explain(cursor, step, patient_id, void_timestamp)
+                access = plan.get('type') or '-'
+                full_scan = access in FULL_SCAN_TYPES
+
+                self.log(
+                    f"  [{'SCAN' if full_scan else status}] {step.table}: "
+                    f"index {index_name or 'none'}, EXPLAIN type={access} "
+                    f"key={plan.get('key') or '-'} rows={plan.get('rows') or 0}"
+                )
+                if full_scan:
+                    self.log(f"         Full scan of {step.table} for every unvoided patient")
+
+                if status != INDEX_OK or full_scan:
+                    needs_helper.append(step)
+
+            conn.commit()
+
+        except Error as e:
+            conn.rollback()
+            self.log(f"ERROR: Index check failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        self.log("-" * 70)
+        if needs_helper:
+            self.log(f"Helper indexes suggested for: {', '.join(step.table for step in needs_helper)}")
+        else:
+            self.log("All plan tables are served by existing indexes")
+        self.log("-" * 70)
+
+        return needs_helper
+
+    def _alter_online(self, cursor, table, clause):
+        """Run ALTER TABLE online, falling back to the default algorithm"""
+
+        try:
+            cursor.execute(f"ALTER TABLE {table} {clause}, ALGORITHM=INPLACE, LOCK=NONE")
+        except Error as e:
+            if e.args[0] not in ER_ALTER_OPERATION_NOT_SUPPORTED:
+                raise
+            self.log(f"  WARNING: Online ALTER not supported on {table} - {str(e)}")
+            self.log(f"           Falling back to a locking ALTER TABLE")
+            cursor.execute(f"ALTER TABLE {table} {clause}")
+
+    def create_helper_indexes(self, steps=None):
+        """Add idx_unvoid_<table> to each step that lacks a covering index
+
+        ``steps`` defaults to the result of check(). Returns the created
+        index names.
+        """
+
+        if steps is None:
+            steps = self.check()
+
+        conn = self.engine.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+        created = []
+
+        try:
+            indexes = self.existing_indexes(cursor)
+            for step in steps:
+                name = helper_index_name(step)
+                if name in indexes[step.table]:
+                    self.log(f"  [SKIP] {name} already exists")
+                    continue
+
+                self.log(f"Creating {name} on {step.table} ({', '.join(helper_index_columns(step))})...")
+                started = datetime.now()
+                self._alter_online(
+                    cursor, step.table,
+                    f"ADD INDEX {name} ({', '.join(helper_index_columns(step))})"
+                )
+                created.append(name)
+                self.log(f"  [OK] {name} created in {(datetime.now() - started).total_seconds():.1f}s")
+
+        except Error as e:
+            self.log(f"ERROR: Creating helper indexes failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        return created
+
+    def drop_helper_indexes(self, names=None):
+        """Drop idx_unvoid_* indexes on the plan tables; returns the dropped names
+
+        With ``names`` only those indexes are dropped (e.g. the ones a run
+        created for itself), leaving helper indexes built earlier or used by
+        another run in place. Without it every helper index is dropped.
+        """
+
+        conn = self.engine.get_connection()
+        cursor = conn.cursor(InstrumentedDictCursor)
+        dropped = []
+
+        try:
+            indexes = self.existing_indexes(cursor)
+            for step in self.engine.plan:
+                for name in indexes[step.table]:
+                    if not name.startswith(HELPER_INDEX_PREFIX):
+                        continue
+                    if names is not None and name not in names:
+                        continue
+
+                    self.log(f"Dropping {name} on {step.table}...")
+                    self._alter_online(cursor, step.table, f"DROP INDEX {name}")
+                    dropped.append(name)
+                    self.log(f"  [OK] {name} dropped")
+
+        except Error as e:
+            self.log(f"ERROR: Dropping helper indexes failed - {str(e)}")
+            raise
+
+        finally:
+            cursor.close()
+
+        if not dropped:
+            self.log("No helper indexes to drop")
+        return dropped
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Unvoid Batch Journal - CCFN OpenMRS
+===================================
+Local SQLite journal for multi-patient jobs, so a long recovery survives a
+dropped VPN or a sleeping laptop.
+
+- One row per identifier with its state (pending/eligible/done/blocked/failed)
+- Checkpointed after every committed batch
+- Resuming skips finished identifiers without asking the database again
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import sqlite3
+import uuid
+from datetime import datetime
+
+from pymysql.err import Error
+
+from unvoid_engine import OperationCancelled
+
+
+DEFAULT_JOURNAL_FILE = 'unvoid_jobs.sqlite'
+DEFAULT_BATCH_SIZE = 500
+
+# Identifier states
+ITEM_PENDING = 'pending'
+ITEM_ELIGIBLE = 'eligible'
+ITEM_DONE = 'done'
+ITEM_BLOCKED = 'blocked'
+ITEM_FAILED = 'failed'
+
+# Identifiers a resumed job still has to process
+UNFINISHED_STATES = (ITEM_PENDING, ITEM_ELIGIBLE, ITEM_FAILED)
+
+# Job states
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def batch_operation_prefix(job, batch_no):
+    """Start of the nmrs_unvoid_operation identifier of one batch
+
+    The random job token keeps batches of jobs from different journals apart.
+    """
+    return f"job {job['token']} batch {batch_no}:"
+
+
+class BatchJournal:
+    """Per-identifier state of batch jobs, kept in a local SQLite file"""
+
+    def __init__(self, path=DEFAULT_JOURNAL_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS job (
+                job_id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                token           TEXT NOT NULL,
+                source          TEXT NOT NULL,
+                batch_size      INTEGER NOT NULL,
+                status          TEXT NOT NULL,
+                created_at      TEXT NOT NULL,
+                finished_at     TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS job_item (
+                job_id          INTEGER NOT NULL,
+                position        INTEGER NOT NULL,
+                identifier      TEXT NOT NULL,
+                state           TEXT NOT NULL,
+                batch_no        INTEGER,
+                operation_id    INTEGER,
+                updated_at      TEXT NOT NULL,
+                PRIMARY KEY (job_id, identifier)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_job_item_state ON job_item (job_id, state, position);
+        """)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def create_job(self, source, identifiers, batch_size=DEFAULT_BATCH_SIZE):
+        """Record a new job with every identifier pending; returns the job id"""
+
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO job (token, source, batch_size, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex[:12], source, batch_size, JOB_RUNNING, now())
+            )
+            job_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT OR IGNORE INTO job_item (job_id, position, identifier, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(job_id, position, identifier, ITEM_PENDING, now())
+                 for position, identifier in enumerate(identifiers)]
+            )
+        return job_id
+
+    def load_job(self, job_id=None):
+        """Return a job row; without an id, the latest unfinished job (or None)"""
+
+        if job_id is None:
+            return self.db.execute(
+                "SELECT * FROM job WHERE status = ? ORDER BY job_id DESC LIMIT 1", (JOB_RUNNING,)
+            ).fetchone()
+        return self.db.execute("SELECT * FROM job WHERE job_id = ?", (job_id,)).fetchone()
+
+    def next_batch(self, job_id, limit):
+        """The next ``limit`` unfinished identifiers, in file order"""
+
+        placeholders = ", ".join("?" * len(UNFINISHED_STATES))
+        rows = self.db.execute(f"""
+            SELECT identifier FROM job_item
+            WHERE job_id = ? AND state IN ({placeholders})
+            ORDER BY position
+            LIMIT ?
+        """, (job_id,) + UNFINISHED_STATES + (limit,)).fetchall()
+        return [row['identifier'] for row in rows]
+
+    def in_flight(self, job_id):
+        """Batches marked eligible whose outcome was never checkpointed: {batch_no: [identifiers]}"""
+
+        batches = {}
+        for row in self.db.execute(
+                "SELECT batch_no, identifier FROM job_item WHERE job_id = ? AND state = ? ORDER BY position",
+                (job_id, ITEM_ELIGIBLE)):
+            batches.setdefault(row['batch_no'], []).append(row['identifier'])
+        return batches
+
+    def last_batch_no(self, job_id):
+        row = self.db.execute(
+            "SELECT COALESCE(MAX(batch_no), 0) FROM job_item WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return row[0]
+
+    def mark(self, job_id, identifiers, state, batch_no=None, operation_id=None):
+        """Checkpoint the state of some identifiers"""
+
+        with self.db:
+            self.db.executemany("""
+                UPDATE job_item
+                SET state = ?, batch_no = COALESCE(?, batch_no),
+                    operation_id = COALESCE(?, operation_id), updated_at = ?
+                WHERE job_id = ? AND identifier = ?
+            """, [(state, batch_no, operation_id, now(), job_id, identifier) for identifier in identifiers])
+
+    def finish_job(self, job_id):
+        with self.db:
+            self.db.execute(
+                "UPDATE job SET status = ?, finished_at = ? WHERE job_id = ?",
+                (JOB_FINISHED, now(), job_id)
+            )
+
+    def summary(self, job_id):
+        """Return {state: count} for a job"""
+        return {
+            row['state']: row['count'] for row in self.db.execute(
+                "SELECT state, COUNT(*) AS count FROM job_item WHERE job_id = ? GROUP BY state", (job_id,)
+            )
+        }
+
+
+def run_job(engine, journal, job_id, log=None):
+    """Unvoid a journaled job batch by batch; returns the final state summary
+
+    Each batch goes through prepare_bulk and bulk_unvoid and is committed on
+    its own, then checkpointed in the journal. Identifiers already done or
+    blocked are never sent to the database again. A batch whose commit was
+    never checkpointed (connection lost at the wrong moment) is looked up once
+    in nmrs_unvoid_operation by its batch identifier.
+    """
+
+    log = log or engine.log
+    job = journal.load_job(job_id)
+
+    for batch_no, identifiers in journal.in_flight(job_id).items():
+        operation_id = engine.committed_operation(batch_operation_prefix(job, batch_no))
+        if operation_id:
+            log(f"JOB #{job_id}: batch {batch_no} was committed as operation #{operation_id}")
+            journal.mark(job_id, identifiers, ITEM_DONE, operation_id=operation_id)
+        else:
+            log(f"JOB #{job_id}: batch {batch_no} was not committed - retrying its identifiers")
+            journal.mark(job_id, identifiers, ITEM_PENDING)
+
+    batch_no = journal.last_batch_no(job_id)
+    while True:
+        identifiers = journal.next_batch(job_id, job['batch_size'])
+        if not identifiers:
+            break
+
+        batch_no += 1
+        log(f"JOB #{job_id}: batch {batch_no} - {len(identifiers)} identifier(s)")
+
+        eligible, blocked = engine.prepare_bulk(identifiers)
+        journal.mark(job_id, blocked, ITEM_BLOCKED, batch_no=batch_no)
+
+        blocked = set(blocked)
+        ready = [identifier for identifier in identifiers if identifier not in blocked]
+        if not eligible:
+            continue
+
+        # Checkpoint before the commit so an interrupted batch can be recognised
+        journal.mark(job_id, ready, ITEM_ELIGIBLE, batch_no=batch_no)
+        try:
+            engine.bulk_unvoid(f"{batch_operation_prefix(job, batch_no)} {job['source']}")
+        except OperationCancelled:
+            journal.mark(job_id, ready, ITEM_PENDING)
+            raise
+        except Error:
+            journal.mark(job_id, ready, ITEM_FAILED)
+            raise
+
+        journal.mark(job_id, ready, ITEM_DONE, operation_id=engine.last_operation_id)
+
+    summary = journal.summary(job_id)
+    if not any(summary.get(state) for state in UNFINISHED_STATES):
+        journal.finish_job(job_id)
+
+    log(f"JOB #{job_id}: " + ", ".join(f"{count} {state}" for state, count in sorted(summary.items())))
+    return summary
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Unvoid Statement Metrics - CCFN OpenMRS
+=======================================
+Times every SQL statement the tool issues and aggregates the timings per
+operation (lookup, preview, unvoid, bulk, ...).
+
+- InstrumentedCursor records duration and rowcount of each statement
+- Optional SHOW SESSION STATUS deltas (Innodb_row_lock_*, Handler_read_*)
+- Per-operation summary written to the Activity Log
+- JSON run report and Prometheus textfile for node_exporter
+
+Settings live in the [metrics] section of unvoid_config.ini.
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import functools
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from pymysql.cursors import Cursor, DictCursorMixin, SSCursor
+from pymysql.err import Error
+
+
+# Innodb_row_lock_* are server-wide counters; Handler_read_* are per session
+SESSION_STATUS_QUERY = """
+    SHOW SESSION STATUS
+    WHERE Variable_name IN ('Innodb_row_lock_time', 'Innodb_row_lock_waits',
+                            'Innodb_rows_read', 'Innodb_rows_updated')
+       OR Variable_name LIKE 'Handler_read%'
+"""
+
+STATEMENT_LABEL = re.compile(
+    r"^\s*(?P<verb>\w+)\s+(?:IGNORE\s+)?(?:INTO\s+)?(?P<table>\w+)?",
+    re.IGNORECASE
+)
+FROM_TABLE = re.compile(r"\bFROM\s+(\w+)", re.IGNORECASE)
+
+# Statements shown per operation in the Activity Log, slowest first
+LOG_TOP_STATEMENTS = 5
+
+
+def statement_label(sql):
+    """Short label for a statement, e.g. 'UPDATE obs' or 'SELECT patient_identifier'"""
+
+    if ";\n" in sql.strip().rstrip(";"):
+        return "BATCH"
+
+    match = STATEMENT_LABEL.match(sql)
+    if not match:
+        return "OTHER"
+
+    verb = match.group('verb').upper()
+    if verb in ('SELECT', 'DELETE', 'EXPLAIN'):
+        table = FROM_TABLE.search(sql)
+        return f"{verb} {table.group(1)}" if table else verb
+    if verb in ('UPDATE', 'INSERT', 'REPLACE') and match.group('table'):
+        return f"{verb} {match.group('table')}"
+    return verb
+
+
+class InstrumentedCursor(Cursor):
+    """pymysql cursor reporting each statement to ``connection.metrics``"""
+
+    def execute(self, query, args=None):
+        metrics = getattr(self.connection, 'metrics', None)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            if metrics is not None:
+                metrics.record(query, self.rowcount, (time.perf_counter() - started) * 1000)
+
+
+class InstrumentedDictCursor(DictCursorMixin, InstrumentedCursor):
+    """Dictionary rows, instrumented"""
+
+
+class InstrumentedSSCursor(InstrumentedCursor, SSCursor):
+    """Unbuffered (server-side) rows, instrumented; the time recorded is to the first row"""
+
+
+class StatementMetrics:
+    """Statement timings aggregated per operation"""
+
+    def __init__(self, config, log=None):
+        self.log = log or (lambda message: None)
+        self.enabled = config.getboolean('metrics', 'enabled', fallback=True)
+        self.session_status = config.getboolean('metrics', 'session_status', fallback=False)
+        self.report_file = config.get('metrics', 'report_file', fallback='').strip()
+        self.prometheus_file = config.get('metrics', 'prometheus_file', fallback='').strip()
+
+        self.operations = []
+        self.current = None
+        self._depth = 0
+        self._status_before = None
+
+    def begin(self, name, conn=None):
+        """Start collecting for an operation; nested calls join the outer one"""
+
+        self._depth += 1
+        if self._depth > 1 or not self.enabled:
+            return
+
+        self.current = {
+            'operation': name,
+            'started_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'status': None,
+            'duration_ms': 0,
+            'statements': {},
+            'retries': {},
+            'session_status': {},
+        }
+        self._started = time.perf_counter()
+        self._status_before = self.read_session_status(conn) if self.session_status and conn else None
+
+    def record(self, sql, rows, elapsed_ms):
+        """Add one executed statement to the running operation"""
+
+        current = self.current
+        if current is None:
+            return
+
+        entry = current['statements'].setdefault(
+            statement_label(sql), {'count': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        )
+        entry['count'] += 1
+        entry['rows'] += max(rows or 0, 0)
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+
+    def retry(self, reason):
+        """Count a transaction re-run after a transient error (deadlock, lock wait timeout)"""
+        if self.current is not None:
+            self.current['retries'][reason] = self.current['retries'].get(reason, 0) + 1
+
+    def end(self, status, conn=None):
+        """Finish the outermost operation: log, store and export it"""
+
+        self._depth = max(self._depth - 1, 0)
+        if self._depth or self.current is None:
+            return
+
+        current, self.current = self.current, None
+        current['status'] = status
+        current['duration_ms'] = round((time.perf_counter() - self._started) * 1000, 1)
+
+        if self._status_before and conn is not None and conn.open:
+            after = self.read_session_status(conn)
+            current['session_status'] = {
+                name: after[name] - self._status_before.get(name, 0)
+                for name in after
+                if after[name] != self._status_before.get(name, 0)
+            }
+
+        for entry in current['statements'].values():
+            entry['total_ms'] = round(entry['total_ms'], 1)
+            entry['max_ms'] = round(entry['max_ms'], 1)
+
+        self.operations.append(current)
+        self.log_operation(current)
+        self.export()
+
+    def read_session_status(self, conn):
+        """Numeric SHOW SESSION STATUS values (uninstrumented cursor)"""
+        try:
+            with conn.cursor(Cursor) as cursor:
+                cursor.execute(SESSION_STATUS_QUERY)
+                return {name: int(value) for name, value in cursor.fetchall() if value.isdigit()}
+        except Error as e:
+            self.log(f"WARNING: Cannot read session status - {str(e)}")
+            return {}
+
+    def log_operation(self, operation):
+        statements = operation['statements']
+        sql_ms = sum(entry['total_ms'] for entry in statements.values())
+        self.log(
+            f"METRICS: {operation['operation']} {operation['status']} in {operation['duration_ms']:.0f} ms - "
+            f"{sum(entry['count'] for entry in statements.values())} statement(s), {sql_ms:.0f} ms in SQL"
+        )
+
+        slowest = sorted(statements.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for label, entry in slowest[:LOG_TOP_STATEMENTS]:
+            self.log(f"         {label:<36} {entry['count']:>4} x {entry['total_ms']:>9.0f} ms "
+                     f"{entry['rows']:>9} rows")
+
+        for reason, count in operation['retries'].items():
+            self.log(f"         retried after {reason:<22} {count:>4} x")
+
+        for name, delta in operation['session_status'].items():
+            self.log(f"         {name:<36} {delta:>+10}")
+
+    def export(self):
+        """Rewrite the JSON report and Prometheus textfile, if configured"""
+
+        try:
+            if self.report_file:
+                self._write_atomic(self.report_file, json.dumps({
+                    'written_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    'operations': self.operations,
+                }, indent=2))
+
+            if self.prometheus_file:
+                self._write_atomic(self.prometheus_file, self.prometheus_text())
+
+        except OSError as e:
+            self.log(f"WARNING: Cannot write metrics files - {str(e)}")
+
+    def prometheus_text(self):
+        """Counters since the tool started, in the Prometheus text format"""
+
+        operations = {}
+        statements = {}
+        retries = {}
+        last_duration = {}
+        for operation in self.operations:
+            name = operation['operation']
+            key = (name, operation['status'])
+            operations[key] = operations.get(key, 0) + 1
+            last_duration[name] = operation['duration_ms'] / 1000
+            for reason, count in operation['retries'].items():
+                retries[(name, reason)] = retries.get((name, reason), 0) + count
+            for label, entry in operation['statements'].items():
+                total = statements.setdefault((name, label), [0, 0, 0.0])
+                total[0] += entry['count']
+                total[1] += entry['rows']
+                total[2] += entry['total_ms'] / 1000
+
+        lines = [
+            "# HELP unvoid_operations_total Operations run by the Patient Unvoid Tool",
+            "# TYPE unvoid_operations_total counter",
+        ]
+        lines += [f'unvoid_operations_total{{operation="{name}",status="{status}"}} {count}'
+                  for (name, status), count in sorted(operations.items())]
+
+        lines += [
+            "# HELP unvoid_operation_last_duration_seconds Wall time of the latest operation",
+            "# TYPE unvoid_operation_last_duration_seconds gauge",
+        ]
+        lines += [f'unvoid_operation_last_duration_seconds{{operation="{name}"}} {seconds:.3f}'
+                  for name, seconds in sorted(last_duration.items())]
+
+        lines += [
+            "# HELP unvoid_transaction_retries_total Transactions re-run after a deadlock or lock wait timeout",
+            "# TYPE unvoid_transaction_retries_total counter",
+        ]
+        lines += [f'unvoid_transaction_retries_total{{operation="{name}",reason="{reason}"}} {count}'
+                  for (name, reason), count in sorted(retries.items())]
+
+        for metric, index, help_text in (
+                ('unvoid_statements_total', 0, 'SQL statements executed'),
+                ('unvoid_statement_rows_total', 1, 'Rows returned or affected'),
+                ('unvoid_statement_seconds_total', 2, 'Time spent in SQL statements')):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (name, label), total in sorted(statements.items()):
+                value = f"{total[index]:.3f}" if index == 2 else total[index]
+                lines.append(f'{metric}{{operation="{name}",statement="{label}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def _write_atomic(self, path, text):
+        # node_exporter must never read a half-written file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+def instrumented(name):
+    """Decorate an UnvoidEngine method so its statements are aggregated as one operation"""
+
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            conn = None
+            if self.metrics.session_status:
+                try:
+                    conn = self.get_connection()
+                except Error:
+                    pass  # the method itself reports the connection error
+
+            self.metrics.begin(name, conn)
+            status = 'failed'
+            try:
+                result = method(self, *args, **kwargs)
+                status = 'success'
+                return result
+            except Exception:
+                if self.cancel_event.is_set():
+                    status = 'cancelled'
+                raise
+            finally:
+                self.metrics.end(status, self.connection)
+        return wrapper
+
+    return decorate
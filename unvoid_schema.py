@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Unvoid Schema Migrations - CCFN OpenMRS
+=======================================
+Versioned bootstrap of the tool's own tables (audit trail, chunked-operation
+journal). Applied once, at startup or with ``unvoid_cli.py init``, so the
+unvoid hot path issues no DDL.
+
+- The installed version is kept in nmrs_unvoid_schema
+- Migrations run in order, each recorded when its statements succeed
+- A named lock (GET_LOCK) serialises concurrent bootstraps
+- To change the schema, append a migration; never edit an applied one
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+from pymysql.err import Error
+
+
+SCHEMA_TABLE = 'nmrs_unvoid_schema'
+SCHEMA_LOCK = 'nmrs_unvoid_schema_migration'
+SCHEMA_LOCK_TIMEOUT = 30
+
+# Errors meaning a statement's change is already in place (tables created
+# by older releases with CREATE TABLE IF NOT EXISTS, re-run ALTERs)
+ER_TABLE_EXISTS = 1050
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+ALREADY_APPLIED = (ER_TABLE_EXISTS, ER_DUP_FIELDNAME, ER_DUP_KEYNAME)
+
+
+MIGRATIONS = (
+    (1, "Audit table", (
+        """
+        CREATE TABLE IF NOT EXISTS nmrs_unvoid_audit (
+            audit_id        INT AUTO_INCREMENT PRIMARY KEY,
+            action_time     DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            identifier      VARCHAR(50) NOT NULL,
+            patient_id      INT NOT NULL,
+            patient_name    VARCHAR(255),
+            executed_by     VARCHAR(100),
+            action_status   VARCHAR(20) NOT NULL,
+            remarks         TEXT,
+
+            INDEX idx_audit_patient_id (patient_id),
+            INDEX idx_audit_identifier (identifier),
+            INDEX idx_audit_action_time (action_time)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """,
+    )),
+    (2, "Chunked operation journal", (
+        """
+        CREATE TABLE IF NOT EXISTS nmrs_unvoid_operation (
+            operation_id    INT AUTO_INCREMENT PRIMARY KEY,
+            identifier      VARCHAR(50) NOT NULL,
+            patient_id      INT NOT NULL,
+            patient_name    VARCHAR(255),
+            window_start    DATETIME NOT NULL,
+            window_end      DATETIME NOT NULL,
+            chunk_size      INT NOT NULL,
+            status          VARCHAR(20) NOT NULL,
+            executed_by     VARCHAR(100),
+            started_at      DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at     DATETIME NULL,
+
+            INDEX idx_operation_patient_id (patient_id),
+            INDEX idx_operation_status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS nmrs_unvoid_journal (
+            journal_id      INT AUTO_INCREMENT PRIMARY KEY,
+            operation_id    INT NOT NULL,
+            table_name      VARCHAR(64) NOT NULL,
+            chunk_no        INT NOT NULL,
+            pk_low          INT NULL,
+            pk_high         INT NULL,
+            rows_affected   INT NOT NULL,
+            committed_at    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            UNIQUE INDEX idx_journal_chunk (operation_id, table_name, chunk_no)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS nmrs_unvoid_undo (
+            operation_id    INT NOT NULL,
+            table_name      VARCHAR(64) NOT NULL,
+            row_id          INT NOT NULL,
+            voided_by       INT NULL,
+            date_voided     DATETIME NULL,
+            void_reason     VARCHAR(255) NULL,
+
+            PRIMARY KEY (operation_id, table_name, row_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """,
+    )),
+    (3, "Audit detail table", (
+        # One row per audit entry and plan table, for reporting without
+        # parsing remarks
+        """
+        CREATE TABLE IF NOT EXISTS nmrs_unvoid_audit_detail (
+            detail_id       INT AUTO_INCREMENT PRIMARY KEY,
+            audit_id        INT NOT NULL,
+            table_name      VARCHAR(64) NOT NULL,
+            rows_affected   INT NOT NULL,
+            window_start    DATETIME NULL,
+            window_end      DATETIME NULL,
+            duration_ms     INT NULL,
+
+            INDEX idx_audit_detail_audit (audit_id, table_name),
+            INDEX idx_audit_detail_table_window (table_name, window_start)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """,
+    )),
+    (4, "Audit reporting index on status and time", (
+        "ALTER TABLE nmrs_unvoid_audit ADD INDEX idx_audit_status_time (action_status, action_time)",
+    )),
+    (5, "Undo capture for single and bulk unvoids", (
+        # Bulk operations cover many patients and have no chunk size
+        """
+        ALTER TABLE nmrs_unvoid_operation
+            MODIFY patient_id INT NULL,
+            MODIFY window_start DATETIME NULL,
+            MODIFY window_end DATETIME NULL,
+            MODIFY chunk_size INT NULL
+        """,
+        "ALTER TABLE nmrs_unvoid_operation ADD COLUMN operation_type VARCHAR(20) NOT NULL DEFAULT 'CHUNKED' AFTER operation_id",
+        "ALTER TABLE nmrs_unvoid_undo ADD COLUMN patient_id INT NULL AFTER row_id",
+    )),
+    (6, "Transaction attempts in the audit trail", (
+        "ALTER TABLE nmrs_unvoid_audit ADD COLUMN attempts SMALLINT NOT NULL DEFAULT 1 AFTER action_status",
+    )),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def installed_version(cursor):
+    """Return the applied schema version (0 if never bootstrapped)"""
+
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (SCHEMA_TABLE,))
+    if not cursor.fetchone()[0]:
+        return 0
+
+    cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_TABLE}")
+    return int(cursor.fetchone()[0])
+
+
+def migrate(conn, log=None):
+    """Apply every pending migration; returns the list of versions applied"""
+
+    log = log or (lambda message: None)
+    cursor = conn.cursor()
+    applied = []
+
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, SCHEMA_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise Error(f"Timed out waiting for lock {SCHEMA_LOCK}; is another bootstrap running?")
+
+        try:
+            # Re-read under the lock; another session may have just migrated
+            version = installed_version(cursor)
+
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+                    version         INT NOT NULL PRIMARY KEY,
+                    description     VARCHAR(255) NOT NULL,
+                    applied_at      DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+            """)
+
+            for number, description, statements in MIGRATIONS:
+                if number <= version:
+                    continue
+
+                log(f"Applying schema migration {number}: {description}...")
+                for statement in statements:
+                    try:
+                        cursor.execute(statement)
+                    except Error as e:
+                        if e.args[0] not in ALREADY_APPLIED:
+                            raise
+                        log(f"  [SKIP] already applied - {e.args[1]}")
+
+                cursor.execute(
+                    f"INSERT INTO {SCHEMA_TABLE} (version, description) VALUES (%s, %s)",
+                    (number, description)
+                )
+                conn.commit()
+                applied.append(number)
+
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+            cursor.fetchall()
+
+    except Error:
+        conn.rollback()
+        raise
+
+    finally:
+        cursor.close()
+
+    return applied
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Unvoid Multi-Site Runs - CCFN OpenMRS
+=====================================
+Runs lookup, preview or unvoid for one identifier list against several
+facility databases at once.
+
+- Sites are the [database:<site>] sections of unvoid_config.ini
+- Bounded worker pool, one engine and one connection per site
+- Every log line is prefixed with its site; a failing site never stops
+  the others
+- Consolidated per-site summary at the end
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from unvoid_discovery import PlanDiscovery
+from unvoid_engine import STATUS_ELIGIBLE, UnvoidEngine
+
+
+SITE_ACTIONS = ('lookup', 'preview', 'unvoid')
+DEFAULT_SITE_WORKERS = 4
+
+SITE_OK = 'ok'
+SITE_FAILED = 'failed'
+
+
+def site_path(path, site):
+    """unvoid.prom -> unvoid_<site>.prom (empty stays empty)"""
+    if not path:
+        return path
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}_{site}{path.suffix}"))
+
+
+def run_site(config, site, section, action, identifiers, source_name, log):
+    """Run one action against one site; never raises, returns the site's result dict"""
+
+    def site_log(message):
+        log(f"[{site}] {message}")
+
+    engine = UnvoidEngine(config, log=site_log, section=section)
+    engine.pool.size = 1
+
+    # Sites must not overwrite each other's files
+    engine.backup.directory = str(Path(engine.backup.directory) / site)
+    if engine.verifier.report_directory:
+        engine.verifier.report_directory = str(Path(engine.verifier.report_directory) / site)
+    engine.metrics.report_file = site_path(engine.metrics.report_file, site)
+    engine.metrics.prometheus_file = site_path(engine.metrics.prometheus_file, site)
+
+    result = {
+        'site': site,
+        'status': SITE_FAILED,
+        'identifiers': len(identifiers),
+        'eligible': 0,
+        'rows': 0,
+        'seconds': 0.0,
+        'error': '',
+    }
+    started = time.perf_counter()
+
+    try:
+        if config['settings'].getboolean('discover_plan', fallback=False):
+            PlanDiscovery(engine).apply()
+
+        if action == 'unvoid':
+            result['eligible'], blocked = engine.prepare_bulk(identifiers)
+            if result['eligible']:
+                result['rows'], audited = engine.bulk_unvoid(source_name)
+
+        else:
+            patients = [row for row in engine.classify_identifiers(identifiers)
+                        if row['status'] == STATUS_ELIGIBLE]
+            result['eligible'] = len(patients)
+            if action == 'preview':
+                for patient in patients:
+                    result['rows'] += sum(engine.preview_counts(patient).values())
+
+        result['status'] = SITE_OK
+
+    except Exception as e:
+        result['error'] = str(e)
+        site_log(f"ERROR: Site run failed - {str(e)}")
+
+    finally:
+        engine.close()
+        result['seconds'] = round(time.perf_counter() - started, 1)
+
+    return result
+
+
+def run_sites(config, sites, action, identifiers, source_name, workers=DEFAULT_SITE_WORKERS, log=None):
+    """Run an action on every site in parallel; returns the results in site order
+
+    ``sites`` maps site names to their config sections (see site_sections).
+    """
+
+    log = log or (lambda message: None)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sites)))) as executor:
+        futures = {
+            executor.submit(run_site, config, site, section, action, identifiers, source_name, log): site
+            for site, section in sites.items()
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['site']] = result
+            log(f"SITES: {len(results)}/{len(sites)} finished - {result['site']} {result['status']} "
+                f"in {result['seconds']:.1f}s")
+
+    ordered = [results[site] for site in sites]
+    log_summary(action, ordered, log)
+    return ordered
+
+
+def log_summary(action, results, log):
+    rows_label = 'rows unvoided' if action == 'unvoid' else 'rows to unvoid'
+
+    log("-" * 70)
+    log(f"MULTI-SITE {action.upper()} SUMMARY")
+    log("-" * 70)
+    log(f"  {'site':<20} {'status':<8} {'eligible':>9} {rows_label:>15} {'seconds':>9}")
+    for result in results:
+        log(f"  {result['site']:<20} {result['status']:<8} {result['eligible']:>9} "
+            f"{result['rows'] if action != 'lookup' else '-':>15} {result['seconds']:>9.1f}")
+        if result['error']:
+            log(f"      {result['error']}")
+    log("-" * 70)
+
+    failed = [result['site'] for result in results if result['status'] != SITE_OK]
+    log(f"{len(results) - len(failed)} site(s) succeeded, {len(failed)} failed"
+        + (f": {', '.join(failed)}" if failed else ""))
+    log("-" * 70)
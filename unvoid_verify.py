@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Unvoid Verification - CCFN OpenMRS
+==================================
+Post-unvoid consistency check of every patient an operation touched.
+
+- One aggregated query per check, whatever the number of patients
+- Finds orphan states left behind by a partial restore: active patient with
+  a voided person, no active name or identifier, active encounters in voided
+  visits, active obs under voided encounters
+- Machine-readable JSON report (counts plus sample patient ids per check)
+
+Settings live in the [verify] section of unvoid_config.ini.
+
+Author: Adeyemi
+Date: February 2026
+Python: 3.6+
+"""
+
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+from unvoid_metrics import InstrumentedDictCursor
+
+
+# Patient ids listed per failed check in the report
+SAMPLE_SIZE = 10
+
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# (name, description, query). Each query counts affected patients and rows
+# among tmp_unvoid_verify; a check passes when it finds no rows.
+VERIFY_CHECKS = (
+    ('patient_still_voided', "Patient row still voided", """
+        SELECT COUNT(*) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(v.patient_id ORDER BY v.patient_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN patient pat ON pat.patient_id = v.patient_id AND pat.voided = 1
+    """),
+    ('person_voided', "Active patient whose person row is voided", """
+        SELECT COUNT(*) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(v.patient_id ORDER BY v.patient_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN patient pat ON pat.patient_id = v.patient_id AND pat.voided = 0
+        JOIN person p ON p.person_id = v.patient_id AND p.voided = 1
+    """),
+    ('no_active_name', "Active patient without an active person_name", """
+        SELECT COUNT(*) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(v.patient_id ORDER BY v.patient_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN patient pat ON pat.patient_id = v.patient_id AND pat.voided = 0
+        WHERE NOT EXISTS (SELECT 1 FROM person_name pn
+                          WHERE pn.person_id = v.patient_id AND pn.voided = 0)
+    """),
+    ('no_active_identifier', "Active patient without an active patient_identifier", """
+        SELECT COUNT(*) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(v.patient_id ORDER BY v.patient_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN patient pat ON pat.patient_id = v.patient_id AND pat.voided = 0
+        WHERE NOT EXISTS (SELECT 1 FROM patient_identifier pi
+                          WHERE pi.patient_id = v.patient_id AND pi.voided = 0)
+    """),
+    ('encounter_in_voided_visit', "Active encounter in a voided visit", """
+        SELECT COUNT(DISTINCT e.patient_id) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(DISTINCT e.patient_id ORDER BY e.patient_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN encounter e ON e.patient_id = v.patient_id AND e.voided = 0
+        JOIN visit vi ON vi.visit_id = e.visit_id AND vi.voided = 1
+    """),
+    ('obs_in_voided_encounter', "Active obs under a voided encounter", """
+        SELECT COUNT(DISTINCT o.person_id) AS patients, COUNT(*) AS row_count,
+               GROUP_CONCAT(DISTINCT o.person_id ORDER BY o.person_id) AS sample
+        FROM tmp_unvoid_verify v
+        JOIN obs o ON o.person_id = v.patient_id AND o.voided = 0
+        JOIN encounter e ON e.encounter_id = o.encounter_id AND e.voided = 1
+    """),
+)
+
+
+class Verifier:
+    """Runs VERIFY_CHECKS over the patients of an unvoid operation"""
+
+    def __init__(self, config, log=None):
+        self.log = log or (lambda message: None)
+        self.enabled = config.getboolean('verify', 'enabled', fallback=True)
+        self.report_directory = config.get('verify', 'report_directory', fallback='').strip()
+
+    def verify_operation(self, conn, operation_id, label):
+        """Check every patient with undo rows in the operation; returns the report dict"""
+
+        cursor = conn.cursor(InstrumentedDictCursor)
+        try:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_verify")
+            cursor.execute("""
+                CREATE TEMPORARY TABLE tmp_unvoid_verify (
+                    patient_id      INT NOT NULL PRIMARY KEY
+                ) ENGINE=InnoDB
+            """)
+            cursor.execute("""
+                INSERT IGNORE INTO tmp_unvoid_verify (patient_id)
+                SELECT DISTINCT patient_id
+                FROM nmrs_unvoid_undo
+                WHERE operation_id = %s AND patient_id IS NOT NULL
+            """, (operation_id,))
+            patients = cursor.rowcount
+
+            checks = {}
+            for name, description, query in VERIFY_CHECKS:
+                cursor.execute(query)
+                row = cursor.fetchone()
+                sample = (row['sample'] or '').split(',') if row['row_count'] else []
+                checks[name] = {
+                    'description': description,
+                    'ok': not row['row_count'],
+                    'patients': int(row['patients']),
+                    'rows': int(row['row_count']),
+                    'sample_patient_ids': [int(patient_id) for patient_id in sample[:SAMPLE_SIZE] if patient_id],
+                }
+
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_unvoid_verify")
+            conn.commit()
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        finally:
+            cursor.close()
+
+        report = {
+            'operation_id': operation_id,
+            'label': label,
+            'checked_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'patients': patients,
+            'ok': all(check['ok'] for check in checks.values()),
+            'checks': checks,
+        }
+        self.log_report(report)
+        return report
+
+    def log_report(self, report):
+        failed = {name: check for name, check in report['checks'].items() if not check['ok']}
+        if not failed:
+            self.log(f"VERIFY: operation #{report['operation_id']} - {report['patients']} patient(s), "
+                     f"{len(report['checks'])} checks passed")
+            return
+
+        self.log(f"VERIFY: operation #{report['operation_id']} - {len(failed)} of "
+                 f"{len(report['checks'])} checks found inconsistencies")
+        for name, check in failed.items():
+            self.log(f"  [WARN] {check['description']}: {check['patients']} patient(s), {check['rows']} row(s) "
+                     f"- e.g. patient ID {', '.join(str(patient_id) for patient_id in check['sample_patient_ids'])}")
+
+    def write_report(self, report, path=None):
+        """Write the report as JSON to ``path`` or the configured directory; returns the path or None"""
+
+        if path is None:
+            if not self.report_directory:
+                return None
+            label = UNSAFE_NAME_CHARS.sub('_', report['label'])[:60]
+            path = Path(self.report_directory) / (
+                f"verify_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['operation_id']}_{label}.json"
+            )
+
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            self.log(f"WARNING: Cannot write verification report - {str(e)}")
+            return None
+
+        self.log(f"Verification report written to {path}")
+        return path